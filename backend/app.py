@@ -1,9 +1,32 @@
+import asyncio
 import os
+import time
+import logging
+
+# Taken before the heavy imports so startup timing includes them
+STARTED_AT = time.perf_counter()
+
 from fastapi import FastAPI
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 from routers import decision
+from logic import export_jobs, executor
+from logic.outcome_cache import warm_up
+from logic.outcome_index import get_index
+from logic.compression import CompressionMiddleware
+from logic.metrics import metrics, monitor_event_loop, StageTimingMiddleware, LOOP_LAG_INTERVAL, PROMETHEUS_MEDIA_TYPE
+
+# "development" runs a single auto-reloading process, "production" runs
+# WEB_CONCURRENCY workers without reload
+SERVER_MODE = os.environ.get("SERVER_MODE", "development")
+PRODUCTION = SERVER_MODE == "production"
+
+# Build the decision engine at startup rather than on the first request
+WARM_UP = os.environ.get("WARM_UP", "1" if PRODUCTION else "0") == "1"
+
+logger = logging.getLogger("uvicorn.error")
 
 app = FastAPI(title="Sourcing Decision Tool API")
 
@@ -16,13 +39,63 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON and text responses with Brotli (if installed) or gzip, as the client accepts
+app.add_middleware(CompressionMiddleware)
+
+# Time every request under the name of its endpoint, for /metrics
+app.add_middleware(StageTimingMiddleware)
+
 # Include routers
 app.include_router(decision.router, prefix="/api/decision", tags=["decision"])
 
+@app.on_event("startup")
+def startup():
+    # Each worker warms up before it accepts connections; until then
+    # requests wait in the listen backlog instead of paying the cold start
+    if WARM_UP:
+        warm_started = time.perf_counter()
+        warm_up()
+        logger.info("Decision engine warmed up in %.2fs", time.perf_counter() - warm_started)
+    # Map the outcome space index, building it first if the file is missing or stale
+    get_index()
+    logger.info("Worker %d ready %.2fs after start", os.getpid(), time.perf_counter() - STARTED_AT)
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    # Sample event loop lag for /metrics
+    if LOOP_LAG_INTERVAL > 0:
+        app.state.loop_monitor = asyncio.ensure_future(monitor_event_loop())
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    # Let running requests and export jobs finish before the workers exit
+    executor.shutdown()
+    export_jobs.shutdown()
+    if getattr(app.state, "loop_monitor", None) is not None:
+        app.state.loop_monitor.cancel()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Sourcing Decision Tool API"}
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Rule hit counts, stage timings, cache and worker pool state of this
+    worker process, in the Prometheus text format
+    """
+    return Response(content=metrics.render(), media_type=PROMETHEUS_MEDIA_TYPE)
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))
-    uvicorn.run("app:app", host="0.0.0.0", port=port, reload=True)
\ No newline at end of file
+    if PRODUCTION:
+        uvicorn.run(
+            "app:app",
+            host="0.0.0.0",
+            port=port,
+            workers=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+            # Seconds in-flight requests get to finish after SIGTERM
+            timeout_graceful_shutdown=int(os.environ.get("GRACEFUL_SHUTDOWN_TIMEOUT", 30)),
+        )
+    else:
+        uvicorn.run("app:app", host="0.0.0.0", port=port, reload=True)
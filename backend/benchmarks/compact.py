@@ -0,0 +1,73 @@
+"""
+Compare the memory and lookup time per in-flight activity of validated
+request models and of the compact batch scoring works on.
+
+Memory is what tracemalloc sees allocated to hold a batch. Lookup time is
+one outcome cache lookup per activity, keyed on the factor tuple of a model
+or on the packed key of the batch.
+
+Run from the backend directory:
+    python -m benchmarks.compact [--items N ...]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from operator import attrgetter
+
+from benchmarks.portfolio import synthetic_portfolio
+from logic.activity import from_models
+from logic.outcome_cache import OutcomeCache
+from logic.outcome_table import FACTORS
+from routers.decision import DecisionInput
+
+_factor_values = attrgetter(*FACTORS)
+
+
+def _allocated(build):
+    tracemalloc.start()
+    started = tracemalloc.get_traced_memory()[0]
+    result = build()
+    allocated = tracemalloc.get_traced_memory()[0] - started
+    tracemalloc.stop()
+    return result, allocated
+
+
+def _timed(operation, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operation()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def measure(items: int):
+    portfolio = synthetic_portfolio(items)
+    models, model_bytes = _allocated(lambda: [DecisionInput(**activity) for activity in portfolio])
+    batch, batch_bytes = _allocated(lambda: from_models(models))
+
+    cache = OutcomeCache(maxsize=2 * items)
+    model_keys = [_factor_values(model) for model in models]
+    cache.get_many(model_keys)
+    cache.get_many(batch.keys)
+
+    return {
+        "items": items,
+        "model_bytes_per_item": round(model_bytes / items, 1),
+        "compact_bytes_per_item": round(batch_bytes / items, 1),
+        "model_key_lookup_us_per_item": round(_timed(lambda: cache.get_many([_factor_values(model) for model in models])) / items * 1e6, 3),
+        "compact_lookup_us_per_item": round(_timed(lambda: cache.get_many(batch.keys)) / items * 1e6, 3),
+        "compact_conversion_us_per_item": round(_timed(lambda: from_models(models)) / items * 1e6, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[1000, 100000])
+    args = parser.parse_args()
+    print(json.dumps([measure(items) for items in args.items], indent=2))
+
+
+if __name__ == "__main__":
+    main()
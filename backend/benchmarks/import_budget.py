@@ -0,0 +1,87 @@
+"""
+Check that starting the app and serving /determine stay clear of heavy imports.
+
+Imports the app and scores one activity in a fresh interpreter under
+`python -X importtime`, then fails if any module in HEAVY_MODULES was loaded
+or if the total import time exceeds the budget.
+
+Run from the backend directory:
+    python -m benchmarks.import_budget [--budget SECONDS] [--top N]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.startup import SAMPLE_REQUEST
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packages only the Excel endpoints need
+HEAVY_MODULES = ("openpyxl", "pandas", "lxml", "et_xmlfile")
+
+DETERMINE_PATH = f"""
+from datetime import datetime
+import app
+from routers.decision import DecisionRequest, _determine, _score_request
+_determine(_score_request(DecisionRequest(**{SAMPLE_REQUEST!r}).inputs, "determine_outcomes"), datetime.now().isoformat(), "rows")
+"""
+
+
+def _parse_importtime(stderr: str) -> list:
+    """
+    Return (module, self seconds, cumulative seconds) for each line of -X importtime output
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return imports
+
+
+def measure() -> dict:
+    # The sample decision is not recorded in the history
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", DETERMINE_PATH],
+                            cwd=BACKEND_DIR, env={**os.environ, "RECORD_HISTORY": "0"},
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+
+    imports = _parse_importtime(result.stderr)
+    heavy = sorted({name for name, _, _ in imports if name.split(".", 1)[0] in HEAVY_MODULES})
+    return {
+        "modules": len(imports),
+        "total_import_s": round(sum(self_s for _, self_s, _ in imports), 4),
+        "heavy_modules": heavy,
+        "slowest": [
+            {"module": name, "cumulative_s": round(cumulative, 4)}
+            for name, _, cumulative in sorted(imports, key=lambda i: i[2], reverse=True)
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, help="fail if imports take longer than this many seconds")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to report (default 10)")
+    args = parser.parse_args()
+
+    report = measure()
+    report["slowest"] = report["slowest"][:args.top]
+    print(json.dumps(report, indent=2))
+
+    failures = []
+    if report["heavy_modules"]:
+        failures.append(f"/determine imports {', '.join(report['heavy_modules'])}")
+    if args.budget is not None and report["total_import_s"] > args.budget:
+        failures.append(f"imports took {report['total_import_s']}s, budget is {args.budget}s")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
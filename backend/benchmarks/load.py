@@ -0,0 +1,475 @@
+"""
+Load-test one backend server with a fleet of concurrent async clients.
+
+Starts app.py in production mode on a free local port, with its history,
+portfolio and export stores in a temporary directory, and runs a step per
+number of --users. In each step every user loops for --duration seconds:
+it picks an operation from --mix, sends it, and waits an exponentially
+distributed think time. Operations:
+    determine  POST /determine with the user's portfolio of --portfolio-size activities
+    export     POST /export-excel with the same portfolio
+    update     POST /update-excel with UPDATE_ROWS activities, uploading a
+               workbook with --history-size decisions in its history
+
+Each user owns its own portfolio, and every request renames one activity,
+so the request cache does not reuse its scoring (pass --cacheable to allow that).
+
+Every --interval seconds the harness samples completed requests, latency,
+the server's event loop lag (from /metrics) and the RSS of the server and
+its worker processes, and reports them per step as a timeline. The capacity
+is the most users of a step, and of every step before it, whose /determine
+p99 latency stays within --slo seconds without errors. Everything runs on
+127.0.0.1, so it needs no network. Linux only, for the RSS.
+
+Run from the backend directory:
+    python -m benchmarks.load [--users 1 5 10 20 40] [--mix determine=8,export=1,update=1]
+                              [--duration 20] [--portfolio-size 1000] [--history-size 10000]
+                              [--output load.json] [--baseline earlier.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.portfolio import synthetic_portfolio
+from benchmarks.startup import BACKEND_DIR, _free_port
+from benchmarks.suite import UPDATE_ROWS, percentile
+
+OPERATIONS = ("determine", "export", "update")
+
+DEFAULT_USERS = (1, 5, 10, 20, 40)
+
+DEFAULT_MIX = "determine=8,export=1,update=1"
+
+_LAG_LINE = re.compile(
+    r'^decision_stage_seconds_(bucket|sum|count)\{handler="event_loop",stage="lag"(?:,le="([^"]+)")?\} (\S+)$'
+)
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """
+    Parse a traffic mix such as "determine=8,export=1,update=1" into weights
+    """
+    weights = {}
+    for item in mix.split(","):
+        operation, _, weight = item.partition("=")
+        operation = operation.strip()
+        if operation not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {operation!r}, expected one of {', '.join(OPERATIONS)}")
+        try:
+            weights[operation] = float(weight or 1)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid weight of {operation}: {weight!r}")
+    if not any(weight > 0 for weight in weights.values()):
+        raise argparse.ArgumentTypeError("The mix needs an operation with a positive weight")
+    return weights
+
+
+def _process_tree_rss_mb(root: int) -> Optional[float]:
+    """
+    Total resident memory of a process and all its descendants, e.g. the
+    uvicorn workers, the worker pool and the export job processes
+    """
+    children: Dict[int, List[int]] = {}
+    try:
+        pids = [int(name) for name in os.listdir("/proc") if name.isdigit()]
+    except OSError:
+        return None
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                # The command name is in parentheses and may hold spaces
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(pid)
+
+    total_pages = 0
+    pending = [root]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, ()))
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total_pages += int(f.read().split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    return round(total_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+
+class LagHistogram:
+    """
+    Cumulative event loop lag histogram scraped from /metrics
+    """
+
+    def __init__(self, buckets: Optional[List[Tuple[float, float]]] = None, total: float = 0.0, count: float = 0.0):
+        # (upper bound, cumulative count) in ascending order
+        self.buckets = buckets or []
+        self.total = total
+        self.count = count
+
+    @classmethod
+    def parse(cls, text: str) -> "LagHistogram":
+        histogram = cls()
+        for line in text.splitlines():
+            match = _LAG_LINE.match(line)
+            if match is None:
+                continue
+            kind, bound, value = match.groups()
+            if kind == "bucket":
+                histogram.buckets.append((float(bound), float(value)))
+            elif kind == "sum":
+                histogram.total = float(value)
+            else:
+                histogram.count = float(value)
+        return histogram
+
+    def since(self, earlier: "LagHistogram") -> "LagHistogram":
+        """
+        Return the samples recorded after an earlier scrape
+        """
+        before = dict(earlier.buckets)
+        return LagHistogram(
+            [(bound, count - before.get(bound, 0.0)) for bound, count in self.buckets],
+            self.total - earlier.total,
+            self.count - earlier.count,
+        )
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """
+        Mean lag, and the bucket bounds the p99 and the largest lag fall in
+        """
+        if self.count <= 0:
+            return {"samples": 0, "mean_s": None, "p99_s": None, "max_s": None}
+        p99 = next((bound for bound, count in self.buckets if count >= 0.99 * self.count), None)
+        largest = next((bound for bound, count in self.buckets if count >= self.count), None)
+        return {
+            "samples": int(self.count),
+            "mean_s": round(self.total / self.count, 6),
+            "p99_s": p99,
+            "max_s": largest,
+        }
+
+
+class _Portfolio:
+    """
+    Pre-serialized /determine and /export-excel body of one user's portfolio.
+    Only the first activity is serialized per request, so building bodies
+    does not slow the clients down.
+    """
+
+    def __init__(self, activities: List[Dict[str, str]], cacheable: bool):
+        self.first = activities[0]
+        self.rest = b"".join(b"," + json.dumps(activity).encode() for activity in activities[1:])
+        self.cacheable = cacheable
+        self.revision = 0
+
+    def body(self) -> bytes:
+        first = self.first
+        if not self.cacheable:
+            self.revision += 1
+            first = dict(first, activity_name=f"{first['activity_name']} rev {self.revision}")
+        return b'{"inputs":[' + json.dumps(first).encode() + self.rest + b"]}"
+
+
+class LoadTest:
+    """
+    One load test against a running server
+    """
+
+    def __init__(self, base_url: str, server_pid: int, args: argparse.Namespace):
+        self.base_url = base_url
+        self.server_pid = server_pid
+        self.args = args
+        self.weights = parse_mix(args.mix)
+        # (operation, start offset, latency, status or error name) of each request of the current step
+        self.records: List[Tuple[str, float, float, str]] = []
+        self.step_started = 0.0
+        self.active_users = 0
+        self.workbook = b""
+        self.client_lag_max = 0.0
+
+    async def prepare(self, client: httpx.AsyncClient):
+        """
+        Build the history workbook uploaded by update requests through the server itself
+        """
+        if self.weights.get("update", 0) <= 0:
+            return
+        body = {"inputs": synthetic_portfolio(self.args.history_size, seed=1)}
+        response = await client.post("/api/decision/export-excel", json=body)
+        response.raise_for_status()
+        self.workbook = response.content
+
+    async def _send(self, client: httpx.AsyncClient, operation: str, portfolio: _Portfolio, update_form: Dict[str, str]):
+        headers = {"Content-Type": "application/json"}
+        if operation == "determine":
+            return await client.post("/api/decision/determine", content=portfolio.body(), headers=headers)
+        if operation == "export":
+            return await client.post("/api/decision/export-excel", content=portfolio.body(), headers=headers)
+        return await client.post(
+            "/api/decision/update-excel", data=update_form, files={"existing_file": ("history.xlsx", self.workbook)}
+        )
+
+    async def _user(self, client: httpx.AsyncClient, user: int, deadline: float):
+        rng = random.Random(user)
+        portfolio = _Portfolio(synthetic_portfolio(self.args.portfolio_size, seed=user), self.args.cacheable)
+        update_form = {"request": json.dumps({"inputs": synthetic_portfolio(UPDATE_ROWS, seed=user)})}
+        operations, weights = zip(*self.weights.items())
+        self.active_users += 1
+        try:
+            # Spread the first requests over one think time, so users do not arrive in lockstep
+            await asyncio.sleep(rng.uniform(0, self.args.think))
+            while time.perf_counter() < deadline:
+                operation = rng.choices(operations, weights)[0]
+                sent = time.perf_counter()
+                try:
+                    response = await self._send(client, operation, portfolio, update_form)
+                    await response.aread()
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                finished = time.perf_counter()
+                self.records.append((operation, sent - self.step_started, finished - sent, status))
+                if self.args.think > 0:
+                    await asyncio.sleep(min(rng.expovariate(1 / self.args.think), max(0.0, deadline - finished)))
+        finally:
+            self.active_users -= 1
+
+    async def _scrape_lag(self, client: httpx.AsyncClient) -> LagHistogram:
+        try:
+            response = await client.get("/metrics")
+            return LagHistogram.parse(response.text)
+        except httpx.HTTPError:
+            return LagHistogram()
+
+    async def _sample(self, client: httpx.AsyncClient, timeline: List[Dict], stop: asyncio.Event):
+        """
+        Append a timeline sample every --interval seconds until stopped
+        """
+        previous_lag = await self._scrape_lag(client)
+        seen = 0
+        while not stop.is_set():
+            window_started = time.perf_counter()
+            try:
+                await asyncio.wait_for(stop.wait(), self.args.interval)
+            except asyncio.TimeoutError:
+                pass
+            elapsed = time.perf_counter() - window_started
+            # The harness's own loop lag: if it grows, the clients are the bottleneck
+            self.client_lag_max = max(self.client_lag_max, elapsed - self.args.interval)
+
+            records, seen = self.records[seen:], len(self.records)
+            lag = await self._scrape_lag(client)
+            window_lag, previous_lag = lag.since(previous_lag), lag
+            determine = [latency for operation, _, latency, _ in records if operation == "determine"]
+            timeline.append({
+                "t_s": round(time.perf_counter() - self.step_started, 2),
+                "active_users": self.active_users,
+                "completed": len(records),
+                "requests_per_s": round(len(records) / elapsed, 2),
+                "errors": sum(1 for record in records if record[3] != "200"),
+                "determine_p99_s": round(percentile(determine, 0.99), 4) if determine else None,
+                "loop_lag_p99_s": window_lag.summary()["p99_s"],
+                "rss_mb": _process_tree_rss_mb(self.server_pid),
+            })
+
+    async def run_step(self, client: httpx.AsyncClient, users: int) -> Dict:
+        """
+        Run --duration seconds of traffic from a number of concurrent users,
+        then wait for their last requests
+        """
+        self.records = []
+        self.client_lag_max = 0.0
+        lag_before = await self._scrape_lag(client)
+        self.step_started = time.perf_counter()
+        deadline = self.step_started + self.args.duration
+
+        timeline: List[Dict] = []
+        stop = asyncio.Event()
+        sampler = asyncio.ensure_future(self._sample(client, timeline, stop))
+        await asyncio.gather(*(self._user(client, user, deadline) for user in range(users)))
+        elapsed = time.perf_counter() - self.step_started
+        stop.set()
+        await sampler
+        lag = (await self._scrape_lag(client)).since(lag_before)
+
+        by_operation = {}
+        for operation in OPERATIONS:
+            records = [record for record in self.records if record[0] == operation]
+            if not records:
+                continue
+            latencies = [latency for _, _, latency, _ in records]
+            errors: Dict[str, int] = {}
+            for _, _, _, status in records:
+                if status != "200":
+                    errors[status] = errors.get(status, 0) + 1
+            by_operation[operation] = {
+                "requests": len(records),
+                "requests_per_s": round(len(records) / elapsed, 2),
+                "errors": errors,
+                "latency_s": {
+                    "p50": round(percentile(latencies, 0.5), 4),
+                    "p95": round(percentile(latencies, 0.95), 4),
+                    "p99": round(percentile(latencies, 0.99), 4),
+                    "max": round(max(latencies), 4),
+                },
+            }
+        rss = [sample["rss_mb"] for sample in timeline if sample["rss_mb"] is not None]
+        return {
+            "users": users,
+            "elapsed_s": round(elapsed, 2),
+            "requests_per_s": round(len(self.records) / elapsed, 2),
+            "operations": by_operation,
+            "event_loop_lag": lag.summary(),
+            "client_loop_lag_max_s": round(self.client_lag_max, 4),
+            "peak_rss_mb": max(rss) if rss else None,
+            "timeline": timeline,
+        }
+
+
+def capacity(steps: List[Dict], slo: float) -> int:
+    """
+    Most users of a step, and of every step before it, whose /determine p99
+    latency stayed within the SLO without errors
+    """
+    supported = 0
+    for step in steps:
+        determine = step["operations"].get("determine")
+        errors = sum(sum(operation["errors"].values()) for operation in step["operations"].values())
+        if determine is None or errors or determine["latency_s"]["p99"] > slo:
+            break
+        supported = step["users"]
+    return supported
+
+
+def _start_server(port: int, workers: int, directory: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        SERVER_MODE="production",
+        PORT=str(port),
+        WEB_CONCURRENCY=str(workers),
+        HISTORY_STORE_PATH=os.path.join(directory, "history.sqlite3"),
+        PORTFOLIO_STORE_PATH=os.path.join(directory, "portfolios.sqlite3"),
+        EXPORT_SPOOL_DIR=os.path.join(directory, "exports"),
+    )
+    log = open(os.path.join(directory, "server.log"), "wb")
+    try:
+        return subprocess.Popen([sys.executable, "app.py"], cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    finally:
+        log.close()
+
+
+async def _wait_until_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 120):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            (await client.get("/")).raise_for_status()
+            return
+        except httpx.HTTPError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server did not answer within {timeout}s")
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    with tempfile.TemporaryDirectory(prefix="sourcing-load-") as directory:
+        port = _free_port()
+        server = _start_server(port, args.workers, directory)
+        base_url = f"http://127.0.0.1:{port}"
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        try:
+            async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+                await _wait_until_ready(client, server)
+                test = LoadTest(base_url, server.pid, args)
+                await test.prepare(client)
+                steps = []
+                for users in args.users:
+                    print(f"{users} users for {args.duration}s", file=sys.stderr)
+                    steps.append(await test.run_step(client, users))
+        except BaseException:
+            with open(os.path.join(directory, "server.log"), "rb") as f:
+                sys.stderr.write(f.read()[-4000:].decode(errors="replace"))
+            raise
+        finally:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "workers": args.workers,
+            "mix": parse_mix(args.mix),
+            "duration_s": args.duration,
+            "think_s": args.think,
+            "portfolio_size": args.portfolio_size,
+            "history_size": args.history_size,
+            "cacheable": args.cacheable,
+            "slo_s": args.slo,
+        },
+        "capacity_users": capacity(steps, args.slo),
+        "steps": steps,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=list(DEFAULT_USERS),
+                        help="concurrent users of each step (default 1 5 10 20 40)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weights of the operations (default {DEFAULT_MIX})")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of traffic per step (default 20)")
+    parser.add_argument("--think", type=float, default=1.0,
+                        help="mean seconds a user waits between requests (default 1.0)")
+    parser.add_argument("--portfolio-size", type=int, default=1000,
+                        help="activities per determine and export request (default 1000)")
+    parser.add_argument("--history-size", type=int, default=10000,
+                        help="decisions in the workbook uploaded by update requests (default 10000)")
+    parser.add_argument("--cacheable", action="store_true",
+                        help="resend each user's portfolio unchanged, so the request cache can answer")
+    parser.add_argument("--workers", type=int, default=1, help="number of server workers (default 1)")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between timeline samples (default 1.0)")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds before a request is abandoned (default 300)")
+    parser.add_argument("--slo", type=float, default=2.0,
+                        help="/determine p99 latency in seconds a step must stay within (default 2.0)")
+    parser.add_argument("--output", help="write the results to this file instead of printing them")
+    parser.add_argument("--baseline", help="results file of an earlier run; fail if the capacity dropped")
+    args = parser.parse_args(argv)
+    try:
+        parse_mix(args.mix)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    print(f"Capacity: {report['capacity_users']} users within a {args.slo}s /determine p99", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            before = json.load(f)["capacity_users"]
+        if report["capacity_users"] < before:
+            print(f"REGRESSION: capacity {before} -> {report['capacity_users']} users", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Synthetic portfolios of activities drawn from the factor domains DecisionInput accepts.
+"""
+import random
+from typing import Dict, List, Optional
+
+from logic.outcome_table import FACTORS, FACTOR_VALUES
+
+ACTIVITY_TYPES = ("Finance", "HR", "IT", "Legal", "Operations", "Procurement", "")
+
+
+def synthetic_portfolio(size: int, seed: Optional[int] = 0) -> List[Dict[str, str]]:
+    """
+    Generate activities with every factor drawn uniformly from its domain
+
+    Args:
+        size: Number of activities
+        seed: Seed of the random generator, so that runs are reproducible
+
+    Returns:
+        List[Dict]: DecisionInput-shaped activities
+    """
+    rng = random.Random(seed)
+    domains = [(factor, FACTOR_VALUES[factor]) for factor in FACTORS]
+    portfolio = []
+    for idx in range(size):
+        activity = {factor: rng.choice(values) for factor, values in domains}
+        activity["activity_name"] = f"Activity {idx}"
+        activity["activity_type"] = rng.choice(ACTIVITY_TYPES)
+        portfolio.append(activity)
+    return portfolio
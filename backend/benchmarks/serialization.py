@@ -0,0 +1,109 @@
+"""
+Compare the memory and time /determine spends per activity building its
+response body, with the old model-copying path and the current byte path.
+
+The old path converted each input with .dict(), copied it into a
+DecisionOutput, and let FastAPI validate and encode the DecisionResponse
+again. The current path splices cached JSON fragments into the body.
+
+Run from the backend directory:
+    python -m benchmarks.serialization [--items N ...]
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+from fastapi.responses import JSONResponse, Response
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from benchmarks.startup import SAMPLE_REQUEST
+from logic.outcome_cache import outcome_cache
+from routers.decision import DecisionInput, DecisionOutput, DecisionResponse, _score_request, _serialize_response
+
+TIMESTAMP = "2024-01-01 00:00:00"
+
+_response_field = create_response_field(name="Response_determine", type_=DecisionResponse, mode="serialization")
+
+
+def _legacy_determine(inputs):
+    # model_dump() is what the deprecated .dict() called
+    outcomes = [profile.outcome for profile in outcome_cache.get_models(inputs)]
+    results = []
+    for input_data, outcome in zip(inputs, outcomes):
+        input_dict = input_data.model_dump()
+        results.append(DecisionOutput(
+            activity_name=input_dict.get("activity_name", ""),
+            activity_type=input_dict.get("activity_type", ""),
+            business_case=input_dict.get("business_case", ""),
+            core=input_dict.get("core", ""),
+            legal_requirement=input_dict.get("legal_requirement", ""),
+            risks=input_dict.get("risks", ""),
+            risk_tolerance=input_dict.get("risk_tolerance", ""),
+            frequency=input_dict.get("frequency", ""),
+            specialised_skill=input_dict.get("specialised_skill", ""),
+            similarity_with_current_scopes=input_dict.get("similarity_with_current_scopes", ""),
+            skill_capacity=input_dict.get("skill_capacity", ""),
+            duration=input_dict.get("duration", ""),
+            affordability=input_dict.get("affordability", ""),
+            strategic_fit=input_dict.get("strategic_fit", ""),
+            outcome=outcome,
+            timestamp=TIMESTAMP
+        ))
+    return DecisionResponse(results=results)
+
+
+def legacy_body(inputs) -> bytes:
+    """
+    Build the body the way the endpoint did before, including FastAPI's response_model handling
+    """
+    content = asyncio.run(serialize_response(field=_response_field, response_content=_legacy_determine(inputs)))
+    return JSONResponse(content).body
+
+
+def current_body(inputs) -> bytes:
+    return Response(content=_serialize_response(_score_request(inputs, "determine_outcomes"), TIMESTAMP, "rows"), media_type="application/json").body
+
+
+def _inputs(items: int):
+    sample = SAMPLE_REQUEST["inputs"][0]
+    return [DecisionInput(**sample, activity_name=f"Activity {idx}") for idx in range(items)]
+
+
+def _measure(build, inputs) -> dict:
+    build(inputs)
+    tracemalloc.start()
+    started = time.perf_counter()
+    body = build(inputs)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "peak_bytes_per_item": round(peak / len(inputs)),
+        "body_bytes_per_item": round(len(body) / len(inputs)),
+        "us_per_item": round(elapsed / len(inputs) * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[100, 10000], help="batch sizes (default 100 10000)")
+    args = parser.parse_args()
+
+    report = []
+    for items in args.items:
+        inputs = _inputs(items)
+        if json.loads(legacy_body(inputs)) != json.loads(current_body(inputs)):
+            raise AssertionError("The two paths produce different responses")
+        report.append({
+            "items": items,
+            "before": _measure(legacy_body, inputs),
+            "after": _measure(current_body, inputs),
+        })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Measure how long a cold production server takes to answer its first decision.
+
+Run from the backend directory:
+    python -m benchmarks.startup [--workers N] [--no-warm-up]
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_REQUEST = {
+    "inputs": [{
+        "business_case": "Yes",
+        "core": "Yes",
+        "frequency": "High",
+        "specialised_skill": "Yes",
+        "similarity_with_current_scopes": "Yes",
+        "skill_capacity": "No",
+        "duration": "Long",
+        "affordability": "Yes",
+        "strategic_fit": "Yes",
+    }]
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _determine(port: int) -> float:
+    """
+    Send one decision request and return its latency in seconds
+    """
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/api/decision/determine",
+        data=json.dumps(SAMPLE_REQUEST).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    sent = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+    return time.perf_counter() - sent
+
+
+def measure(workers: int, warm_up: bool) -> dict:
+    port = _free_port()
+    env = dict(
+        os.environ,
+        SERVER_MODE="production",
+        PORT=str(port),
+        WEB_CONCURRENCY=str(workers),
+        WARM_UP="1" if warm_up else "0",
+        RECORD_HISTORY="0",
+    )
+    launched = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "app.py"], cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode}")
+            try:
+                first_latency = _determine(port)
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.02)
+        time_to_first_response = time.perf_counter() - launched
+        warm_latency = min(_determine(port) for _ in range(5))
+    finally:
+        stopping = time.perf_counter()
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+        shutdown_seconds = time.perf_counter() - stopping
+
+    return {
+        "workers": workers,
+        "warm_up": warm_up,
+        "time_to_first_response_s": round(time_to_first_response, 4),
+        "first_request_latency_s": round(first_latency, 4),
+        "warm_request_latency_s": round(warm_latency, 4),
+        "shutdown_s": round(shutdown_seconds, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=1, help="number of server workers (default 1)")
+    parser.add_argument("--no-warm-up", action="store_true", help="start without warming the decision engine")
+    args = parser.parse_args()
+    print(json.dumps(measure(args.workers, not args.no_warm_up), indent=2))
+
+
+if __name__ == "__main__":
+    main()
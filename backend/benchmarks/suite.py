@@ -0,0 +1,232 @@
+"""
+Benchmark the decision engine and the API endpoints on synthetic portfolios.
+
+Benchmarks:
+    rules          determine_outcome() called once per activity
+    batch_scoring  the vectorized outcome table lookup used by the endpoints
+    determine      POST /determine through FastAPI's TestClient
+    export_excel   POST /export-excel through FastAPI's TestClient
+    update_excel   POST /update-excel with a small batch, on histories of growing size
+
+The determine and export_excel benchmarks rename one activity on every call,
+so they time scoring rather than request cache hits.
+
+Each benchmark and size runs in a fresh interpreter, so that its peak RSS is
+its own. Results are printed (or written with --output) as JSON; pass an
+earlier result file as --baseline to fail when p50 latency regresses.
+
+Run from the backend directory:
+    python -m benchmarks.suite [--benchmarks NAME ...] [--sizes N ...] [--history-sizes N ...]
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from benchmarks.portfolio import synthetic_portfolio
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCHMARKS = ("rules", "batch_scoring", "determine", "export_excel", "update_excel")
+
+DEFAULT_SIZES = (10, 1000, 100000)
+
+# Rows already in the uploaded workbook's history for update_excel
+DEFAULT_HISTORY_SIZES = (10, 1000, 100000)
+
+# Activities sent with each /update-excel request
+UPDATE_ROWS = 10
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of a list of samples
+    """
+    ordered = sorted(samples)
+    rank = max(1, int(round(fraction * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _client():
+    from fastapi.testclient import TestClient
+    import app
+    return TestClient(app.app)
+
+
+def _prepare(benchmark: str, rows: int, history: int) -> Callable[[], None]:
+    """
+    Set up one benchmark and return the operation to time
+    """
+    if benchmark == "rules":
+        from logic.decision_rules import determine_outcome
+        portfolio = synthetic_portfolio(rows)
+        return lambda: [determine_outcome(activity) for activity in portfolio]
+
+    if benchmark == "batch_scoring":
+        from logic.batch_scoring import score_records
+        portfolio = synthetic_portfolio(rows)
+        return lambda: score_records(portfolio)
+
+    client = _client()
+    body = {"inputs": synthetic_portfolio(rows)}
+
+    def post(path: str, **kwargs):
+        response = client.post(f"/api/decision/{path}", **kwargs)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.text[:200]}")
+        return response
+
+    revisions = itertools.count(1)
+
+    def fresh_body() -> Dict:
+        # Rename the first activity on every call, so each one is scored
+        # instead of being answered from the request cache
+        first = body["inputs"][0]
+        renamed = dict(first, activity_name=f"{first['activity_name']} rev {next(revisions)}")
+        return {"inputs": [renamed] + body["inputs"][1:]}
+
+    if benchmark == "determine":
+        return lambda: post("determine", json=fresh_body())
+
+    if benchmark == "export_excel":
+        return lambda: post("export-excel", json=fresh_body())
+
+    if benchmark == "update_excel":
+        # Build the history once with a first export, then time merging a small batch into it
+        workbook = post("export-excel", json={"inputs": synthetic_portfolio(history, seed=1)}).content
+        form = {"request": json.dumps(body)}
+        return lambda: post("update-excel", data=form, files={"existing_file": ("history.xlsx", workbook)})
+
+    raise ValueError(f"Unknown benchmark: {benchmark}")
+
+
+def run_one(benchmark: str, rows: int, history: int, repeat: int) -> Dict:
+    """
+    Run one benchmark in this process and measure it
+    """
+    operation = _prepare(benchmark, rows, history)
+    # The first call pays for one-off setup (outcome table, worker pool, lazy imports)
+    operation()
+
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - started)
+
+    p50 = percentile(latencies, 0.5)
+    result = {"benchmark": benchmark, "rows": rows}
+    if benchmark == "update_excel":
+        result["history_rows"] = history
+    result.update({
+        "repeat": repeat,
+        "throughput_rows_per_s": round(rows / p50, 1),
+        "latency_s": {
+            "min": round(min(latencies), 6),
+            "p50": round(p50, 6),
+            "p99": round(percentile(latencies, 0.99), 6),
+            "max": round(max(latencies), 6),
+        },
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    })
+    return result
+
+
+def _run_isolated(benchmark: str, rows: int, history: int, repeat: int) -> Dict:
+    command = [sys.executable, "-m", "benchmarks.suite", "--run-one", benchmark,
+               "--sizes", str(rows), "--history-sizes", str(history), "--repeat", str(repeat)]
+    # Benchmark decisions are not recorded in the history
+    completed = subprocess.run(command, cwd=BACKEND_DIR, env={**os.environ, "RECORD_HISTORY": "0"},
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{benchmark} ({rows} rows) failed:\n{completed.stderr}")
+    return json.loads(completed.stdout)
+
+
+def _key(result: Dict) -> Tuple:
+    return result["benchmark"], result["rows"], result.get("history_rows")
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """
+    Return a message for every result whose p50 latency is more than
+    `tolerance` (a fraction) slower than the same run in the baseline
+    """
+    previous = {_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(_key(result))
+        if before is None:
+            continue
+        old, new = before["latency_s"]["p50"], result["latency_s"]["p50"]
+        if new > old * (1 + tolerance):
+            regressions.append(f"{_key(result)}: p50 {old}s -> {new}s")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="portfolio sizes (default 10 1000 100000)")
+    parser.add_argument("--history-sizes", type=int, nargs="+", default=list(DEFAULT_HISTORY_SIZES),
+                        help="history rows for update_excel (default 10 1000 100000)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark and size (default 5)")
+    parser.add_argument("--output", help="write the results to this file instead of printing them")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed p50 slowdown against the baseline (default 0.2 = 20%%)")
+    parser.add_argument("--run-one", choices=BENCHMARKS, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one:
+        print(json.dumps(run_one(args.run_one, args.sizes[0], args.history_sizes[0], args.repeat)))
+        return
+
+    runs = []
+    for benchmark in args.benchmarks:
+        if benchmark == "update_excel":
+            runs.extend((benchmark, UPDATE_ROWS, history) for history in args.history_sizes)
+        else:
+            runs.extend((benchmark, rows, 0) for rows in args.sizes)
+
+    results = []
+    for benchmark, rows, history in runs:
+        print(f"{benchmark}: {rows} rows" + (f", {history} history rows" if history else ""), file=sys.stderr)
+        results.append(_run_isolated(benchmark, rows, history, args.repeat))
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
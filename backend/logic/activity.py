@@ -0,0 +1,130 @@
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, Iterator, List, Sequence, Tuple, Union
+
+from logic.outcome_table import FACTORS, FACTOR_CODES, FACTOR_VALUES, FALLBACK_CODES, RADICES, STRIDES
+
+# Either the outcome table index of an activity whose factor values are all
+# ones the rules compare against, or its raw factor values in FACTORS order
+ActivityKey = Union[int, Tuple[Any, ...]]
+
+_factor_values = attrgetter(*FACTORS)
+
+_PACKERS = tuple(zip(FACTOR_CODES, STRIDES))
+
+_UNPACKERS = tuple(zip((FACTOR_VALUES[factor] for factor in FACTORS), STRIDES, RADICES))
+
+
+def pack(values: Tuple[Any, ...]) -> ActivityKey:
+    """
+    Pack the factor values of an activity into one int, its outcome table index.
+
+    Only values listed in FACTOR_VALUES have a code of their own, so an
+    activity with any other value keeps its raw values: they must still be
+    echoed back as they were sent.
+
+    Args:
+        values: Factor values in FACTORS order
+
+    Returns:
+        ActivityKey: The table index, or the values themselves
+    """
+    profile = 0
+    for value, (codes, stride) in zip(values, _PACKERS):
+        code = codes.get(value)
+        if code is None:
+            return values
+        profile += code * stride
+    return profile
+
+
+# Portfolios repeat a few thousand profiles, so most activities are packed by
+# one lookup, and activities of the same profile share one key object
+_pack_cached = lru_cache(maxsize=65536)(pack)
+
+
+@lru_cache(maxsize=None)
+def unpack(profile: int) -> Tuple[str, ...]:
+    """
+    Return the factor values packed into a table index. Only indexes made by
+    pack() have values, so this caches at most one tuple per combination of
+    FACTOR_VALUES (20,736).
+    """
+    return tuple(values[profile // stride % radix] for values, stride, radix in _UNPACKERS)
+
+
+def values_of(key: ActivityKey) -> Tuple[Any, ...]:
+    """
+    Return the factor values of an activity key, in FACTORS order
+    """
+    return unpack(key) if key.__class__ is int else key
+
+
+def profile_of(key: ActivityKey) -> int:
+    """
+    Return the outcome table index of an activity key
+    """
+    if key.__class__ is int:
+        return key
+    profile = 0
+    for value, codes, fallback, stride in zip(key, FACTOR_CODES, FALLBACK_CODES, STRIDES):
+        profile += codes.get(value, fallback) * stride
+    return profile
+
+
+class ActivityBatch:
+    """
+    Validated activities in the compact form scoring, caching and export work on.
+
+    Request models hold fourteen free-form strings each. A batch instead keeps
+    three parallel lists: names, types and packed keys (see pack()). Equal
+    profiles share one key object, so an activity costs about three list
+    slots, and comparing two activities' factors is one int comparison.
+    """
+
+    __slots__ = ("names", "types", "keys")
+
+    def __init__(self, names: List[str], types: List[str], keys: List[ActivityKey]):
+        self.names = names
+        self.types = types
+        self.keys = keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def select(self, indexes: Sequence[int]) -> "ActivityBatch":
+        """
+        Return the activities at the given positions as a new batch
+        """
+        return ActivityBatch(
+            [self.names[idx] for idx in indexes],
+            [self.types[idx] for idx in indexes],
+            [self.keys[idx] for idx in indexes],
+        )
+
+    def values(self, idx: int) -> Tuple[Any, ...]:
+        """
+        Factor values of one activity in FACTORS order, as they were submitted
+        """
+        return values_of(self.keys[idx])
+
+    def rows(self, outcomes: Sequence[str], timestamp: str) -> Iterator[tuple]:
+        """
+        Lay out the activities as decision sheet or history rows (HEADERS order)
+        """
+        for name, activity_type, key, outcome in zip(self.names, self.types, self.keys, outcomes):
+            yield (name, activity_type) + values_of(key) + (outcome, timestamp)
+
+
+def from_models(models: Sequence[Any]) -> ActivityBatch:
+    """
+    Convert validated request models into a compact batch
+
+    Args:
+        models: Objects exposing activity_name, activity_type and the factors as attributes
+    """
+    return ActivityBatch(
+        [model.activity_name for model in models],
+        [model.activity_type for model in models],
+        [_pack_cached(_factor_values(model)) for model in models],
+    )
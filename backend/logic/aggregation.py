@@ -0,0 +1,89 @@
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from logic.outcome_table import OUTCOMES, OUTCOME_CODES
+
+# Trend periods, as the length of the timestamp prefix ("YYYY-MM-DD HH:MM:SS") naming each one
+PERIODS = {"hour": 13, "day": 10, "month": 7}
+
+
+def _distribution(counts: Sequence[int]) -> Dict[str, Any]:
+    total = sum(counts)
+    return {
+        "total": total,
+        "outcomes": {
+            outcome: {"count": count, "percentage": round(100 * count / total, 1) if total else 0.0}
+            for outcome, count in zip(OUTCOMES, counts)
+        },
+    }
+
+
+class OutcomeDistribution:
+    """
+    Outcome counts of groups of decisions, updated as the decisions stream past.
+
+    Each group keeps one count per outcome, so memory grows with the number
+    of groups (activity types, trend periods), never with the number of
+    decisions.
+    """
+
+    def __init__(self):
+        self._counts: Dict[str, List[int]] = {}
+
+    def add(self, group: str, outcome_code: int, count: int = 1):
+        counts = self._counts.get(group)
+        if counts is None:
+            counts = self._counts[group] = [0] * len(OUTCOMES)
+        counts[outcome_code] += count
+
+    def overall(self) -> Dict[str, Any]:
+        """
+        Return the distribution of all groups together
+        """
+        return _distribution([sum(column) for column in zip(*self._counts.values())] or [0] * len(OUTCOMES))
+
+    def groups(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Return the distribution of each group, in group order
+        """
+        return {group: _distribution(self._counts[group]) for group in sorted(self._counts)}
+
+
+def summarise_portfolio(types: Sequence[str], outcome_codes: Sequence[int]) -> Dict[str, Any]:
+    """
+    Summarise the outcomes of a scored portfolio overall and per activity type
+
+    Args:
+        types: Activity type of each activity
+        outcome_codes: Outcome code (index into OUTCOMES) of each activity
+
+    Returns:
+        Dict: Counts and percentages of each outcome, overall and by activity type
+    """
+    by_type = OutcomeDistribution()
+    # Counting (type, outcome) pairs in C leaves one update per pair
+    for (activity_type, outcome_code), count in Counter(zip(types, outcome_codes)).items():
+        by_type.add(activity_type, outcome_code, count)
+    return dict(by_type.overall(), by_activity_type=by_type.groups())
+
+
+def summarise_history(counts: Iterable[Tuple[str, str, str, int]]) -> Dict[str, Any]:
+    """
+    Summarise recorded decisions overall, per activity type and per period
+
+    Args:
+        counts: (activity type, period, outcome, count) of each group of
+            decisions, e.g. from HistoryStore.outcome_counts()
+
+    Returns:
+        Dict: Counts and percentages of each outcome, overall, by activity
+            type, and as a trend over periods in time order
+    """
+    by_type = OutcomeDistribution()
+    by_period = OutcomeDistribution()
+    for activity_type, period, outcome, count in counts:
+        outcome_code = OUTCOME_CODES[outcome]
+        by_type.add(activity_type, outcome_code, count)
+        by_period.add(period, outcome_code, count)
+    trend = [dict(distribution, period=period) for period, distribution in by_period.groups().items()]
+    return dict(by_type.overall(), by_activity_type=by_type.groups(), trend=trend)
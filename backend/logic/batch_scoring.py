@@ -0,0 +1,129 @@
+from itertools import repeat
+from typing import Dict, Any, List, Sequence, Optional, Tuple
+
+import numpy as np
+
+from logic.outcome_table import FACTORS, FACTOR_CODES, FALLBACK_CODES, STRIDES, OUTCOMES, get_table, get_rule_table
+
+_OUTCOME_LABELS = np.array(OUTCOMES, dtype=object)
+
+_table_array: Optional[np.ndarray] = None
+_rule_table_array: Optional[np.ndarray] = None
+
+
+def _get_table_array() -> np.ndarray:
+    """
+    Return the outcome table as a NumPy view (no copy)
+    """
+    global _table_array
+    if _table_array is None:
+        _table_array = np.frombuffer(get_table(), dtype=np.uint8)
+    return _table_array
+
+
+def _get_rule_table_array() -> np.ndarray:
+    global _rule_table_array
+    if _rule_table_array is None:
+        _rule_table_array = np.frombuffer(get_rule_table(), dtype=np.uint8)
+    return _rule_table_array
+
+
+def encode_column(factor: str, values: Sequence[Any]) -> np.ndarray:
+    """
+    Encode one factor column into small-int codes
+
+    Args:
+        factor: Name of the decision factor
+        values: Raw values of the factor, one per activity
+
+    Returns:
+        np.ndarray: uint8 code of each value
+    """
+    factor_index = FACTORS.index(factor)
+    mapping = FACTOR_CODES[factor_index]
+    fallback = FALLBACK_CODES[factor_index]
+
+    return np.fromiter(map(mapping.get, values, repeat(fallback)), dtype=np.uint8, count=len(values))
+
+
+def encode_profiles(columns: Dict[str, Sequence[Any]]) -> np.ndarray:
+    """
+    Encode factor columns into outcome table indexes
+
+    Args:
+        columns: Raw values of each factor, one per activity. Factors that are
+            missing are treated as empty strings.
+
+    Returns:
+        np.ndarray: int32 profile index of each activity
+    """
+    size = len(next(iter(columns.values()))) if columns else 0
+    profiles = np.zeros(size, dtype=np.int32)
+    for factor, stride in zip(FACTORS, STRIDES):
+        values = columns.get(factor)
+        if values is None:
+            values = [""] * size
+        profiles += encode_column(factor, values) * np.int32(stride)
+    return profiles
+
+
+def score_columns(columns: Dict[str, Sequence[Any]]) -> np.ndarray:
+    """
+    Score a whole batch of activities in one pass
+
+    Args:
+        columns: Raw values of each factor, one per activity
+
+    Returns:
+        np.ndarray: Outcome code of each activity (index into OUTCOMES)
+    """
+    return _get_table_array()[encode_profiles(columns)]
+
+
+def score_columns_with_rules(columns: Dict[str, Sequence[Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score a whole batch of activities in one pass, also returning the rule
+    that decided each outcome
+
+    Args:
+        columns: Raw values of each factor, one per activity
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Outcome code (index into OUTCOMES) and
+            rule code (index into RULE_IDS) of each activity
+    """
+    profiles = encode_profiles(columns)
+    return _get_table_array()[profiles], _get_rule_table_array()[profiles]
+
+
+def score_profiles_with_rules(profiles: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Look up the outcomes and rules of activities already encoded as table indexes
+
+    Args:
+        profiles: Outcome table index of each activity
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Outcome code (index into OUTCOMES) and
+            rule code (index into RULE_IDS) of each activity
+    """
+    if not isinstance(profiles, np.ndarray):
+        profiles = np.fromiter(profiles, dtype=np.int32, count=len(profiles))
+    return _get_table_array()[profiles], _get_rule_table_array()[profiles]
+
+
+def score_records(records: Sequence[Dict[str, Any]]) -> List[str]:
+    """
+    Determine the outcomes of a batch of activity dictionaries
+
+    Args:
+        records: Dictionaries containing the decision factors
+
+    Returns:
+        List[str]: The outcome of each activity
+    """
+    if not records:
+        return []
+    columns = {factor: [record.get(factor, "") for record in records] for factor in FACTORS}
+    return _OUTCOME_LABELS[score_columns(columns)].tolist()
+
@@ -0,0 +1,224 @@
+import asyncio
+import os
+import time
+import zlib
+from typing import Optional
+
+from logic.metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; without it responses are gzipped
+    brotli = None
+
+# Responses smaller than this many bytes are sent as they are
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+
+# zlib level 1-9 of gzip responses
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 6))
+
+# Brotli quality 0-11 of br responses; above 5 it gets much slower for little gain on JSON
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 5))
+
+# Bodies at least this large are compressed in a thread, so the event loop
+# keeps serving other requests meanwhile (zlib and brotli release the GIL)
+THREAD_MIN_SIZE = 256 * 1024
+
+# Media types worth compressing; workbooks are zip files already
+_COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/")
+
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the encoding of a response from the request's Accept-Encoding header
+
+    Returns:
+        The most preferred of ENCODINGS the client accepts, br over gzip
+        on equal weight, or None to send the response uncompressed
+    """
+    weights = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+class _Compressor:
+    """
+    Incremental compressor of one response body in the negotiated encoding
+    """
+
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._compress, self._flush, self._finish = (
+                self._compressor.process, self._compressor.flush, self._compressor.finish
+            )
+        else:
+            # wbits 31: a gzip header and trailer around the deflate stream
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._compress = self._compressor.compress
+            self._flush = lambda: self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._compressor.flush
+
+    def chunk(self, data: bytes, last: bool) -> bytes:
+        """
+        Compress the next piece of the body. Pieces of a streamed response are
+        flushed, so the client can decode every line as soon as it arrives.
+        """
+        return self._compress(data) + (self._finish() if last else self._flush())
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing JSON, NDJSON and text responses with Brotli
+    (if the brotli package is installed) or gzip, as the client accepts.
+
+    Responses below COMPRESSION_MIN_SIZE, workbooks and bodies that already
+    have a Content-Encoding pass through unchanged. A strong ETag becomes weak,
+    since the compressed bytes differ from the ones it was computed on.
+    Every response of a compressible media type (and every 304) gets
+    Vary: Accept-Encoding, compressed or not, so shared caches keep the
+    encodings apart. The time spent is recorded as the "compress" stage of
+    the endpoint.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = None if scope["method"] == "HEAD" else negotiate(accept_encoding)
+
+        # Decided on the first body message: a _Compressor, or False to pass through.
+        # The start message is held back until then, as its headers may change.
+        compressor = None
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal compressor, start_message
+            if message["type"] == "http.response.start":
+                if _varies(message):
+                    _add_vary(message)
+                if encoding is None:
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            if message["type"] != "http.response.body" or encoding is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            first = compressor is None
+            if first:
+                compressor = _compressor_for(start_message, encoding, body, more_body)
+                if not compressor:
+                    await send(start_message)
+            if not compressor:
+                await send(message)
+                return
+
+            started = time.perf_counter()
+            if len(body) >= THREAD_MIN_SIZE:
+                data = await asyncio.to_thread(compressor.chunk, body, not more_body)
+            else:
+                data = compressor.chunk(body, not more_body)
+            endpoint = scope.get("endpoint")
+            if endpoint is not None:
+                metrics.observe(endpoint.__name__, "compress", time.perf_counter() - started)
+            if first:
+                # A body sent in one piece gets the length of its compressed
+                # form; a streamed one has no length
+                _set_headers(start_message, encoding, None if more_body else len(data))
+                await send(start_message)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _compressible(start_message) -> bool:
+    """
+    Whether the response has a media type worth compressing and no Content-Encoding yet
+    """
+    media_type = b""
+    for name, value in start_message["headers"]:
+        if name == b"content-type":
+            media_type = value
+        elif name == b"content-encoding":
+            return False
+    return media_type.decode("latin-1").startswith(_COMPRESSIBLE)
+
+
+def _varies(start_message) -> bool:
+    """
+    Whether the response depends on Accept-Encoding. A 304 stands in for a
+    response the middleware cannot see, so it is assumed to.
+    """
+    return start_message["status"] == 304 or _compressible(start_message)
+
+
+def _add_vary(start_message):
+    """
+    Add Accept-Encoding to the Vary header of a response
+    """
+    headers, vary = [], None
+    for name, value in start_message["headers"]:
+        if name == b"vary":
+            vary = value
+        else:
+            headers.append((name, value))
+    if vary is not None and b"accept-encoding" in vary.lower():
+        return
+    headers.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+    start_message["headers"] = headers
+
+
+def _compressor_for(start_message, encoding: str, body: bytes, more_body: bool):
+    """
+    Return a compressor if the response should be compressed, else False
+    """
+    if start_message["status"] < 200 or start_message["status"] in (204, 304):
+        return False
+    if not _compressible(start_message):
+        return False
+    if not more_body and len(body) < COMPRESSION_MIN_SIZE:
+        return False
+    return _Compressor(encoding)
+
+
+def _set_headers(start_message, encoding: str, length: Optional[int]):
+    headers = []
+    for name, value in start_message["headers"]:
+        if name == b"content-length":
+            continue
+        if name == b"etag" and not value.startswith(b"W/"):
+            value = b"W/" + value
+        headers.append((name, value))
+    if length is not None:
+        headers.append((b"content-length", str(length).encode()))
+    headers.append((b"content-encoding", encoding.encode()))
+    start_message["headers"] = headers
@@ -1,270 +1,270 @@
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, NamedTuple, Tuple, Union
 
-def determine_outcome(data: Dict[str, Any]) -> str:
+ELIMINATE = "Eliminate"
+CURRENT_OUTSOURCE = "Current Outsource"
+NEW_OUTSOURCE = "New Outsource"
+INSOURCE = "Insource or create in-house capacity"
+FURTHER_ANALYSIS = "Requires Further Analysis"
+
+# Conditions map a factor to the values it may take. Factors that are not
+# given default to an empty string.
+Conditions = Dict[str, Tuple[str, ...]]
+
+
+class Rule(NamedTuple):
+    # Names the section of the rule and its position within it. Ids must not
+    # change when rules are added, so that hit counts stay comparable over time.
+    rule_id: str
+    outcome: str
+    # The rule fires if every condition of any one clause holds
+    clauses: Tuple[Conditions, ...]
+
+
+def _rule(rule_id: str, outcome: str, any_of: Tuple[Dict[str, Union[str, Tuple[str, ...]]], ...] = ({},),
+          **conditions: Union[str, Tuple[str, ...]]) -> Rule:
     """
-    Determine the outcome based on the decision rules from the Excel model
-    
-    Args:
-        data: Dictionary containing the decision factors
-        
-    Returns:
-        str: The outcome (Eliminate, Current Outsource, New Outsource, Insource or create in-house capacity, or Requires Further Analysis)
+    Build a rule from keyword conditions, with one clause per alternative in any_of
     """
-    # Extract values from data (with empty string as default)
-    business_case = data.get("business_case", "")
-    core = data.get("core", "")
-    legal_requirement = data.get("legal_requirement", "")
-    risks = data.get("risks", "")
-    risk_tolerance = data.get("risk_tolerance", "")
-    frequency = data.get("frequency", "")
-    specialised_skill = data.get("specialised_skill", "")
-    similarity_with_current_scopes = data.get("similarity_with_current_scopes", "")
-    skill_capacity = data.get("skill_capacity", "")
-    duration = data.get("duration", "")
-    affordability = data.get("affordability", "")
-    strategic_fit = data.get("strategic_fit", "")
-    
-    # Convert frontend values to Excel formula values if needed
-    # Frontend uses "High"/"Low" for frequency, but Excel logic uses "Yes"/"No"
-    frequency = "Yes" if frequency == "High" else "No"
-    # Frontend uses "Yes"/"No" for specialised_skill, but Excel logic uses "High"/"Low"
-    specialised_skill = "High" if specialised_skill == "Yes" else "Low"
-    
-    # Decision logic based on Excel formula
-    
+    clauses = []
+    for alternative in any_of:
+        clause = {}
+        for factor, values in {**conditions, **alternative}.items():
+            clause[factor] = (values,) if isinstance(values, str) else tuple(values)
+        clauses.append(clause)
+    return Rule(rule_id, outcome, tuple(clauses))
+
+
+# The frontend uses "High"/"Low" for frequency, but the Excel logic uses
+# "Yes"/"No"; it uses "Yes"/"No" for specialised_skill, but the Excel logic
+# uses "High"/"Low". Each factor maps its recognised values, and every other
+# value becomes the default.
+NORMALIZED_VALUES = {
+    "frequency": ({"High": "Yes"}, "No"),
+    "specialised_skill": ({"Yes": "High"}, "Low"),
+}
+
+NO_OR_EMPTY = ("No", "")
+OUTSIDE_OR_EMPTY = ("Outside", "")
+NOT_FIT_OR_UNAFFORDABLE = ({"strategic_fit": NO_OR_EMPTY}, {"affordability": "No"})
+
+# Frequent activities whose risk tolerance is not "Inside"
+_FREQUENT = {"frequency": "Yes", "risk_tolerance": OUTSIDE_OR_EMPTY}
+# Specialised activities similar to current scopes
+_SIMILAR = {"specialised_skill": "High", "similarity_with_current_scopes": "Yes"}
+_CORE_CASE = {"business_case": "Yes", "core": "Yes"}
+
+# The decision rules from the Excel model, in evaluation order: the first rule
+# with a matching clause decides the outcome.
+RULES = (
     # Special cases
-    if business_case == "Yes" and core == "No" and legal_requirement == "No" and risks == "Yes" and risk_tolerance == "Outside" and frequency == "Yes" and specialised_skill == "Low" and similarity_with_current_scopes == "Yes" and skill_capacity == "Yes" and duration == "Long" and affordability == "Yes" and strategic_fit == "Yes":
-        return "Current Outsource"
-    
+    _rule("special.1", CURRENT_OUTSOURCE, business_case="Yes", core="No", legal_requirement="No", risks="Yes",
+          risk_tolerance="Outside", frequency="Yes", specialised_skill="Low", similarity_with_current_scopes="Yes",
+          skill_capacity="Yes", duration="Long", affordability="Yes", strategic_fit="Yes"),
+
     # Eliminate conditions
-    if business_case == "No" and (legal_requirement == "No" or legal_requirement == "") and frequency == "No":
-        return "Eliminate"
-    
-    if business_case == "Yes" and core == "No" and (legal_requirement == "No" or legal_requirement == "") and frequency == "No":
-        return "Eliminate"
-    
-    # Additional eliminate condition - corporate level activities that are not core
-    if business_case == "Yes" and core == "No" and (legal_requirement == "No" or legal_requirement == ""):
-        return "Eliminate"
-    
-    if frequency == "Yes" and risk_tolerance == "Inside":
-        return "Eliminate"
-    
+    _rule("eliminate.1", ELIMINATE, business_case="No", legal_requirement=NO_OR_EMPTY, frequency="No"),
+    _rule("eliminate.2", ELIMINATE, business_case="Yes", core="No", legal_requirement=NO_OR_EMPTY, frequency="No"),
+    # Corporate level activities that are not core
+    _rule("eliminate.3", ELIMINATE, business_case="Yes", core="No", legal_requirement=NO_OR_EMPTY),
+    _rule("eliminate.4", ELIMINATE, frequency="Yes", risk_tolerance="Inside"),
+
     # Current Outsource and New Outsource conditions
-    if frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and specialised_skill == "Low" and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and specialised_skill == "Low" and skill_capacity == "No":
-        return "New Outsource"
-        
-    if frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and specialised_skill == "High" and similarity_with_current_scopes == "No" and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and specialised_skill == "High" and similarity_with_current_scopes == "No" and skill_capacity == "No":
-        return "New Outsource"
-        
-    if frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and (risks == "No" or risks == "") and duration == "Short" and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and (risks == "No" or risks == "") and duration == "Short" and skill_capacity == "No":
-        return "New Outsource"
-        
-    if frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and (risks == "No" or risks == "") and duration == "Long" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and (risks == "No" or risks == "") and duration == "Long" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and skill_capacity == "No":
-        return "New Outsource"
-        
-    if frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and risks == "Yes" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and risks == "Yes" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and skill_capacity == "No":
-        return "New Outsource"
-        
+    _rule("frequent.1", CURRENT_OUTSOURCE, **_FREQUENT, specialised_skill="Low", skill_capacity="Yes"),
+    _rule("frequent.2", NEW_OUTSOURCE, **_FREQUENT, specialised_skill="Low", skill_capacity="No"),
+    _rule("frequent.3", CURRENT_OUTSOURCE, **_FREQUENT, specialised_skill="High",
+          similarity_with_current_scopes="No", skill_capacity="Yes"),
+    _rule("frequent.4", NEW_OUTSOURCE, **_FREQUENT, specialised_skill="High",
+          similarity_with_current_scopes="No", skill_capacity="No"),
+    _rule("frequent.5", CURRENT_OUTSOURCE, **_FREQUENT, **_SIMILAR, risks=NO_OR_EMPTY, duration="Short",
+          skill_capacity="Yes"),
+    _rule("frequent.6", NEW_OUTSOURCE, **_FREQUENT, **_SIMILAR, risks=NO_OR_EMPTY, duration="Short",
+          skill_capacity="No"),
+    _rule("frequent.7", CURRENT_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, **_FREQUENT, **_SIMILAR, risks=NO_OR_EMPTY,
+          duration="Long", skill_capacity="Yes"),
+    _rule("frequent.8", NEW_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, **_FREQUENT, **_SIMILAR, risks=NO_OR_EMPTY,
+          duration="Long", skill_capacity="No"),
+    _rule("frequent.9", CURRENT_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, **_FREQUENT, **_SIMILAR, risks="Yes",
+          skill_capacity="Yes"),
+    _rule("frequent.10", NEW_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, **_FREQUENT, **_SIMILAR, risks="Yes",
+          skill_capacity="No"),
+
     # Insource or create in-house capacity conditions
-    if frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and (risks == "No" or risks == "") and duration == "Long" and strategic_fit == "Yes" and affordability == "Yes":
-        return "Insource or create in-house capacity"
-        
-    if frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and risks == "Yes" and duration == "Long" and strategic_fit == "Yes" and affordability == "Yes":
-        return "Insource or create in-house capacity"
-        
-    if core == "Yes" and legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and risks == "Yes" and strategic_fit == "Yes" and affordability == "Yes":
-        return "Insource or create in-house capacity"
-        
+    _rule("insource.1", INSOURCE, **_FREQUENT, **_SIMILAR, risks=NO_OR_EMPTY, duration="Long", strategic_fit="Yes",
+          affordability="Yes"),
+    _rule("insource.2", INSOURCE, **_FREQUENT, **_SIMILAR, risks="Yes", duration="Long", strategic_fit="Yes",
+          affordability="Yes"),
+    _rule("insource.3", INSOURCE, core="Yes", legal_requirement="Yes", **_SIMILAR, risks="Yes", strategic_fit="Yes",
+          affordability="Yes"),
+
     # More conditions from the Excel formula
-    if business_case == "Yes" and core == "Yes" and specialised_skill == "Low" and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if business_case == "Yes" and core == "Yes" and specialised_skill == "Low" and skill_capacity == "No":
-        return "New Outsource"
-        
-    if business_case == "Yes" and core == "Yes" and specialised_skill == "Low" and similarity_with_current_scopes == "No" and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if business_case == "Yes" and core == "Yes" and specialised_skill == "Low" and similarity_with_current_scopes == "No" and skill_capacity == "No":
-        return "New Outsource"
-        
-    if business_case == "Yes" and core == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "No" and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if business_case == "Yes" and core == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "No" and skill_capacity == "No":
-        return "New Outsource"
-        
-    if business_case == "Yes" and core == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and (risks == "No" or risks == "") and duration == "Short" and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if business_case == "Yes" and core == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and (risks == "No" or risks == "") and duration == "Short" and skill_capacity == "No":
-        return "New Outsource"
-        
-    if business_case == "Yes" and core == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and (risks == "No" or risks == "") and duration == "Long" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if business_case == "Yes" and core == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and (risks == "No" or risks == "") and duration == "Long" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and skill_capacity == "No":
-        return "New Outsource"
-        
-    if business_case == "Yes" and core == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and risks == "Yes" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if business_case == "Yes" and core == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and risks == "Yes" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and skill_capacity == "No":
-        return "New Outsource"
-        
-    if business_case == "Yes" and core == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and (risks == "No" or risks == "") and duration == "Long" and strategic_fit == "Yes" and affordability == "Yes":
-        return "Insource or create in-house capacity"
-        
-    if business_case == "Yes" and core == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and risks == "Yes" and duration == "Long" and strategic_fit == "Yes" and affordability == "Yes":
-        return "Insource or create in-house capacity"
-        
-    # Additional conditions from Excel formula
-    if (core == "Yes" or core == "No") and legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and risks == "Yes" and (strategic_fit == "No" or strategic_fit == "") and skill_capacity == "No":
-        return "New Outsource"
-        
-    if (core == "Yes" or core == "No") and legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and risks == "Yes" and (strategic_fit == "No" or strategic_fit == "") and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if (core == "Yes" or core == "No") and legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and risks == "Yes" and affordability == "No" and skill_capacity == "No":
-        return "New Outsource"
-        
-    if core == "Yes" and legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and risks == "Yes" and affordability == "No" and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if business_case == "Yes" and core == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and risks == "Yes" and strategic_fit == "Yes" and affordability == "Yes":
-        return "Insource or create in-house capacity"
-        
-    if legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and risks == "Yes" and strategic_fit == "Yes" and affordability == "Yes":
-        return "Insource or create in-house capacity"
-        
-    if legal_requirement == "Yes" and specialised_skill == "Low" and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if legal_requirement == "Yes" and specialised_skill == "Low" and skill_capacity == "No":
-        return "New Outsource"
-        
-    if legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "No" and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "No" and skill_capacity == "No":
-        return "New Outsource"
-        
-    if legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and (risks == "No" or risks == "") and duration == "Short" and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and (risks == "No" or risks == "") and duration == "Short" and skill_capacity == "No":
-        return "New Outsource"
-        
-    if legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and (risks == "No" or risks == "") and duration == "Long" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and (risks == "No" or risks == "") and duration == "Long" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and skill_capacity == "No":
-        return "New Outsource"
-        
-    if legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and risks == "Yes" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and skill_capacity == "Yes":
-        return "Current Outsource"
-        
-    if legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and risks == "Yes" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and skill_capacity == "No":
-        return "New Outsource"
-        
-    if legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "Yes" and (risks == "No" or risks == "") and duration == "Long" and strategic_fit == "Yes" and affordability == "Yes":
-        return "Insource or create in-house capacity"
-    
+    _rule("core.1", CURRENT_OUTSOURCE, **_CORE_CASE, specialised_skill="Low", skill_capacity="Yes"),
+    _rule("core.2", NEW_OUTSOURCE, **_CORE_CASE, specialised_skill="Low", skill_capacity="No"),
+    _rule("core.3", CURRENT_OUTSOURCE, **_CORE_CASE, specialised_skill="Low", similarity_with_current_scopes="No",
+          skill_capacity="Yes"),
+    _rule("core.4", NEW_OUTSOURCE, **_CORE_CASE, specialised_skill="Low", similarity_with_current_scopes="No",
+          skill_capacity="No"),
+    _rule("core.5", CURRENT_OUTSOURCE, **_CORE_CASE, specialised_skill="High", similarity_with_current_scopes="No",
+          skill_capacity="Yes"),
+    _rule("core.6", NEW_OUTSOURCE, **_CORE_CASE, specialised_skill="High", similarity_with_current_scopes="No",
+          skill_capacity="No"),
+    _rule("core.7", CURRENT_OUTSOURCE, **_CORE_CASE, **_SIMILAR, risks=NO_OR_EMPTY, duration="Short",
+          skill_capacity="Yes"),
+    _rule("core.8", NEW_OUTSOURCE, **_CORE_CASE, **_SIMILAR, risks=NO_OR_EMPTY, duration="Short",
+          skill_capacity="No"),
+    _rule("core.9", CURRENT_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, **_CORE_CASE, **_SIMILAR, risks=NO_OR_EMPTY,
+          duration="Long", skill_capacity="Yes"),
+    _rule("core.10", NEW_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, **_CORE_CASE, **_SIMILAR, risks=NO_OR_EMPTY,
+          duration="Long", skill_capacity="No"),
+    _rule("core.11", CURRENT_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, **_CORE_CASE, **_SIMILAR, risks="Yes",
+          skill_capacity="Yes"),
+    _rule("core.12", NEW_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, **_CORE_CASE, **_SIMILAR, risks="Yes",
+          skill_capacity="No"),
+    _rule("core.13", INSOURCE, **_CORE_CASE, **_SIMILAR, risks=NO_OR_EMPTY, duration="Long", strategic_fit="Yes",
+          affordability="Yes"),
+    _rule("core.14", INSOURCE, **_CORE_CASE, **_SIMILAR, risks="Yes", duration="Long", strategic_fit="Yes",
+          affordability="Yes"),
+
+    # Additional conditions from the Excel formula
+    _rule("legal.1", NEW_OUTSOURCE, core=("Yes", "No"), legal_requirement="Yes", **_SIMILAR, risks="Yes",
+          strategic_fit=NO_OR_EMPTY, skill_capacity="No"),
+    _rule("legal.2", CURRENT_OUTSOURCE, core=("Yes", "No"), legal_requirement="Yes", **_SIMILAR, risks="Yes",
+          strategic_fit=NO_OR_EMPTY, skill_capacity="Yes"),
+    _rule("legal.3", NEW_OUTSOURCE, core=("Yes", "No"), legal_requirement="Yes", **_SIMILAR, risks="Yes",
+          affordability="No", skill_capacity="No"),
+    _rule("legal.4", CURRENT_OUTSOURCE, core="Yes", legal_requirement="Yes", **_SIMILAR, risks="Yes",
+          affordability="No", skill_capacity="Yes"),
+    _rule("legal.5", INSOURCE, **_CORE_CASE, **_SIMILAR, risks="Yes", strategic_fit="Yes", affordability="Yes"),
+    _rule("legal.6", INSOURCE, legal_requirement="Yes", **_SIMILAR, risks="Yes", strategic_fit="Yes",
+          affordability="Yes"),
+    _rule("legal.7", CURRENT_OUTSOURCE, legal_requirement="Yes", specialised_skill="Low", skill_capacity="Yes"),
+    _rule("legal.8", NEW_OUTSOURCE, legal_requirement="Yes", specialised_skill="Low", skill_capacity="No"),
+    _rule("legal.9", CURRENT_OUTSOURCE, legal_requirement="Yes", specialised_skill="High",
+          similarity_with_current_scopes="No", skill_capacity="Yes"),
+    _rule("legal.10", NEW_OUTSOURCE, legal_requirement="Yes", specialised_skill="High",
+          similarity_with_current_scopes="No", skill_capacity="No"),
+    _rule("legal.11", CURRENT_OUTSOURCE, legal_requirement="Yes", **_SIMILAR, risks=NO_OR_EMPTY, duration="Short",
+          skill_capacity="Yes"),
+    _rule("legal.12", NEW_OUTSOURCE, legal_requirement="Yes", **_SIMILAR, risks=NO_OR_EMPTY, duration="Short",
+          skill_capacity="No"),
+    _rule("legal.13", CURRENT_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, legal_requirement="Yes", **_SIMILAR,
+          risks=NO_OR_EMPTY, duration="Long", skill_capacity="Yes"),
+    _rule("legal.14", NEW_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, legal_requirement="Yes", **_SIMILAR,
+          risks=NO_OR_EMPTY, duration="Long", skill_capacity="No"),
+    _rule("legal.15", CURRENT_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, legal_requirement="Yes", **_SIMILAR, risks="Yes",
+          skill_capacity="Yes"),
+    _rule("legal.16", NEW_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, legal_requirement="Yes", **_SIMILAR, risks="Yes",
+          skill_capacity="No"),
+    _rule("legal.17", INSOURCE, legal_requirement="Yes", **_SIMILAR, risks=NO_OR_EMPTY, duration="Long",
+          strategic_fit="Yes", affordability="Yes"),
+
     # More focused fallback logic that preserves the intent of the decision tree
     # Rather than having a generic default, we use priority-based classification
-    
+
     # Step 1: Check if this should be eliminated
-    if (frequency == "No" and (legal_requirement == "No" or legal_requirement == "")) or risk_tolerance == "Inside" or (core == "No" and (legal_requirement == "No" or legal_requirement == "")):
-        return "Eliminate"
-        
+    _rule("fallback.eliminate.1", ELIMINATE, (
+        {"frequency": "No", "legal_requirement": NO_OR_EMPTY},
+        {"risk_tolerance": "Inside"},
+        {"core": "No", "legal_requirement": NO_OR_EMPTY},
+    )),
+
     # Step 2: Check criteria for insourcing
-    if (specialised_skill == "High" and similarity_with_current_scopes == "Yes" and 
-        strategic_fit == "Yes" and affordability == "Yes" and 
-        (core == "Yes" or legal_requirement == "Yes")):
-        return "Insource or create in-house capacity"
-        
+    _rule("fallback.insource.1", INSOURCE, ({"core": "Yes"}, {"legal_requirement": "Yes"}), **_SIMILAR,
+          strategic_fit="Yes", affordability="Yes"),
+
     # Step 3: Check Current Outsource conditions - MUST match Excel formula exactly
-    if (frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and 
-        specialised_skill == "Low" and skill_capacity == "Yes"):
-        return "Current Outsource"
-        
-    if (frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and 
-        specialised_skill == "High" and similarity_with_current_scopes == "No" and 
-        skill_capacity == "Yes"):
-        return "Current Outsource"
-        
-    if (frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and 
-        specialised_skill == "High" and similarity_with_current_scopes == "Yes" and 
-        (risks == "No" or risks == "") and duration == "Short" and skill_capacity == "Yes"):
-        return "Current Outsource"
-        
-    if (frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and 
-        specialised_skill == "High" and similarity_with_current_scopes == "Yes" and 
-        (risks == "No" or risks == "") and duration == "Long" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and 
-        skill_capacity == "Yes"):
-        return "Current Outsource"
-        
-    if (frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and 
-        specialised_skill == "High" and similarity_with_current_scopes == "Yes" and 
-        risks == "Yes" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and 
-        skill_capacity == "Yes"):
-        return "Current Outsource"
-        
+    _rule("fallback.current.1", CURRENT_OUTSOURCE, **_FREQUENT, specialised_skill="Low", skill_capacity="Yes"),
+    _rule("fallback.current.2", CURRENT_OUTSOURCE, **_FREQUENT, specialised_skill="High",
+          similarity_with_current_scopes="No", skill_capacity="Yes"),
+    _rule("fallback.current.3", CURRENT_OUTSOURCE, **_FREQUENT, **_SIMILAR, risks=NO_OR_EMPTY, duration="Short",
+          skill_capacity="Yes"),
+    _rule("fallback.current.4", CURRENT_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, **_FREQUENT, **_SIMILAR,
+          risks=NO_OR_EMPTY, duration="Long", skill_capacity="Yes"),
+    _rule("fallback.current.5", CURRENT_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, **_FREQUENT, **_SIMILAR, risks="Yes",
+          skill_capacity="Yes"),
+
     # Step 4: Check New Outsource conditions - MUST match Excel formula exactly
-    if (frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and 
-        specialised_skill == "Low" and skill_capacity == "No"):
-        return "New Outsource"
-        
-    if (frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and 
-        specialised_skill == "High" and similarity_with_current_scopes == "No" and 
-        skill_capacity == "No"):
-        return "New Outsource"
-        
-    if (frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and 
-        specialised_skill == "High" and similarity_with_current_scopes == "Yes" and 
-        (risks == "No" or risks == "") and duration == "Short" and skill_capacity == "No"):
-        return "New Outsource"
-        
-    if (frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and 
-        specialised_skill == "High" and similarity_with_current_scopes == "Yes" and 
-        (risks == "No" or risks == "") and duration == "Long" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and 
-        skill_capacity == "No"):
-        return "New Outsource"
-        
-    if (frequency == "Yes" and (risk_tolerance == "Outside" or risk_tolerance == "") and 
-        specialised_skill == "High" and similarity_with_current_scopes == "Yes" and 
-        risks == "Yes" and ((strategic_fit == "No" or strategic_fit == "") or affordability == "No") and 
-        skill_capacity == "No"):
-        return "New Outsource"
-        
+    _rule("fallback.new.1", NEW_OUTSOURCE, **_FREQUENT, specialised_skill="Low", skill_capacity="No"),
+    _rule("fallback.new.2", NEW_OUTSOURCE, **_FREQUENT, specialised_skill="High",
+          similarity_with_current_scopes="No", skill_capacity="No"),
+    _rule("fallback.new.3", NEW_OUTSOURCE, **_FREQUENT, **_SIMILAR, risks=NO_OR_EMPTY, duration="Short",
+          skill_capacity="No"),
+    _rule("fallback.new.4", NEW_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, **_FREQUENT, **_SIMILAR, risks=NO_OR_EMPTY,
+          duration="Long", skill_capacity="No"),
+    _rule("fallback.new.5", NEW_OUTSOURCE, NOT_FIT_OR_UNAFFORDABLE, **_FREQUENT, **_SIMILAR, risks="Yes",
+          skill_capacity="No"),
+
     # Final fallback - prefer Current Outsource if we reach here and have skill capacity
-    if skill_capacity == "Yes":
-        return "Current Outsource"
-    else:
-        # Complete Edge Cases - Additional New Outsource cases from Excel formula
-        if legal_requirement == "Yes" and specialised_skill == "Low" and skill_capacity == "No":
-            return "New Outsource"
-        if legal_requirement == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "No" and skill_capacity == "No":
-            return "New Outsource"
-        if business_case == "Yes" and core == "Yes" and specialised_skill == "Low" and skill_capacity == "No":
-            return "New Outsource"
-        if business_case == "Yes" and core == "Yes" and specialised_skill == "High" and similarity_with_current_scopes == "No" and skill_capacity == "No":
-            return "New Outsource"
-        
-        return "Requires Further Analysis"
\ No newline at end of file
+    _rule("fallback.capacity.1", CURRENT_OUTSOURCE, skill_capacity="Yes"),
+
+    # Complete Edge Cases - Additional New Outsource cases from Excel formula
+    _rule("edge.1", NEW_OUTSOURCE, legal_requirement="Yes", specialised_skill="Low", skill_capacity="No"),
+    _rule("edge.2", NEW_OUTSOURCE, legal_requirement="Yes", specialised_skill="High",
+          similarity_with_current_scopes="No", skill_capacity="No"),
+    _rule("edge.3", NEW_OUTSOURCE, **_CORE_CASE, specialised_skill="Low", skill_capacity="No"),
+    _rule("edge.4", NEW_OUTSOURCE, **_CORE_CASE, specialised_skill="High", similarity_with_current_scopes="No",
+          skill_capacity="No"),
+
+    _rule("default.1", FURTHER_ANALYSIS),
+)
+
+RULE_IDS = tuple(rule.rule_id for rule in RULES)
+
+_compiled = None
+_compiled_lock = threading.Lock()
+
+
+def normalize(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return the factors of an activity as the rules compare them
+    """
+    values = dict(data)
+    for factor, (mapping, default) in NORMALIZED_VALUES.items():
+        values[factor] = mapping.get(data.get(factor, ""), default)
+    return values
+
+
+def evaluate_rules_in_order(data: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Evaluate RULES one by one, as the Excel formula does. This defines what
+    the compiled rules must return, but is slower than determine_outcome.
+
+    Args:
+        data: Dictionary containing the decision factors
+
+    Returns:
+        Tuple[str, str]: The rule id and the outcome
+    """
+    values = normalize(data)
+    for rule in RULES:
+        for clause in rule.clauses:
+            if all(values.get(factor, "") in allowed for factor, allowed in clause.items()):
+                return rule.rule_id, rule.outcome
+    raise AssertionError("The last rule must always match")
+
+
+def get_compiled_rules():
+    """
+    Return RULES compiled into a decision graph, compiling them on first use
+    """
+    global _compiled
+    if _compiled is None:
+        with _compiled_lock:
+            if _compiled is None:
+                from logic.rule_compiler import compile_rules
+                _compiled = compile_rules(RULES, NORMALIZED_VALUES)
+    return _compiled
+
+
+def determine_outcome(data: Dict[str, Any]) -> str:
+    """
+    Determine the outcome based on the decision rules from the Excel model
+
+    Args:
+        data: Dictionary containing the decision factors
+
+    Returns:
+        str: The outcome (Eliminate, Current Outsource, New Outsource, Insource or create in-house capacity, or Requires Further Analysis)
+    """
+    compiled = _compiled if _compiled is not None else get_compiled_rules()
+    return RULES[compiled.evaluate(data)].outcome
@@ -0,0 +1,548 @@
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from typing import Dict, Any, Callable, List, Optional, Sequence, Iterable, Iterator, Tuple, Union, IO
+from xml.etree import ElementTree
+
+import openpyxl
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+
+from logic.activity import values_of
+from logic.metrics import metrics
+from logic.outcome_table import FACTORS
+from logic.workbook_layout import (
+    HEADER_TITLES, FIELD_DESCRIPTIONS, FIELD_DESCRIPTION_WIDTHS, OUTCOME_COLORS,
+    OUTCOME_COLUMN, MAIN_SHEET, NOTES_SHEET, HISTORY_SHEET, HEADER_STYLE, FIELD_HEADER_STYLE,
+    ColumnWidths, outcome_style_name, register_styles,
+)
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Size of the file chunks streamed back to the client
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Number of rows between progress callbacks
+PROGRESS_INTERVAL = 1000
+
+# Called with the number of decision rows written so far
+ProgressCallback = Callable[[int], None]
+
+
+def _styled_cell(sheet, value: Any, style: str) -> WriteOnlyCell:
+    cell = WriteOnlyCell(sheet, value=value)
+    cell.style = style
+    return cell
+
+
+class DecisionSheet:
+    """
+    Append decision rows to a write-only sheet with their outcome cells coloured.
+
+    A write-only sheet serialises each row as it is appended, so one styled
+    cell per outcome is reused for every row instead of styling a new cell
+    for each outcome.
+    """
+
+    def __init__(self, sheet, widths: ColumnWidths, minimum_widths: Optional[Dict[int, float]] = None):
+        self.sheet = sheet
+        widths.apply(sheet, minimum=minimum_widths)
+        sheet.append([_styled_cell(sheet, title, HEADER_STYLE) for title in HEADER_TITLES])
+        self._outcome_cells = {
+            outcome: _styled_cell(sheet, outcome, outcome_style_name(outcome)) for outcome in OUTCOME_COLORS
+        }
+
+    def append(self, row: Sequence[Any]):
+        cell = self._outcome_cells.get(row[OUTCOME_COLUMN])
+        if cell is not None:
+            row = (*row[:OUTCOME_COLUMN], cell, *row[OUTCOME_COLUMN + 1:])
+        self.sheet.append(row)
+
+    def append_plain(self, row: Sequence[Any]):
+        """
+        Append a row as plain values, as the history sheet keeps them
+        """
+        self.sheet.append(row)
+
+
+def build_rows(activities: Sequence[Any], outcomes: Sequence[str], timestamp: str) -> Tuple[List[tuple], ColumnWidths]:
+    """
+    Lay out scored activities as sheet rows, tracking column widths as they are built
+
+    Args:
+        activities: Compact activities (logic.activity.ActivityBatch)
+        outcomes: Outcome of each activity
+        timestamp: Decision timestamp shared by all rows
+
+    Returns:
+        Tuple of the rows (in HEADERS order) and their column widths
+    """
+    rows = list(activities.rows(outcomes, timestamp))
+    return rows, batch_widths(activities, outcomes, timestamp)
+
+
+def batch_widths(activities: Any, outcomes: Sequence[str], timestamp: str) -> ColumnWidths:
+    """
+    Return the column widths of the rows of a batch, measured column by column
+
+    Activities of the same profile share one key, so each profile's factor
+    values are measured once rather than once per row.
+    """
+    factor_columns = list(zip(*map(values_of, set(activities.keys)))) or [()] * len(FACTORS)
+    widths = ColumnWidths()
+    widths.observe_columns([activities.names, activities.types, *factor_columns, outcomes, (timestamp,)])
+    return widths
+
+
+def _write_field_descriptions(sheet):
+    for column, width in FIELD_DESCRIPTION_WIDTHS.items():
+        sheet.column_dimensions[column].width = width
+    sheet.append([
+        _styled_cell(sheet, "Field", FIELD_HEADER_STYLE),
+        _styled_cell(sheet, "Description", FIELD_HEADER_STYLE),
+    ])
+    for field, description in FIELD_DESCRIPTIONS.items():
+        sheet.append([field, description])
+
+
+def _save(wb: Workbook, path: Optional[str] = None) -> str:
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+    wb.save(path)
+    return path
+
+
+def write_export_workbook(rows: Iterable[Sequence[Any]], widths: ColumnWidths,
+                          progress: Optional[ProgressCallback] = None, path: Optional[str] = None,
+                          history_rows: Optional[Iterable[Sequence[Any]]] = None) -> str:
+    """
+    Write the decisions workbook in openpyxl's write-only mode
+
+    Rows are streamed to both "Sourcing Decisions" and "Decision History"
+    as they are consumed, so no per-cell objects are kept in memory.
+
+    Args:
+        rows: Rows in HEADERS order
+        widths: Column widths of the rows
+        progress: Optional callback reporting the rows written so far
+        path: Where to save the workbook (default: a new temporary file)
+        history_rows: Rows of "Decision History" if they differ from `rows`,
+            e.g. the full history behind the latest decisions
+
+    Returns:
+        str: Path of the saved workbook
+    """
+    started = time.perf_counter()
+    wb = Workbook(write_only=True)
+    register_styles(wb)
+
+    main_sheet = DecisionSheet(wb.create_sheet(title=MAIN_SHEET), widths)
+    _write_field_descriptions(wb.create_sheet(title=NOTES_SHEET))
+    history_sheet = DecisionSheet(wb.create_sheet(title=HISTORY_SHEET), widths)
+
+    for written, row in enumerate(rows, 1):
+        main_sheet.append(row)
+        if history_rows is None:
+            history_sheet.append_plain(row)
+        if progress is not None and written % PROGRESS_INTERVAL == 0:
+            progress(written)
+    if history_rows is not None:
+        for row in history_rows:
+            history_sheet.append_plain(row)
+    metrics.observe("write_export_workbook", "write_rows", time.perf_counter() - started)
+
+    with metrics.timer("write_export_workbook", "save"):
+        return _save(wb, path)
+
+
+_SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+_SHARED_STRINGS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"
+_SHARED_STRINGS_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"
+
+
+def _part_path(target: str) -> str:
+    return target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+
+
+def _workbook_parts(archive: zipfile.ZipFile) -> Tuple[Dict[str, str], Optional[str]]:
+    """
+    Return the XML part of each sheet by title, in workbook order, and the
+    shared strings part (None if the workbook has none)
+    """
+    workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    relationships = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    targets, shared_strings = {}, None
+    for rel in relationships.iter(f"{_PACKAGE_REL_NS}Relationship"):
+        targets[rel.get("Id")] = rel.get("Target")
+        if rel.get("Type") == _SHARED_STRINGS_REL:
+            shared_strings = _part_path(rel.get("Target"))
+
+    sheets = {}
+    for sheet in workbook.iter(f"{_SHEET_NS}sheet"):
+        target = targets.get(sheet.get(f"{_REL_NS}id"))
+        if target is not None:
+            sheets[sheet.get("name")] = _part_path(target)
+    return sheets, shared_strings
+
+
+def _sheet_path(archive: zipfile.ZipFile, sheet_title: str) -> Optional[str]:
+    """
+    Return the path of a sheet's XML part in the workbook archive, or None if it has no such sheet
+    """
+    return _workbook_parts(archive)[0].get(sheet_title)
+
+
+def read_column_widths(fileobj: Union[str, IO[bytes]], sheet_title: str) -> Dict[int, float]:
+    """
+    Read the column widths of a sheet without parsing any of its rows
+
+    Args:
+        fileobj: Path or seekable file of the workbook
+        sheet_title: Title of the sheet
+
+    Returns:
+        Dict mapping 1-based column index to width (empty if the sheet or
+        its widths are missing)
+    """
+    widths = {}
+    with zipfile.ZipFile(fileobj) as archive:
+        path = _sheet_path(archive, sheet_title)
+        if path is None:
+            return widths
+
+        # Column definitions come before sheetData, so stop as soon as it starts
+        with archive.open(path) as source:
+            for event, element in ElementTree.iterparse(source, events=("start", "end")):
+                if element.tag == f"{_SHEET_NS}sheetData":
+                    break
+                if event == "end" and element.tag == f"{_SHEET_NS}col" and element.get("width"):
+                    for col_idx in range(int(element.get("min")), int(element.get("max")) + 1):
+                        widths[col_idx] = float(element.get("width"))
+    return widths
+
+
+def read_merged_cells(fileobj: Union[str, IO[bytes]], sheet_title: str) -> List[str]:
+    """
+    Read the merged cell ranges of a sheet, which read-only worksheets do not expose
+
+    Args:
+        fileobj: Path or seekable file of the workbook
+        sheet_title: Title of the sheet
+
+    Returns:
+        List of ranges such as "A1:C1" (empty if the sheet or its merged cells are missing)
+    """
+    ranges = []
+    with zipfile.ZipFile(fileobj) as archive:
+        path = _sheet_path(archive, sheet_title)
+        if path is None:
+            return ranges
+
+        # Merged cells come after sheetData; rows are dropped as they are parsed
+        with archive.open(path) as source:
+            for _, element in ElementTree.iterparse(source):
+                if element.tag == f"{_SHEET_NS}mergeCell":
+                    ranges.append(element.get("ref"))
+                elif element.tag == f"{_SHEET_NS}row":
+                    element.clear()
+    return ranges
+
+
+def _copy_sheet(source_sheet, sheet, widths: Dict[int, float], merged_cells: List[str]):
+    """
+    Copy a sheet of an uploaded workbook into a write-only sheet, keeping its
+    values, formulas, cell formatting, column widths and merged cells
+    """
+    for col_idx, width in widths.items():
+        sheet.column_dimensions[get_column_letter(col_idx)].width = width
+    for ref in merged_cells:
+        sheet.merged_cells.add(ref)
+    for row in source_sheet.iter_rows():
+        values = []
+        for cell in row:
+            # Cells missing from the sheet's XML come back as EmptyCell, without styles
+            if getattr(cell, "has_style", False):
+                copied = WriteOnlyCell(sheet, value=cell.value)
+                copied.font = cell.font
+                copied.fill = cell.fill
+                copied.border = cell.border
+                copied.alignment = cell.alignment
+                copied.number_format = cell.number_format
+                copied.protection = cell.protection
+                values.append(copied)
+            else:
+                values.append(cell.value)
+        sheet.append(values)
+
+
+# Decompressed bytes of the uploaded history read at a time while splicing
+SPLICE_CHUNK_SIZE = 1024 * 1024
+
+# zlib level of the spliced history sheet; the history is most of the
+# workbook, and level 1 compresses it several times faster than the default
+SPLICE_COMPRESS_LEVEL = 1
+
+_MAIN_NAMESPACE = b'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+# Style references of the uploaded rows, which index the upload's own styles
+_STYLE_ATTRIBUTE = re.compile(rb' s="\d+"')
+_ROW_NUMBER = re.compile(rb'(<row\b[^>]*?\br=")(\d+)"')
+_CELL_REFERENCE = re.compile(rb'(<c\b[^>]*?\br="[A-Z]+)(\d+)"')
+
+
+def _splice_root(fileobj: Union[str, IO[bytes]], sheet_title: str) -> Optional[bytes]:
+    """
+    Return the root start tag of a sheet if its rows can be spliced into
+    another workbook as they are: a worksheet in the default namespace of
+    SpreadsheetML with a sheetData element. None otherwise.
+    """
+    with zipfile.ZipFile(fileobj) as archive:
+        path = _sheet_path(archive, sheet_title)
+        if path is None:
+            return None
+        head = b""
+        with archive.open(path) as source:
+            # Everything before sheetData is sheet properties and column widths
+            while b"<sheetData" not in head:
+                chunk = source.read(64 * 1024)
+                if not chunk:
+                    return None
+                head += chunk
+    start = head.find(b"<worksheet")
+    if start == -1:
+        return None
+    root = head[start:head.index(b">", start) + 1]
+    return root if _MAIN_NAMESPACE in root else None
+
+
+def _copy_history_rows(source: IO[bytes], destination: IO[bytes]) -> int:
+    """
+    Copy the rows of an uploaded history sheet after its header row, without
+    their style references, straight from one sheet XML stream to another
+
+    Returns:
+        int: Number of the last row copied (1 if there were none)
+    """
+    buffer = b""
+    while True:
+        chunk = source.read(SPLICE_CHUNK_SIZE)
+        buffer += chunk
+        start = buffer.find(b"<sheetData")
+        if start != -1 and (buffer.find(b"</row>", start) != -1 or buffer.find(b"</sheetData>", start) != -1):
+            break
+        if not chunk:
+            return 1
+    tag_end = buffer.index(b">", start)
+    if buffer[tag_end - 1:tag_end] == b"/":
+        return 1
+    buffer = buffer[tag_end + 1:]
+
+    # Skip the upload's header row; the new workbook has its own
+    row_start, data_end = buffer.find(b"<row"), buffer.find(b"</sheetData>")
+    if row_start != -1 and (data_end == -1 or row_start < data_end):
+        row_tag_end = buffer.index(b">", row_start)
+        number = _ROW_NUMBER.match(buffer, row_start)
+        if number is None or number.group(2) == b"1":
+            if buffer[row_tag_end - 1:row_tag_end] == b"/":
+                buffer = buffer[row_tag_end + 1:]
+            else:
+                buffer = buffer[buffer.index(b"</row>", row_tag_end) + len(b"</row>"):]
+
+    rows, last_row = 1, 1
+    while True:
+        # Pieces end on a ">", so no tag is ever split between two of them
+        cut = buffer.rfind(b">") + 1
+        piece, buffer = buffer[:cut], buffer[cut:]
+        end = piece.find(b"</sheetData>")
+        if end != -1:
+            piece = piece[:end]
+        if b' s="' in piece:
+            piece = _STYLE_ATTRIBUTE.sub(b"", piece)
+        rows += piece.count(b"<row ") + piece.count(b"<row>")
+        row_start = piece.rfind(b"<row ")
+        if row_start != -1:
+            number = _ROW_NUMBER.match(piece, row_start)
+            if number is not None:
+                last_row = int(number.group(2))
+        destination.write(piece)
+        if end != -1:
+            return max(last_row, rows)
+        chunk = source.read(SPLICE_CHUNK_SIZE)
+        if not chunk:
+            raise ValueError("The history sheet of the workbook is truncated")
+        buffer += chunk
+
+
+def _shift_rows(data: bytes, offset: int) -> bytes:
+    """
+    Move the rows and cell references of sheet XML down by offset rows
+    """
+    def shift(match):
+        return match.group(1) + str(int(match.group(2)) + offset).encode() + b'"'
+
+    return _CELL_REFERENCE.sub(shift, _ROW_NUMBER.sub(shift, data))
+
+
+def _splice_history(source: Union[str, IO[bytes]], path: str, root: bytes):
+    """
+    Insert the rows of the upload's history sheet into the saved workbook's
+    history sheet, between its header and the new rows.
+
+    The rows are copied as XML, without being parsed into cells; only their
+    style references are dropped, as they index the upload's styles. Cells
+    referencing the upload's shared strings keep doing so, since its shared
+    strings part is carried over (the saved workbook has none of its own).
+    """
+    spliced_path = f"{path}.splice"
+    with zipfile.ZipFile(source) as upload, zipfile.ZipFile(path) as saved:
+        history_part, shared_strings = _workbook_parts(upload)
+        history_part = history_part[HISTORY_SHEET]
+        target_part = _sheet_path(saved, HISTORY_SHEET)
+
+        with zipfile.ZipFile(spliced_path, "w", zipfile.ZIP_DEFLATED, compresslevel=SPLICE_COMPRESS_LEVEL) as spliced:
+            for info in saved.infolist():
+                data = saved.read(info.filename)
+                if info.filename == target_part:
+                    sheet_data = data.index(b"<sheetData>")
+                    header_end = data.index(b"</row>", sheet_data) + len(b"</row>")
+                    root_end = data.index(b">", data.index(b"<worksheet")) + 1
+                    with spliced.open(info.filename, "w") as destination:
+                        destination.write(data[:data.index(b"<worksheet")] + root + data[root_end:header_end])
+                        with upload.open(history_part) as rows:
+                            last_row = _copy_history_rows(rows, destination)
+                        destination.write(_shift_rows(data[header_end:], last_row - 1))
+                    continue
+                if shared_strings is not None and info.filename == "xl/_rels/workbook.xml.rels":
+                    data = data.replace(b"</Relationships>", (
+                        f'<Relationship Id="rIdSharedStrings" Type="{_SHARED_STRINGS_REL}" '
+                        f'Target="/xl/sharedStrings.xml"/></Relationships>'
+                    ).encode())
+                elif shared_strings is not None and info.filename == "[Content_Types].xml":
+                    data = data.replace(b"</Types>", (
+                        f'<Override PartName="/xl/sharedStrings.xml" ContentType="{_SHARED_STRINGS_TYPE}"/></Types>'
+                    ).encode())
+                spliced.writestr(info, data)
+            if shared_strings is not None:
+                with upload.open(shared_strings) as strings, spliced.open("xl/sharedStrings.xml", "w") as destination:
+                    shutil.copyfileobj(strings, destination, SPLICE_CHUNK_SIZE)
+    os.replace(spliced_path, path)
+
+
+def write_updated_workbook(source: Union[str, IO[bytes]], rows: Sequence[Sequence[Any]], widths: ColumnWidths,
+                           progress: Optional[ProgressCallback] = None, path: Optional[str] = None,
+                           history_rows: Optional[Sequence[Sequence[Any]]] = None) -> str:
+    """
+    Merge new decisions into an uploaded workbook
+
+    "Sourcing Decisions" and "Field Descriptions" are rebuilt and the new rows
+    are appended to "Decision History". The existing history rows are spliced
+    into the saved workbook as sheet XML rather than read into cells, so the
+    cost of an update grows with the new rows rather than with the history;
+    cell formatting of those rows is dropped. A history sheet that cannot be
+    spliced (e.g. with namespace-prefixed XML) is copied through openpyxl's
+    read-only mode as plain values instead.
+
+    Any other sheets keep their values, formulas, cell formatting, column
+    widths and merged cells; charts, images, conditional formatting and data
+    validation are not carried over.
+
+    Args:
+        source: Path or seekable file of the uploaded workbook
+        rows: Rows of "Sourcing Decisions" in HEADERS order
+        widths: Column widths of the rows
+        progress: Optional callback reporting the new rows written so far
+        path: Where to save the workbook (default: a new temporary file)
+        history_rows: Rows to append to "Decision History" (default: rows)
+
+    Returns:
+        str: Path of the saved workbook
+    """
+    started = time.perf_counter()
+    with zipfile.ZipFile(source) as archive:
+        titles = list(_workbook_parts(archive)[0])
+    history_widths = read_column_widths(source, HISTORY_SHEET)
+    splice_root = _splice_root(source, HISTORY_SHEET) if HISTORY_SHEET in titles else None
+
+    # Only sheets copied cell by cell need the upload opened in openpyxl
+    existing_wb = None
+    if any(title not in (MAIN_SHEET, NOTES_SHEET, HISTORY_SHEET) for title in titles) or (
+            HISTORY_SHEET in titles and splice_root is None):
+        if hasattr(source, "seek"):
+            source.seek(0)
+        existing_wb = openpyxl.load_workbook(source, read_only=True)
+
+    wb = Workbook(write_only=True)
+    register_styles(wb)
+
+    def write_main_sheet():
+        main_sheet = DecisionSheet(wb.create_sheet(title=MAIN_SHEET), widths)
+        for written, row in enumerate(rows, 1):
+            main_sheet.append(row)
+            if progress is not None and written % PROGRESS_INTERVAL == 0:
+                progress(written)
+
+    def write_history_sheet(existing_history=None):
+        history_sheet = DecisionSheet(wb.create_sheet(title=HISTORY_SHEET), widths, history_widths)
+        if existing_history is not None:
+            for row in existing_history.iter_rows(min_row=2, values_only=True):
+                history_sheet.append_plain(row)
+        for row in rows if history_rows is None else history_rows:
+            history_sheet.append_plain(row)
+
+    try:
+        if MAIN_SHEET not in titles:
+            write_main_sheet()
+
+        for title in titles:
+            if title == MAIN_SHEET:
+                write_main_sheet()
+            elif title == NOTES_SHEET:
+                _write_field_descriptions(wb.create_sheet(title=NOTES_SHEET))
+            elif title == HISTORY_SHEET:
+                # Spliced history rows are added once the workbook is saved
+                write_history_sheet(None if splice_root is not None else existing_wb[title])
+            else:
+                if hasattr(source, "seek"):
+                    source.seek(0)
+                widths_of_sheet = read_column_widths(source, title)
+                if hasattr(source, "seek"):
+                    source.seek(0)
+                merged_cells = read_merged_cells(source, title)
+                _copy_sheet(existing_wb[title], wb.create_sheet(title=title), widths_of_sheet, merged_cells)
+
+        if HISTORY_SHEET not in titles:
+            write_history_sheet()
+    finally:
+        if existing_wb is not None:
+            existing_wb.close()
+    metrics.observe("write_updated_workbook", "write_rows", time.perf_counter() - started)
+
+    with metrics.timer("write_updated_workbook", "save"):
+        path = _save(wb, path)
+    if splice_root is not None:
+        with metrics.timer("write_updated_workbook", "splice_history"):
+            _splice_history(source, path, splice_root)
+    return path
+
+
+def iter_file_chunks(path: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Stream a temporary file in chunks, deleting it once it is sent
+    """
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException
+
+from logic.metrics import metrics, reset_worker_metrics
+
+# "thread" or "process". Threads free the event loop while the GIL is
+# released between bytecodes; processes also run CPU work in parallel but
+# pickle every argument and result.
+CPU_EXECUTOR = os.environ.get("CPU_EXECUTOR", "thread")
+
+# Number of workers running CPU-bound request work
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Tasks allowed to wait for a free worker before requests are rejected with 503
+CPU_QUEUE_SIZE = int(os.environ.get("CPU_QUEUE_SIZE", 16))
+
+# Seconds a request waits for its task before it is answered with 504
+CPU_TASK_TIMEOUT = float(os.environ.get("CPU_TASK_TIMEOUT", 120))
+
+USES_PROCESSES = CPU_EXECUTOR == "process"
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+
+# Tasks submitted and not yet finished. Only touched from the event loop thread.
+_in_flight = 0
+
+
+def get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                if USES_PROCESSES:
+                    _executor = ProcessPoolExecutor(max_workers=CPU_WORKERS, initializer=reset_worker_metrics)
+                else:
+                    _executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+    return _executor
+
+
+def shutdown():
+    """
+    Stop the workers, waiting for running tasks to finish
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def _collect_metrics():
+    return [
+        ("decision_cpu_tasks_in_flight", "gauge", "Tasks running or waiting in the worker pool", _in_flight),
+        ("decision_cpu_task_capacity", "gauge", "Tasks the worker pool accepts before answering 503", CPU_WORKERS + CPU_QUEUE_SIZE),
+    ]
+
+
+metrics.register_collector(_collect_metrics)
+
+
+def _call_and_drain(func: Callable[[], Any]):
+    """
+    Run a task in a worker process and return its result together with the
+    metrics it recorded, which would otherwise stay in that process
+    """
+    return func(), metrics.drain()
+
+
+def _merge_metrics(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is None:
+        metrics.merge(future.result()[1])
+
+
+def _discard_drained(discard: Callable[[Any], None], result: Any):
+    discard(result[0])
+
+
+def _release(future: asyncio.Future):
+    global _in_flight
+    _in_flight -= 1
+
+
+def _discard_later(future: asyncio.Future, discard: Optional[Callable[[Any], None]]):
+    def callback(f: asyncio.Future):
+        if not f.cancelled() and f.exception() is None:
+            discard(f.result())
+
+    if discard is not None:
+        future.add_done_callback(callback)
+
+
+def check_capacity():
+    """
+    Raise the 503 run_cpu would if the worker pool has no room for another task
+
+    Raises:
+        HTTPException: 503 if too many tasks are already queued
+    """
+    if _in_flight >= CPU_WORKERS + CPU_QUEUE_SIZE:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+
+
+async def run_cpu(func: Callable[..., Any], *args: Any, timeout: Optional[float] = None,
+                  discard: Optional[Callable[[Any], None]] = None, **kwargs: Any) -> Any:
+    """
+    Run CPU-bound work in the worker pool without blocking the event loop
+
+    Args:
+        func: Function to run (must be picklable when CPU_EXECUTOR is "process")
+        *args, **kwargs: Arguments of the function
+        timeout: Seconds to wait for the result (default CPU_TASK_TIMEOUT)
+        discard: Called with the result of a task whose request timed out or
+            was cancelled once it finishes, e.g. to delete a file it produced
+
+    Returns:
+        The return value of the function
+
+    Raises:
+        HTTPException: 503 if too many tasks are already queued, 504 on timeout
+    """
+    global _in_flight
+    check_capacity()
+
+    loop = asyncio.get_running_loop()
+    call = partial(func, *args, **kwargs)
+    if USES_PROCESSES:
+        call = partial(_call_and_drain, call)
+        if discard is not None:
+            discard = partial(_discard_drained, discard)
+    future = loop.run_in_executor(get_executor(), call)
+    _in_flight += 1
+    # The slot is only freed once the work really finishes, even after a timeout
+    future.add_done_callback(_release)
+    if USES_PROCESSES:
+        future.add_done_callback(_merge_metrics)
+
+    try:
+        result = await asyncio.wait_for(asyncio.shield(future), timeout or CPU_TASK_TIMEOUT)
+        return result[0] if USES_PROCESSES else result
+    except asyncio.TimeoutError:
+        _discard_later(future, discard)
+        raise HTTPException(status_code=504, detail="Request timed out")
+    except asyncio.CancelledError:
+        _discard_later(future, discard)
+        raise
@@ -0,0 +1,244 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, IO, TYPE_CHECKING
+
+from fastapi import HTTPException
+
+from logic.metrics import metrics, reset_worker_metrics
+
+if TYPE_CHECKING:
+    from logic.workbook_layout import ColumnWidths
+
+# Directory holding job status files, uploads and finished workbooks
+EXPORT_SPOOL_DIR = os.environ.get("EXPORT_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "sourcing-exports"))
+
+# Number of processes building workbooks
+EXPORT_JOB_WORKERS = int(os.environ.get("EXPORT_JOB_WORKERS", 2))
+
+# Seconds a finished job and its file are kept
+EXPORT_JOB_TTL = int(os.environ.get("EXPORT_JOB_TTL", 3600))
+
+# Jobs allowed to be queued or running at once before submissions are rejected with 503
+EXPORT_JOB_QUEUE_SIZE = int(os.environ.get("EXPORT_JOB_QUEUE_SIZE", 32))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# Jobs submitted by this server process and not finished yet. Submissions
+# run in threads and jobs finish in the executor's thread, hence the lock.
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=EXPORT_JOB_WORKERS, initializer=reset_worker_metrics)
+    return _executor
+
+
+def shutdown():
+    """
+    Stop the worker processes, waiting for running jobs to finish
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def _path(job_id: str, suffix: str, spool_dir: str = EXPORT_SPOOL_DIR) -> str:
+    return os.path.join(spool_dir, f"{job_id}{suffix}")
+
+
+def _write_status(job_id: str, status: Dict[str, Any], spool_dir: str = EXPORT_SPOOL_DIR):
+    """
+    Atomically replace a job's status file, so any server process can read it
+    """
+    temp_path = _path(job_id, ".json.tmp", spool_dir)
+    with open(temp_path, "w") as f:
+        json.dump(status, f)
+    os.replace(temp_path, _path(job_id, ".json", spool_dir))
+
+
+def get_status(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the status of a job, or None if it is unknown or expired
+    """
+    if not _JOB_ID_PATTERN.match(job_id):
+        return None
+    try:
+        with open(_path(job_id, ".json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def result_path(job_id: str) -> str:
+    return _path(job_id, ".xlsx")
+
+
+def _run_job(job_id: str, status: Dict[str, Any], rows: List[tuple], widths: "ColumnWidths",
+             spool_dir: str, has_upload: bool):
+    """
+    Build a job's workbook in a worker process and move it into the spool directory
+    """
+    from logic.excel_export import write_export_workbook, write_updated_workbook
+
+    status = dict(status, status=RUNNING, started=time.time())
+    _write_status(job_id, status, spool_dir)
+
+    def report(written: int):
+        _write_status(job_id, dict(status, progress=written), spool_dir)
+
+    try:
+        part_path = _path(job_id, ".xlsx.part", spool_dir)
+        if has_upload:
+            write_updated_workbook(_path(job_id, ".upload.xlsx", spool_dir), rows, widths, progress=report, path=part_path)
+        else:
+            write_export_workbook(rows, widths, progress=report, path=part_path)
+        os.replace(_path(job_id, ".xlsx.part", spool_dir), _path(job_id, ".xlsx", spool_dir))
+        _write_status(job_id, dict(status, status=DONE, progress=len(rows), finished=time.time()), spool_dir)
+    except Exception as e:
+        _write_status(job_id, dict(status, status=FAILED, error=str(e), finished=time.time()), spool_dir)
+    finally:
+        if has_upload:
+            _remove(_path(job_id, ".upload.xlsx", spool_dir))
+    # Hand the stage timings recorded in this worker back to the server process
+    return metrics.drain()
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _release():
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+
+def _on_done(job_id: str, status: Dict[str, Any], future: Future):
+    _release()
+    # A crashed worker process never gets to record its own failure
+    exception = future.exception()
+    if exception is not None:
+        _write_status(job_id, dict(status, status=FAILED, error=str(exception), finished=time.time()))
+    else:
+        metrics.merge(future.result())
+
+
+def submit(rows: List[tuple], widths: "ColumnWidths", filename: str, upload: Optional[IO[bytes]] = None) -> Dict[str, Any]:
+    """
+    Queue a workbook build in the process pool. Copies the upload and writes
+    files, so call it from a thread rather than the event loop.
+
+    Args:
+        rows: Scored rows in HEADERS order
+        widths: Column widths of the rows
+        filename: Download filename of the finished workbook
+        upload: Existing workbook to merge the rows into, or None for a new export
+
+    Returns:
+        Dict: The initial status of the job
+
+    Raises:
+        HTTPException: 503 if EXPORT_JOB_QUEUE_SIZE jobs are already queued or running
+    """
+    global _pending
+    with _pending_lock:
+        if _pending >= EXPORT_JOB_QUEUE_SIZE:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many exports are queued, please retry shortly",
+                headers={"Retry-After": "5"}
+            )
+        _pending += 1
+
+    try:
+        os.makedirs(EXPORT_SPOOL_DIR, exist_ok=True)
+        purge_expired()
+
+        job_id = uuid.uuid4().hex
+        if upload is not None:
+            with open(_path(job_id, ".upload.xlsx"), "wb") as destination:
+                shutil.copyfileobj(upload, destination)
+
+        status = {
+            "job_id": job_id,
+            "status": QUEUED,
+            "progress": 0,
+            "total": len(rows),
+            "filename": filename,
+            "created": time.time(),
+        }
+        _write_status(job_id, status)
+
+        future = _get_executor().submit(_run_job, job_id, status, rows, widths, EXPORT_SPOOL_DIR, upload is not None)
+    except BaseException:
+        _release()
+        raise
+    future.add_done_callback(lambda f: _on_done(job_id, status, f))
+    return status
+
+
+def _collect_metrics():
+    return [
+        ("decision_export_jobs_pending", "gauge", "Export jobs queued or running", _pending),
+        ("decision_export_job_capacity", "gauge", "Export jobs accepted before answering 503", EXPORT_JOB_QUEUE_SIZE),
+    ]
+
+
+metrics.register_collector(_collect_metrics)
+
+
+def purge_expired(now: Optional[float] = None):
+    """
+    Delete jobs that finished more than EXPORT_JOB_TTL seconds ago, together
+    with leftovers of jobs whose status has not changed for that long
+    (e.g. from an earlier server run)
+    """
+    now = now or time.time()
+    try:
+        names = os.listdir(EXPORT_SPOOL_DIR)
+    except FileNotFoundError:
+        return
+
+    files_by_job: Dict[str, List[str]] = {}
+    for name in names:
+        job_id = name.split(".", 1)[0]
+        if _JOB_ID_PATTERN.match(job_id):
+            files_by_job.setdefault(job_id, []).append(os.path.join(EXPORT_SPOOL_DIR, name))
+
+    for job_id, paths in files_by_job.items():
+        status = get_status(job_id)
+        if status is not None and status["status"] in (DONE, FAILED):
+            expired = now - status["finished"] > EXPORT_JOB_TTL
+        else:
+            try:
+                expired = now - max(os.path.getmtime(path) for path in paths) > EXPORT_JOB_TTL
+            except FileNotFoundError:
+                continue
+        if expired:
+            for path in paths:
+                _remove(path)
@@ -0,0 +1,200 @@
+import os
+from contextlib import closing, contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from logic.sqlite_store import DATA_DIR, SQLiteStore
+from logic.workbook_layout import HEADERS
+
+# SQLite file holding every decision made by /determine
+HISTORY_STORE_PATH = os.environ.get("HISTORY_STORE_PATH", os.path.join(DATA_DIR, "sourcing-history.sqlite3"))
+
+# Record decisions made by /determine in the history store
+RECORD_HISTORY = os.environ.get("RECORD_HISTORY", "1") == "1"
+
+# Largest page the query endpoint returns
+MAX_PAGE_SIZE = 1000
+
+# Columns of a history row, in the column order of the decision sheets
+COLUMNS = tuple(HEADERS)
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS decision_history (id INTEGER PRIMARY KEY, "
+    + ", ".join(f"{column} TEXT" for column in COLUMNS)
+    + ")",
+    "CREATE INDEX IF NOT EXISTS decision_history_activity_name ON decision_history (activity_name, id)",
+    "CREATE INDEX IF NOT EXISTS decision_history_timestamp ON decision_history (timestamp, id)",
+)
+
+_INSERT = f"INSERT INTO decision_history ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+# Rows of appender() wait in a temporary table until the block completes
+_CREATE_STAGED = f"CREATE TEMP TABLE staged_history ({', '.join(f'{column} TEXT' for column in COLUMNS)})"
+
+_INSERT_STAGED = f"INSERT INTO staged_history VALUES ({', '.join('?' * len(COLUMNS))})"
+
+_COPY_STAGED = (
+    f"INSERT INTO decision_history ({', '.join(COLUMNS)}) "
+    f"SELECT {', '.join(COLUMNS)} FROM staged_history ORDER BY rowid"
+)
+
+_SELECT = f"SELECT id, {', '.join(COLUMNS)} FROM decision_history"
+
+# Filters of queries and exports: column -> SQL condition on it
+_FILTERS = {
+    "activity_name": "activity_name = ?",
+    "activity_type": "activity_type = ?",
+    "outcome": "outcome = ?",
+    "since": "timestamp >= ?",
+    "until": "timestamp < ?",
+}
+
+
+def _where(filters: Dict[str, Optional[str]]) -> Tuple[List[str], List[Any]]:
+    """
+    Return the SQL conditions and parameters of the filters that are set
+    """
+    conditions, params = [], []
+    for name, value in filters.items():
+        if value is not None:
+            conditions.append(_FILTERS[name])
+            params.append(value)
+    return conditions, params
+
+
+def _sql(conditions: List[str]) -> str:
+    return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+class HistoryStore(SQLiteStore):
+    """
+    Append-only history of decisions.
+
+    Rows are only ever inserted, so appending costs the same however long the
+    history is, and ids order them by the time they were recorded. Queries
+    page through the history by id and can filter on activity name, activity
+    type, outcome and a timestamp range; name and timestamp are indexed.
+    """
+
+    schema = _SCHEMA
+
+    def __init__(self, path: str = HISTORY_STORE_PATH):
+        super().__init__(path)
+
+    def record(self, activities: Sequence[Any], outcomes: Sequence[str], timestamp: str):
+        """
+        Append scored activities to the history
+
+        Args:
+            activities: Compact activities (logic.activity.ActivityBatch)
+            outcomes: Outcome of each activity
+            timestamp: Decision timestamp shared by all rows
+        """
+        self.record_rows(list(activities.rows(outcomes, timestamp)))
+
+    def record_rows(self, rows: Sequence[Sequence[Any]]):
+        """
+        Append rows already laid out in COLUMNS order to the history
+        """
+        if not rows:
+            return
+        with closing(self._connect()) as connection, connection:
+            connection.executemany(_INSERT, rows)
+
+    @contextmanager
+    def appender(self) -> Iterator[Callable[[Sequence[Sequence[Any]]], None]]:
+        """
+        Append rows in COLUMNS order once the block completes, so that work
+        failing part way leaves no rows behind.
+
+        Rows are staged in a temporary table of the connection meanwhile, which
+        takes no lock on the history; other writers only wait for the single
+        INSERT ... SELECT that copies them over at the end.
+        """
+        with closing(self._connect()) as connection:
+            connection.execute(_CREATE_STAGED)
+            with connection:
+                yield lambda rows: connection.executemany(_INSERT_STAGED, rows)
+            with connection:
+                connection.execute(_COPY_STAGED)
+
+    def query(self, after: Optional[int] = None, limit: int = 100, **filters: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Return one page of the history, oldest first
+
+        Args:
+            after: Id of the last row of the previous page
+            limit: Rows per page, at most MAX_PAGE_SIZE
+            **filters: activity_name, activity_type, outcome, since and until
+                (timestamps as "YYYY-MM-DD HH:MM:SS"; since is inclusive, until exclusive)
+
+        Returns:
+            Tuple of the rows (with their id) and the cursor of the next page,
+            None on the last page
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        conditions, params = _where(filters)
+        if after is not None:
+            conditions.append("id > ?")
+            params.append(after)
+        # One row more than the page tells whether there is a next page
+        sql = f"{_SELECT}{_sql(conditions)} ORDER BY id LIMIT ?"
+        with closing(self._connect()) as connection:
+            rows = connection.execute(sql, params + [limit + 1]).fetchall()
+
+        results = [dict(zip(("id",) + COLUMNS, row)) for row in rows[:limit]]
+        next_after = results[-1]["id"] if len(rows) > limit else None
+        return results, next_after
+
+    def iter_rows(self, latest: bool = False, **filters: Optional[str]) -> Iterator[tuple]:
+        """
+        Yield history rows in COLUMNS order, oldest first, without loading them all
+
+        Args:
+            latest: Only yield the latest decision of each activity name
+            **filters: As for query()
+        """
+        conditions, params = _where(filters)
+        if latest:
+            sql = (
+                f"SELECT {', '.join(COLUMNS)} FROM decision_history WHERE id IN "
+                f"(SELECT MAX(id) FROM decision_history{_sql(conditions)} GROUP BY activity_name) ORDER BY id"
+            )
+        else:
+            sql = f"SELECT {', '.join(COLUMNS)} FROM decision_history{_sql(conditions)} ORDER BY id"
+        with closing(self._connect()) as connection:
+            yield from connection.execute(sql, params)
+
+    def outcome_counts(self, period_length: int, **filters: Optional[str]) -> Iterator[Tuple[str, str, str, int]]:
+        """
+        Count decisions per activity type, period and outcome in one pass over the history
+
+        Args:
+            period_length: Length of the timestamp prefix naming a period,
+                e.g. 10 for days ("YYYY-MM-DD")
+            **filters: As for query()
+
+        Yields:
+            (activity type, period, outcome, number of decisions) of each group
+        """
+        conditions, params = _where(filters)
+        sql = (
+            f"SELECT activity_type, substr(timestamp, 1, ?), outcome, COUNT(*) "
+            f"FROM decision_history{_sql(conditions)} GROUP BY 1, 2, 3"
+        )
+        with closing(self._connect()) as connection:
+            yield from connection.execute(sql, [period_length] + params)
+
+    def max_lengths(self, **filters: Optional[str]) -> List[int]:
+        """
+        Return the length of the longest value of each column, for column widths
+        """
+        conditions, params = _where(filters)
+        sql = (
+            f"SELECT {', '.join(f'MAX(LENGTH({column}))' for column in COLUMNS)} "
+            f"FROM decision_history{_sql(conditions)}"
+        )
+        with closing(self._connect()) as connection:
+            return [length or 0 for length in connection.execute(sql, params).fetchone()]
+
+
+history_store = HistoryStore()
@@ -0,0 +1,198 @@
+import asyncio
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from logic.decision_rules import RULES
+
+# Upper bounds in seconds of the stage timing histogram buckets
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Starlette appends the charset
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4"
+
+# A collector returns (name, type, help, value) samples, e.g. cache counters
+Collector = Callable[[], Iterable[Tuple[str, str, str, float]]]
+
+# Seconds between event loop lag samples; 0 turns sampling off
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", 0.1))
+
+# perf_counter() when the current request arrived, set by StageTimingMiddleware
+_request_started: ContextVar[Optional[float]] = ContextVar("request_started", default=None)
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Metrics:
+    """
+    Rule hit counters and stage timing histograms of one process.
+
+    Recording takes a lock and a few additions, so it stays on in production.
+    Worker processes hand their counts to the server process with drain() and merge().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rule_hits = [0] * len(RULES)
+        # (handler, stage) -> count per bucket, then the +Inf bucket, then the sum
+        self._stages: Dict[Tuple[str, str], List[float]] = {}
+        self._collectors: List[Collector] = []
+
+    def record_rule_hits(self, rules: Iterable[int]):
+        """
+        Count the activities decided by each rule
+
+        Args:
+            rules: Rule code (index into RULES) of each scored activity
+        """
+        counts = Counter(rules)
+        with self._lock:
+            for rule, count in counts.items():
+                self._rule_hits[rule] += count
+
+    def observe(self, handler: str, stage: str, seconds: float):
+        """
+        Record the time one stage of a handler took
+        """
+        with self._lock:
+            series = self._stages.get((handler, stage))
+            if series is None:
+                series = self._stages[(handler, stage)] = [0] * (len(STAGE_BUCKETS) + 2)
+            series[bisect_left(STAGE_BUCKETS, seconds)] += 1
+            series[-1] += seconds
+
+    @contextmanager
+    def timer(self, handler: str, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(handler, stage, time.perf_counter() - started)
+
+    def observe_since_request(self, handler: str, stage: str):
+        """
+        Record the time since the current request arrived, e.g. the time
+        FastAPI spent receiving and validating its body before the handler ran
+        """
+        started = _request_started.get()
+        if started is not None:
+            self.observe(handler, stage, time.perf_counter() - started)
+
+    def register_collector(self, collector: Collector):
+        self._collectors.append(collector)
+
+    def drain(self) -> Dict[str, Any]:
+        """
+        Return the counts recorded since the last drain and reset them
+        """
+        with self._lock:
+            delta = {"rule_hits": self._rule_hits, "stages": self._stages}
+            self._rule_hits = [0] * len(RULES)
+            self._stages = {}
+        return delta
+
+    def merge(self, delta: Dict[str, Any]):
+        """
+        Add counts drained from another process
+        """
+        with self._lock:
+            for rule, count in enumerate(delta["rule_hits"]):
+                self._rule_hits[rule] += count
+            for key, other in delta["stages"].items():
+                series = self._stages.get(key)
+                if series is None:
+                    self._stages[key] = list(other)
+                else:
+                    for idx, value in enumerate(other):
+                        series[idx] += value
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            rule_hits = list(self._rule_hits)
+            stages = {key: list(series) for key, series in self._stages.items()}
+
+        lines = [
+            "# HELP decision_rule_hits_total Activities decided by each decision rule",
+            "# TYPE decision_rule_hits_total counter",
+        ]
+        for rule, hits in zip(RULES, rule_hits):
+            lines.append(f'decision_rule_hits_total{{rule="{_label(rule.rule_id)}",outcome="{_label(rule.outcome)}"}} {hits}')
+
+        lines.append("# HELP decision_stage_seconds Time spent in each stage of a request handler")
+        lines.append("# TYPE decision_stage_seconds histogram")
+        for (handler, stage), series in sorted(stages.items()):
+            labels = f'handler="{_label(handler)}",stage="{_label(stage)}"'
+            cumulative = 0
+            for bound, count in zip(STAGE_BUCKETS + ("+Inf",), series):
+                cumulative += count
+                lines.append(f'decision_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"decision_stage_seconds_sum{{{labels}}} {series[-1]}")
+            lines.append(f"decision_stage_seconds_count{{{labels}}} {cumulative}")
+
+        for collector in self._collectors:
+            for name, kind, description, value in collector():
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def reset_worker_metrics():
+    """
+    Initializer of worker processes: forked workers inherit the counts of the
+    server process, which must not be drained back into it a second time
+    """
+    metrics.drain()
+
+
+class StageTimingMiddleware:
+    """
+    ASGI middleware recording the total time of every request as the "total"
+    stage of its endpoint, and when it arrived for observe_since_request()
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        token = _request_started.set(started)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_started.reset(token)
+            # The router adds the matched endpoint to the scope
+            endpoint = scope.get("endpoint")
+            if endpoint is not None:
+                metrics.observe(endpoint.__name__, "total", time.perf_counter() - started)
+
+
+async def monitor_event_loop(interval: float = LOOP_LAG_INTERVAL):
+    """
+    Record how late the event loop wakes a task that sleeps for `interval`
+    seconds, as the "lag" stage of the "event_loop" handler. Work that holds
+    the loop (e.g. a large response compressed in place) delays every request
+    by that much.
+    """
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        metrics.observe("event_loop", "lag", max(0.0, time.perf_counter() - started - interval))
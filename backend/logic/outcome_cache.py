@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, NamedTuple, Sequence, Tuple
+
+from logic.activity import ActivityBatch, ActivityKey, from_models, pack, profile_of, values_of
+from logic.batch_scoring import score_profiles_with_rules
+from logic.executor import get_executor
+from logic.metrics import metrics
+from logic.outcome_table import FACTORS, FACTOR_VALUES, OUTCOMES
+
+# Maximum number of distinct factor profiles kept in the cache
+OUTCOME_CACHE_SIZE = int(os.environ.get("OUTCOME_CACHE_SIZE", 4096))
+
+
+class CachedProfile(NamedTuple):
+    outcome: str
+    # Serialized factor and outcome fields of a DecisionOutput, without braces
+    fragment: bytes
+    # Code (index into RULE_IDS) of the rule that decided the outcome
+    rule: int
+
+
+def _serialize_fragment(values: Tuple[Any, ...], outcome: str) -> bytes:
+    fields = [f"{json.dumps(factor)}:{json.dumps(value, ensure_ascii=False)}" for factor, value in zip(FACTORS, values)]
+    fields.append(f'"outcome":{json.dumps(outcome)}')
+    return ",".join(fields).encode()
+
+
+class OutcomeCache:
+    """
+    Bounded LRU cache of outcomes and serialized output fragments per factor profile.
+
+    Entries are keyed on activity keys (see logic.activity.pack): the table
+    index for activities with known values, the raw values otherwise. The
+    fragment echoes the values back, so two values that only share an outcome
+    (e.g. a "Low" and a "Medium" frequency) need their own entries.
+    """
+
+    def __init__(self, maxsize: int = OUTCOME_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[ActivityKey, CachedProfile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Sequence[ActivityKey]) -> List[CachedProfile]:
+        """
+        Look up the profiles of a batch of activities.
+        Profiles that are not cached are scored together in one batch.
+
+        Args:
+            keys: Activity keys
+
+        Returns:
+            List[CachedProfile]: The cached profile of each activity
+        """
+        found: Dict[ActivityKey, CachedProfile] = {}
+        missing: Dict[ActivityKey, None] = {}
+        with self._lock:
+            entries = self._entries
+            for key in keys:
+                if key in found or key in missing:
+                    continue
+                entry = entries.get(key)
+                if entry is None:
+                    missing[key] = None
+                    continue
+                entries.move_to_end(key)
+                found[key] = entry
+            # Repeats of an uncached profile within the batch are scored once, so count as hits
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+
+        if missing:
+            new_entries = []
+            outcome_codes, rule_codes = score_profiles_with_rules([profile_of(key) for key in missing])
+            for key, code, rule in zip(missing, outcome_codes.tolist(), rule_codes.tolist()):
+                outcome = OUTCOMES[code]
+                entry = CachedProfile(outcome, _serialize_fragment(values_of(key), outcome), rule)
+                found[key] = entry
+                new_entries.append((key, entry))
+            self._store(new_entries)
+
+        return [found[key] for key in keys]
+
+    def get_activities(self, activities: ActivityBatch) -> List[CachedProfile]:
+        """
+        Look up the profiles of a batch of compact activities
+        """
+        return self.get_many(activities.keys)
+
+    def get_models(self, models: Sequence[Any]) -> List[CachedProfile]:
+        """
+        Look up the profiles of a batch of validated request models
+        """
+        return self.get_activities(from_models(models))
+
+    def _store(self, new_entries: List[Tuple[ActivityKey, CachedProfile]]):
+        with self._lock:
+            entries = self._entries
+            for key, entry in new_entries:
+                entries[key] = entry
+                entries.move_to_end(key)
+            while len(entries) > self.maxsize:
+                entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return the hit/miss counters and current size of the cache
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+outcome_cache = OutcomeCache()
+
+
+def _collect_metrics():
+    stats = outcome_cache.stats()
+    return [
+        ("decision_outcome_cache_hits_total", "counter", "Activities whose profile was cached", stats["hits"]),
+        ("decision_outcome_cache_misses_total", "counter", "Profiles that had to be scored", stats["misses"]),
+        ("decision_outcome_cache_evictions_total", "counter", "Profiles evicted from the cache", stats["evictions"]),
+        ("decision_outcome_cache_size", "gauge", "Profiles in the cache", stats["size"]),
+    ]
+
+
+metrics.register_collector(_collect_metrics)
+
+
+def warm_up():
+    """
+    Build the outcome table, push one profile through the cache and start the
+    worker pool, so that no request pays for the first-call setup.
+    The table is built in this process first, so forked pool processes inherit it.
+    """
+    key = pack(tuple(FACTOR_VALUES[factor][0] for factor in FACTORS))
+    outcome_cache.get_many([key])
+    get_executor().submit(outcome_cache.get_many, [key]).result()
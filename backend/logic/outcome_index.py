@@ -0,0 +1,278 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from logic.batch_scoring import score_profiles_with_rules
+from logic.decision_rules import NORMALIZED_VALUES, RULES, RULE_IDS
+from logic.outcome_table import FACTORS, FACTOR_VALUES, OUTCOMES, OUTCOME_CODES, RADICES, STRIDES
+
+# File holding the outcome space index, built by `python -m logic.outcome_index`
+# or on first use when missing or built from other rules
+OUTCOME_INDEX_PATH = os.environ.get(
+    "OUTCOME_INDEX_PATH", os.path.join(tempfile.gettempdir(), "sourcing-outcome-index.bin")
+)
+
+# Largest page the profile query returns
+MAX_PAGE_SIZE = 1000
+
+MAGIC = b"SDOI"
+FORMAT_VERSION = 1
+
+# Magic, format version and length of the JSON header that follows
+_PREAMBLE = struct.Struct("<4sII")
+
+# Arrays stored after the header, in this order. Positions index the
+# profiles array; there are 20,736 profiles, so they fit in 16 bits.
+_SECTIONS = (
+    ("profiles", "<u4"),    # outcome table index of each profile, ascending
+    ("outcomes", "u1"),     # outcome code of each profile
+    ("rules", "u1"),        # rule code of each profile
+    ("by_outcome", "<u2"),  # positions of the profiles of each outcome, grouped by outcome
+    ("by_rule", "<u2"),     # positions of the profiles decided by each rule, grouped by rule
+)
+
+_ALIGNMENT = 8
+
+
+def fingerprint() -> str:
+    """
+    Hash the factor domains and rules the index is built from, so that an
+    index built from other rules is never served
+    """
+    source = json.dumps([FACTORS, FACTOR_VALUES, NORMALIZED_VALUES, RULES], sort_keys=True)
+    return hashlib.blake2b(source.encode(), digest_size=16).hexdigest()
+
+
+def canonical_profiles() -> np.ndarray:
+    """
+    Return the outcome table index of every combination of FACTOR_VALUES,
+    the values DecisionInput accepts, in ascending order
+    """
+    profiles = np.zeros(1, dtype=np.int64)
+    for factor, stride in zip(FACTORS, STRIDES):
+        codes = np.arange(len(FACTOR_VALUES[factor]), dtype=np.int64)
+        profiles = (profiles[:, None] + codes[None, :] * stride).ravel()
+    return profiles
+
+
+def build_index() -> bytes:
+    """
+    Score every profile once and lay out the index file
+
+    Returns:
+        bytes: Contents of the index file
+    """
+    profiles = canonical_profiles()
+    outcome_codes, rule_codes = score_profiles_with_rules(profiles.astype(np.int32))
+    if len(profiles) > np.iinfo(np.uint16).max + 1:
+        raise AssertionError("Profile positions no longer fit in 16 bits")
+
+    arrays = {
+        "profiles": profiles,
+        "outcomes": outcome_codes,
+        "rules": rule_codes,
+        # A stable sort keeps the profiles of each group in ascending order
+        "by_outcome": np.argsort(outcome_codes, kind="stable"),
+        "by_rule": np.argsort(rule_codes, kind="stable"),
+    }
+    header = {
+        "fingerprint": fingerprint(),
+        "factors": FACTORS,
+        "outcomes": OUTCOMES,
+        "rules": RULE_IDS,
+        "outcome_counts": np.bincount(outcome_codes, minlength=len(OUTCOMES)).tolist(),
+        "rule_counts": np.bincount(rule_codes, minlength=len(RULES)).tolist(),
+        "sections": {},
+    }
+
+    data = bytearray()
+    for name, dtype in _SECTIONS:
+        array = arrays[name].astype(dtype)
+        data.extend(b"\0" * (-len(data) % _ALIGNMENT))
+        header["sections"][name] = [len(data), len(array)]
+        data.extend(array.tobytes())
+
+    # Pad the header so the arrays stay aligned in the file
+    encoded = json.dumps(header).encode()
+    encoded += b" " * (-(_PREAMBLE.size + len(encoded)) % _ALIGNMENT)
+    return _PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(encoded)) + encoded + bytes(data)
+
+
+def write_index(path: str = OUTCOME_INDEX_PATH) -> str:
+    """
+    Build the index and write it to a file, replacing any older one atomically
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(build_index())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return path
+
+
+class OutcomeIndex:
+    """
+    Every profile of the decision space with its outcome and deciding rule,
+    plus the profiles of each outcome and of each rule.
+
+    The arrays are read straight from the index file's buffer, usually a
+    read-only memory map shared by every process that opens the file, so
+    queries never evaluate a rule.
+    """
+
+    def __init__(self, buffer):
+        if len(buffer) < _PREAMBLE.size:
+            raise ValueError("Not an outcome index")
+        magic, version, header_length = _PREAMBLE.unpack_from(buffer)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Not an outcome index of this format version")
+        header = json.loads(bytes(buffer[_PREAMBLE.size:_PREAMBLE.size + header_length]))
+        if header["fingerprint"] != fingerprint():
+            raise ValueError("The outcome index was built from other rules")
+
+        self._buffer = buffer
+        start = _PREAMBLE.size + header_length
+        for name, dtype in _SECTIONS:
+            offset, count = header["sections"][name]
+            setattr(self, name, np.frombuffer(buffer, dtype=dtype, count=count, offset=start + offset))
+        self.outcome_counts: List[int] = header["outcome_counts"]
+        self.rule_counts: List[int] = header["rule_counts"]
+        self._outcome_starts = np.concatenate(([0], np.cumsum(self.outcome_counts))).tolist()
+        self._rule_starts = np.concatenate(([0], np.cumsum(self.rule_counts))).tolist()
+
+    @classmethod
+    def open(cls, path: str = OUTCOME_INDEX_PATH) -> "OutcomeIndex":
+        """
+        Memory-map an index file
+
+        Raises:
+            OSError: If the file cannot be read
+            ValueError: If it is not an index of the current rules
+        """
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Return how many profiles lead to each outcome and are decided by each rule.
+        Rules that decide no profile never fire for input DecisionInput accepts:
+        earlier rules already decide every case they match.
+        """
+        return {
+            "profiles": len(self.profiles),
+            "outcomes": dict(zip(OUTCOMES, self.outcome_counts)),
+            "rules": [
+                {"rule": rule.rule_id, "outcome": rule.outcome, "profiles": count}
+                for rule, count in zip(RULES, self.rule_counts)
+            ],
+            "unreachable_rules": [rule_id for rule_id, count in zip(RULE_IDS, self.rule_counts) if not count],
+        }
+
+    def query(self, outcome: Optional[str] = None, rule: Optional[str] = None, offset: int = 0,
+              limit: int = 100, **factors: Optional[str]) -> Tuple[int, List[Dict[str, str]]]:
+        """
+        List the profiles with an outcome or rule whose factors match the given values
+
+        Args:
+            outcome: Only profiles leading to this outcome
+            rule: Only profiles decided by this rule id
+            offset: Matching profiles to skip
+            limit: Profiles to return, at most MAX_PAGE_SIZE
+            **factors: Factor values the profiles must have; None matches any value
+
+        Returns:
+            Tuple of the number of matching profiles and one page of them, with
+            their factor values, outcome and rule, in table index order
+
+        Raises:
+            ValueError: If the outcome, rule or a factor value is unknown
+        """
+        if rule is not None:
+            if rule not in RULE_IDS:
+                raise ValueError(f"Unknown rule: {rule}")
+            code = RULE_IDS.index(rule)
+            positions = self.by_rule[self._rule_starts[code]:self._rule_starts[code + 1]]
+            if outcome is not None and outcome != RULES[code].outcome:
+                positions = positions[:0]
+        elif outcome is not None:
+            if outcome not in OUTCOME_CODES:
+                raise ValueError(f"Unknown outcome: {outcome}")
+            code = OUTCOME_CODES[outcome]
+            positions = self.by_outcome[self._outcome_starts[code]:self._outcome_starts[code + 1]]
+        else:
+            positions = np.arange(len(self.profiles))
+
+        profiles = self.profiles[positions].astype(np.int64)
+        for factor, value in factors.items():
+            if value is None:
+                continue
+            idx = FACTORS.index(factor)
+            if value not in FACTOR_VALUES[factor]:
+                raise ValueError(f"Unknown value of {factor}: {value!r}")
+            matches = profiles // STRIDES[idx] % RADICES[idx] == FACTOR_VALUES[factor].index(value)
+            positions, profiles = positions[matches], profiles[matches]
+
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        page = positions[offset:offset + limit]
+        codes = self.profiles[page].astype(np.int64)[:, None] // np.array(STRIDES) % np.array(RADICES)
+        results = []
+        for profile_codes, outcome_code, rule_code in zip(
+            codes.tolist(), self.outcomes[page].tolist(), self.rules[page].tolist()
+        ):
+            result = {factor: FACTOR_VALUES[factor][code] for factor, code in zip(FACTORS, profile_codes)}
+            result["outcome"] = OUTCOMES[outcome_code]
+            result["rule"] = RULE_IDS[rule_code]
+            results.append(result)
+        return len(positions), results
+
+
+_index: Optional[OutcomeIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> OutcomeIndex:
+    """
+    Return the outcome index, memory-mapping OUTCOME_INDEX_PATH on first use.
+    A missing or stale file is rebuilt; if it cannot be written, the index is
+    kept in memory instead.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    _index = OutcomeIndex.open()
+                except (OSError, ValueError):
+                    try:
+                        _index = OutcomeIndex.open(write_index())
+                    except OSError:
+                        _index = OutcomeIndex(build_index())
+    return _index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the outcome space index of the decision rules")
+    parser.add_argument("--output", default=OUTCOME_INDEX_PATH, help=f"index file (default {OUTCOME_INDEX_PATH})")
+    args = parser.parse_args()
+
+    index = OutcomeIndex.open(write_index(args.output))
+    summary = index.summary()
+    print(f"Wrote {os.path.getsize(args.output)} bytes to {args.output}: {summary['profiles']} profiles")
+    for outcome, count in summary["outcomes"].items():
+        print(f"  {outcome}: {count}")
+    if summary["unreachable_rules"]:
+        print(f"Rules that decide no profile: {', '.join(summary['unreachable_rules'])}")
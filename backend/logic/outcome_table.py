@@ -0,0 +1,223 @@
+import threading
+from itertools import product
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from logic.decision_rules import RULES, RULE_IDS, evaluate_rules_in_order, get_compiled_rules
+
+# Factor order used to encode a profile. The last factor varies fastest.
+FACTORS = (
+    "business_case", "core", "legal_requirement", "risks", "risk_tolerance",
+    "frequency", "specialised_skill", "similarity_with_current_scopes",
+    "skill_capacity", "duration", "affordability", "strategic_fit"
+)
+
+# Every value a factor is compared against in determine_outcome
+FACTOR_VALUES = {
+    "business_case": ("Yes", "No"),
+    "core": ("Yes", "No"),
+    "legal_requirement": ("Yes", "No", ""),
+    "risks": ("Yes", "No", ""),
+    "risk_tolerance": ("Outside", "Inside", ""),
+    "frequency": ("High", "Low"),
+    "specialised_skill": ("Yes", "No"),
+    "similarity_with_current_scopes": ("Yes", "No"),
+    "skill_capacity": ("Yes", "No"),
+    "duration": ("Short", "Long"),
+    "affordability": ("Yes", "No"),
+    "strategic_fit": ("Yes", "No", ""),
+}
+
+# determine_outcome remaps frequency and specialised_skill, so any value other
+# than "High"/"Yes" behaves exactly like "Low"/"No"
+COLLAPSED_VALUES = {
+    "frequency": "Low",
+    "specialised_skill": "No",
+}
+
+OUTCOMES = (
+    "Eliminate",
+    "Current Outsource",
+    "New Outsource",
+    "Insource or create in-house capacity",
+    "Requires Further Analysis",
+)
+
+OUTCOME_CODES = {outcome: code for code, outcome in enumerate(OUTCOMES)}
+
+
+
+def _build_codes():
+    """
+    Build the value -> code mapping, fallback code and radix of every factor.
+
+    Values that determine_outcome never compares against all behave the same
+    way, so they share one extra "other" code (or the collapsed value's code
+    for frequency and specialised_skill).
+    """
+    codes = []
+    fallbacks = []
+    radices = []
+    for factor in FACTORS:
+        values = FACTOR_VALUES[factor]
+        mapping = {value: code for code, value in enumerate(values)}
+        if factor in COLLAPSED_VALUES:
+            fallback = mapping[COLLAPSED_VALUES[factor]]
+            radix = len(values)
+        else:
+            fallback = len(values)
+            radix = len(values) + 1
+        codes.append(mapping)
+        fallbacks.append(fallback)
+        radices.append(radix)
+    return codes, fallbacks, radices
+
+
+FACTOR_CODES, FALLBACK_CODES, RADICES = _build_codes()
+
+# Mixed-radix strides, so that profile = sum(code * stride)
+STRIDES = []
+_stride = 1
+for _radix in reversed(RADICES):
+    STRIDES.insert(0, _stride)
+    _stride *= _radix
+TABLE_SIZE = _stride
+
+_ENCODERS = tuple(zip(FACTORS, FACTOR_CODES, FALLBACK_CODES, STRIDES))
+
+_table: Optional[bytearray] = None
+_rule_table: Optional[bytearray] = None
+_table_lock = threading.Lock()
+
+
+def encode_profile(data: Dict[str, Any]) -> int:
+    """
+    Encode the decision factors of an activity into its table index
+
+    Args:
+        data: Dictionary containing the decision factors
+
+    Returns:
+        int: Index of the factor combination in the outcome table
+    """
+    profile = 0
+    for factor, codes, fallback, stride in _ENCODERS:
+        profile += codes.get(data.get(factor, ""), fallback) * stride
+    return profile
+
+
+def representative_values(factor: str) -> List[Any]:
+    """
+    Return one input value per code of a factor, in code order.
+
+    None stands in for the "other" code since it never equals a compared value.
+    """
+    values = list(FACTOR_VALUES[factor])
+    if factor not in COLLAPSED_VALUES:
+        values.append(None)
+    return values
+
+
+def _build_tables() -> Tuple[bytearray, bytearray]:
+    """
+    Evaluate the compiled decision rules for every factor combination at once,
+    splitting the combinations at each node of the decision graph
+    """
+    values = [representative_values(factor) for factor in FACTORS]
+    factor_indexes = {factor: idx for idx, factor in enumerate(FACTORS)}
+    # Rule codes are indexes into RULES
+    rules = np.empty(TABLE_SIZE, dtype=np.uint8)
+
+    pending = [(get_compiled_rules().root, np.arange(TABLE_SIZE, dtype=np.int32))]
+    while pending:
+        node, profiles = pending.pop()
+        if node.__class__ is not tuple:
+            rules[profiles] = node
+            continue
+        factor, branches, default = node
+        idx = factor_indexes[factor]
+        codes = profiles // STRIDES[idx] % RADICES[idx]
+        for code, value in enumerate(values[idx]):
+            pending.append((branches.get(value, default), profiles[codes == code]))
+
+    rule_outcomes = np.array([OUTCOME_CODES[rule.outcome] for rule in RULES], dtype=np.uint8)
+    return bytearray(rule_outcomes[rules].tobytes()), bytearray(rules.tobytes())
+
+
+def _ensure_tables():
+    global _table, _rule_table
+    with _table_lock:
+        if _table is None:
+            table, rule_table = _build_tables()
+            # Readers only check _table, so the rule table must be in place first
+            _rule_table = rule_table
+            _table = table
+
+
+def get_table() -> bytearray:
+    """
+    Return the outcome table, building it on first use
+
+    Returns:
+        bytearray: Outcome code for every encoded factor combination
+    """
+    if _table is None:
+        _ensure_tables()
+    return _table
+
+
+def get_rule_table() -> bytearray:
+    """
+    Return the rule table, building it on first use
+
+    Returns:
+        bytearray: Code (index into RULE_IDS) of the rule that decides every
+            encoded factor combination
+    """
+    if _table is None:
+        _ensure_tables()
+    return _rule_table
+
+
+def verify_table() -> int:
+    """
+    Check the outcome and rule tables against the decision rules for every
+    factor combination.
+
+    Unrecognised values are fed in as a string rather than None, which also
+    checks that they really all share the same outcome.
+
+    Returns:
+        int: Number of combinations checked
+
+    Raises:
+        AssertionError: If any combination disagrees
+    """
+    domains = []
+    for factor in FACTORS:
+        values = representative_values(factor)
+        if factor in COLLAPSED_VALUES:
+            values.append("Unrecognised")
+        else:
+            values[-1] = "Unrecognised"
+        domains.append(values)
+
+    table, rule_table = get_table(), get_rule_table()
+    checked = 0
+    for combination in product(*domains):
+        data = dict(zip(FACTORS, combination))
+        expected_rule, expected = evaluate_rules_in_order(data)
+        profile = encode_profile(data)
+        actual = OUTCOMES[table[profile]]
+        if actual != expected:
+            raise AssertionError(f"Outcome table mismatch for {data}: {actual} != {expected}")
+        actual_rule = RULE_IDS[rule_table[profile]]
+        if actual_rule != expected_rule:
+            raise AssertionError(f"Rule table mismatch for {data}: {actual_rule} != {expected_rule}")
+        checked += 1
+    return checked
+
+
+if __name__ == "__main__":
+    print(f"Outcome table matches determine_outcome for {verify_table()} combinations")
@@ -0,0 +1,272 @@
+import csv
+import os
+import tempfile
+from contextlib import nullcontext
+from itertools import islice, repeat
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import openpyxl
+
+from logic.batch_scoring import score_columns_with_rules
+from logic.excel_export import write_export_workbook
+from logic.history_store import RECORD_HISTORY, history_store
+from logic.metrics import metrics
+from logic.outcome_table import FACTORS, FACTOR_VALUES, OUTCOMES
+from logic.workbook_layout import HEADERS, HEADERS_DICT, HEADER_TITLES, MAIN_SHEET, OUTCOME_COLUMN, ColumnWidths
+
+# Rows parsed and scored together
+IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", 10000))
+
+CSV = "csv"
+XLSX = "xlsx"
+
+CSV_MEDIA_TYPE = "text/csv"
+
+# Columns read from a file, in HEADERS order; outcome and timestamp are recomputed
+INPUT_COLUMNS = HEADERS[:OUTCOME_COLUMN]
+
+# Columns a file must have, as DecisionInput has no default for them
+REQUIRED_COLUMNS = (
+    "business_case", "core", "frequency", "specialised_skill",
+    "similarity_with_current_scopes", "skill_capacity", "duration", "affordability",
+)
+
+# Invalid values listed in the error of a rejected file
+MAX_REPORTED_ERRORS = 20
+
+# Value of a missing column or an empty activity name, as in DecisionInput
+DEFAULT_VALUES = {"activity_name": "Unnamed Activity"}
+
+# Header -> column, matched without case or surrounding spaces ("Core " and "core" both work)
+_HEADER_NAMES = {}
+for _column in INPUT_COLUMNS:
+    _HEADER_NAMES[_column] = _column
+    _HEADER_NAMES[HEADERS_DICT[_column].strip().lower()] = _column
+
+_OUTCOME_LABELS = list(OUTCOMES)
+
+
+class PortfolioImportError(ValueError):
+    """
+    The uploaded file cannot be read as a portfolio
+    """
+
+
+def file_kind(filename: Optional[str]) -> str:
+    """
+    Return CSV or XLSX from the extension of an uploaded file
+
+    Raises:
+        PortfolioImportError: If the file is neither
+    """
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension == ".csv":
+        return CSV
+    if extension in (".xlsx", ".xlsm"):
+        return XLSX
+    raise PortfolioImportError(f"Unsupported file type {extension or '(none)'}: upload a .csv or .xlsx file")
+
+
+def map_columns(header: Sequence[Any]) -> Dict[str, int]:
+    """
+    Map the header row of a file to the position of each input column
+
+    Args:
+        header: Header cells, named as export_to_excel names them or by field name
+
+    Returns:
+        Dict[str, int]: Position of each input column found in the header
+
+    Raises:
+        PortfolioImportError: If a required column is missing
+    """
+    positions: Dict[str, int] = {}
+    for idx, title in enumerate(header):
+        if title is None:
+            continue
+        column = _HEADER_NAMES.get(str(title).strip().lower())
+        if column is not None and column not in positions:
+            positions[column] = idx
+
+    missing = [HEADERS_DICT[column] for column in REQUIRED_COLUMNS if column not in positions]
+    if missing:
+        raise PortfolioImportError(f"Missing columns: {', '.join(repr(title) for title in missing)}")
+    return positions
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if value.__class__ is str:
+        return value
+    return str(value)
+
+
+def check_values(columns: Dict[str, List[str]], row_numbers: Sequence[int]):
+    """
+    Check that every factor holds one of its allowed values, as DecisionInput does
+
+    Args:
+        columns: Values of each input column
+        row_numbers: Row of the file each value came from
+
+    Raises:
+        PortfolioImportError: Listing the first MAX_REPORTED_ERRORS invalid values
+    """
+    errors = []
+    for factor in FACTORS:
+        allowed = FACTOR_VALUES[factor]
+        for row_number, value in zip(row_numbers, columns[factor]):
+            if value not in allowed:
+                errors.append((row_number, factor, value))
+    if errors:
+        errors.sort()
+        details = "; ".join(
+            f"row {row_number}, {HEADERS_DICT[factor].strip()!r}: {value!r} is not one of "
+            f"{', '.join(repr(allowed) for allowed in FACTOR_VALUES[factor])}"
+            for row_number, factor, value in errors[:MAX_REPORTED_ERRORS]
+        )
+        more = f" (and {len(errors) - MAX_REPORTED_ERRORS} more)" if len(errors) > MAX_REPORTED_ERRORS else ""
+        raise PortfolioImportError(f"Invalid values: {details}{more}")
+
+
+def _iter_columns(rows: Iterator[Sequence[Any]], chunk_size: int) -> Iterator[Dict[str, List[str]]]:
+    """
+    Read the header of a file, then yield its rows as columns chunk by chunk
+    """
+    header = next(rows, None)
+    if header is None:
+        raise PortfolioImportError("The file is empty")
+    positions = map_columns(header)
+
+    # Rows are numbered as a spreadsheet shows them, the header being row 1
+    numbered = enumerate(rows, 2)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return
+        # Skip blank lines and rows, which spreadsheets often leave at the end
+        chunk = [(number, row) for number, row in chunk if any(value not in (None, "") for value in row)]
+        if not chunk:
+            continue
+        row_numbers = [number for number, _ in chunk]
+        chunk = [row for _, row in chunk]
+        columns = {}
+        for column in INPUT_COLUMNS:
+            position = positions.get(column)
+            if position is None:
+                values = [DEFAULT_VALUES.get(column, "")] * len(chunk)
+            else:
+                values = [_cell(row[position]) if position < len(row) else "" for row in chunk]
+                default = DEFAULT_VALUES.get(column)
+                if default is not None:
+                    values = [value or default for value in values]
+            columns[column] = values
+        check_values(columns, row_numbers)
+        yield columns
+
+
+def _score_chunk(columns: Dict[str, List[str]], timestamp: str,
+                 append: Optional[Callable[[List[tuple]], None]]) -> List[tuple]:
+    """
+    Score a chunk of activities in one pass and lay them out as rows in HEADERS order
+    """
+    with metrics.timer("import_portfolio", "score"):
+        outcome_codes, rule_codes = score_columns_with_rules({factor: columns[factor] for factor in FACTORS})
+        metrics.record_rule_hits(rule_codes.tolist())
+        outcomes = [_OUTCOME_LABELS[code] for code in outcome_codes.tolist()]
+        rows = list(zip(*[columns[column] for column in INPUT_COLUMNS], outcomes, repeat(timestamp)))
+    if append is not None:
+        with metrics.timer("import_portfolio", "record"):
+            append(rows)
+    return rows
+
+
+def _read_rows(path: str, kind: str) -> Tuple[Iterator[Sequence[Any]], Any]:
+    """
+    Open an uploaded file and return an iterator over its rows and the object to close
+    """
+    if kind == CSV:
+        f = open(path, newline="", encoding="utf-8-sig")
+        sample = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            # Spreadsheets save CSV with ";" or tabs in some locales
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        return csv.reader(f, dialect), f
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    sheet = wb[MAIN_SHEET] if MAIN_SHEET in wb.sheetnames else wb.worksheets[0]
+    return sheet.iter_rows(values_only=True), wb
+
+
+def score_file(path: str, kind: str, timestamp: str, chunk_size: int = IMPORT_CHUNK_SIZE) -> str:
+    """
+    Score every activity of an uploaded CSV or XLSX portfolio
+
+    Rows are parsed and scored chunk by chunk straight from the file's
+    columns, without a request model per activity. A CSV is scored into a
+    CSV with outcome and timestamp columns, written as each chunk is scored;
+    an XLSX into the workbook export_to_excel returns.
+
+    Args:
+        path: Path of the uploaded file
+        kind: CSV or XLSX
+        timestamp: Decision timestamp shared by all rows
+        chunk_size: Rows parsed and scored together
+
+    Returns:
+        str: Path of the scored file
+
+    Raises:
+        PortfolioImportError: If the file is empty, cannot be parsed, lacks
+            required columns or holds values that are not allowed. Nothing is
+            recorded in the history then.
+    """
+    try:
+        rows, source = _read_rows(path, kind)
+    except Exception as e:
+        # openpyxl raises all kinds of errors for files that are not workbooks
+        raise PortfolioImportError(f"Cannot read the file as {kind.upper()}: {e}")
+
+    try:
+        with history_store.appender() if RECORD_HISTORY else nullcontext() as append:
+            chunks = _iter_columns(rows, chunk_size)
+            if kind == CSV:
+                return _write_csv(chunks, timestamp, append)
+            return _write_xlsx(chunks, timestamp, append)
+    except (UnicodeError, csv.Error) as e:
+        raise PortfolioImportError(f"Cannot read the file as {kind.upper()}: {e}")
+    finally:
+        source.close()
+
+
+def _write_csv(chunks: Iterable[Dict[str, List[str]]], timestamp: str, append) -> str:
+    fd, output = tempfile.mkstemp(suffix=".csv")
+    try:
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADER_TITLES)
+            for columns in chunks:
+                rows = _score_chunk(columns, timestamp, append)
+                with metrics.timer("import_portfolio", "write_rows"):
+                    writer.writerows(rows)
+    except BaseException:
+        os.remove(output)
+        raise
+    return output
+
+
+def _write_xlsx(chunks: Iterable[Dict[str, List[str]]], timestamp: str, append) -> str:
+    # Write-only sheets need their column widths before the first row, so the
+    # rows are collected (as compact tuples) before the workbook is written
+    widths = ColumnWidths()
+    rows: List[tuple] = []
+    for columns in chunks:
+        chunk = _score_chunk(columns, timestamp, append)
+        outcomes = [row[OUTCOME_COLUMN] for row in chunk]
+        widths.observe_columns([columns[column] for column in INPUT_COLUMNS] + [outcomes, (timestamp,)])
+        rows.extend(chunk)
+    return write_export_workbook(rows, widths)
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+from collections import Counter
+from contextlib import closing
+from typing import Any, Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+from logic.sqlite_store import DATA_DIR, SQLiteStore
+
+# SQLite file holding the last scored state of each portfolio
+PORTFOLIO_STORE_PATH = os.environ.get("PORTFOLIO_STORE_PATH", os.path.join(DATA_DIR, "sourcing-portfolios.sqlite3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS portfolio_activities (
+    portfolio_id TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    activity_name TEXT NOT NULL,
+    occurrence INTEGER NOT NULL,
+    activity_hash BLOB NOT NULL,
+    outcome TEXT NOT NULL,
+    scored_at TEXT NOT NULL,
+    PRIMARY KEY (portfolio_id, scope, activity_name, occurrence)
+) WITHOUT ROWID
+"""
+
+# Endpoints keep separate state for the same portfolio id: what was last
+# returned to the client is not what was last appended to its workbook
+DETERMINE_SCOPE = "determine"
+UPDATE_EXCEL_SCOPE = "update_excel"
+
+# An activity is identified within its portfolio by its name and, for
+# repeated names, how many activities of that name came before it
+ActivityId = Tuple[str, int]
+
+
+class AmbiguousActivityError(ValueError):
+    """
+    A partial submission names an activity whose name is repeated in the portfolio
+    """
+
+
+class PortfolioDelta(NamedTuple):
+    # Indexes of the submitted activities that are new or changed
+    changed: List[int]
+    keys: List[ActivityId]
+    hashes: List[bytes]
+    # Stored activities that are no longer part of the portfolio
+    removed: List[ActivityId]
+    unchanged: int
+    # Stored outcome and scoring time of each unchanged activity, by index
+    kept: Dict[int, Tuple[str, str]]
+
+
+def activity_hash(activity_type: str, values: Tuple[Any, ...]) -> bytes:
+    """
+    Hash the fields of an activity that affect its row: its type and factor values
+    """
+    values = json.dumps([activity_type, *values], ensure_ascii=False)
+    return hashlib.blake2b(values.encode(), digest_size=16).digest()
+
+
+def activity_keys(names: Sequence[str]) -> List[ActivityId]:
+    """
+    Return the (name, occurrence) key of each activity
+    """
+    seen: Dict[str, int] = {}
+    keys = []
+    for name in names:
+        occurrence = seen.get(name, 0)
+        seen[name] = occurrence + 1
+        keys.append((name, occurrence))
+    return keys
+
+
+class PortfolioStore(SQLiteStore):
+    """
+    Last scored state of each portfolio.
+
+    Only a hash and the outcome of each activity are stored: enough to tell
+    which activities of a resubmitted portfolio changed since it was last
+    scored, so that only those are scored again.
+    """
+
+    schema = (_SCHEMA,)
+
+    def __init__(self, path: str = PORTFOLIO_STORE_PATH):
+        super().__init__(path)
+
+    def diff(self, portfolio_id: str, scope: str, activities: Any, partial: bool = False,
+             removed_names: Iterable[str] = ()) -> PortfolioDelta:
+        """
+        Compare submitted activities with the last scored state of a portfolio
+
+        Args:
+            portfolio_id: Id the client chose for the portfolio
+            scope: Endpoint whose state to compare with, DETERMINE_SCOPE or UPDATE_EXCEL_SCOPE
+            activities: Submitted activities (logic.activity.ActivityBatch)
+            partial: True if only new and changed activities were submitted; the
+                others are kept. False if the whole portfolio was submitted, so
+                that stored activities missing from it are removed.
+            removed_names: Names of activities to remove from a partial submission
+
+        Returns:
+            PortfolioDelta: The activities to score and the ones to remove
+
+        Raises:
+            AmbiguousActivityError: If a partial submission holds an activity
+                whose name is repeated in it or in the stored portfolio, as
+                there is no telling which of the repeated activities it is
+        """
+        keys = activity_keys(activities.names)
+        with closing(self._connect()) as connection:
+            stored = {
+                (name, occurrence): (digest, outcome, scored_at)
+                for name, occurrence, digest, outcome, scored_at in connection.execute(
+                    "SELECT activity_name, occurrence, activity_hash, outcome, scored_at FROM portfolio_activities "
+                    "WHERE portfolio_id = ? AND scope = ?",
+                    (portfolio_id, scope),
+                )
+            }
+
+        if partial:
+            stored_counts = Counter(name for name, _ in stored)
+            ambiguous = sorted({name for name, occurrence in keys if occurrence > 0 or stored_counts[name] > 1})
+            if ambiguous:
+                raise AmbiguousActivityError(
+                    "Activities whose name is repeated in the portfolio can only be resubmitted "
+                    f"with the whole portfolio: {', '.join(ambiguous[:10])}"
+                )
+
+        changed, changed_keys, hashes = [], [], []
+        kept = {}
+        for idx, key in enumerate(keys):
+            digest = activity_hash(activities.types[idx], activities.values(idx))
+            previous = stored.get(key)
+            if previous is None or previous[0] != digest:
+                changed.append(idx)
+                changed_keys.append(key)
+                hashes.append(digest)
+            else:
+                kept[idx] = previous[1:]
+
+        if partial:
+            names = set(removed_names)
+            removed = [key for key in stored if key[0] in names]
+        else:
+            submitted = set(keys)
+            removed = [key for key in stored if key not in submitted]
+
+        return PortfolioDelta(changed, changed_keys, hashes, removed, len(activities) - len(changed), kept)
+
+    def save(self, portfolio_id: str, scope: str, delta: PortfolioDelta, outcomes: Sequence[str], timestamp: str):
+        """
+        Record the outcomes of the changed activities and drop the removed ones
+
+        Args:
+            portfolio_id: Id the client chose for the portfolio
+            scope: Endpoint whose state to update, DETERMINE_SCOPE or UPDATE_EXCEL_SCOPE
+            delta: Result of diff() for the same submission
+            outcomes: Outcome of each changed activity, in delta order
+            timestamp: When the activities were scored
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.executemany(
+                "DELETE FROM portfolio_activities "
+                "WHERE portfolio_id = ? AND scope = ? AND activity_name = ? AND occurrence = ?",
+                [(portfolio_id, scope, name, occurrence) for name, occurrence in delta.removed],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO portfolio_activities VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (portfolio_id, scope, name, occurrence, digest, outcome, timestamp)
+                    for (name, occurrence), digest, outcome in zip(delta.keys, delta.hashes, outcomes)
+                ],
+            )
+
+    def forget(self, portfolio_id: str) -> int:
+        """
+        Drop the stored state of a portfolio for every endpoint, so that it is
+        scored in full next time
+
+        Returns:
+            int: Number of activities dropped
+        """
+        with closing(self._connect()) as connection, connection:
+            return connection.execute(
+                "DELETE FROM portfolio_activities WHERE portfolio_id = ?", (portfolio_id,)
+            ).rowcount
+
+
+portfolio_store = PortfolioStore()
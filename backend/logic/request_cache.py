@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple, TypeVar
+
+from logic.metrics import metrics
+
+# Seconds a scored request is reused for
+REQUEST_CACHE_TTL = float(os.environ.get("REQUEST_CACHE_TTL", 300))
+
+# Bytes of scored requests kept at most; 0 turns caching off, though
+# concurrent identical requests are still coalesced
+REQUEST_CACHE_BYTES = int(os.environ.get("REQUEST_CACHE_BYTES", 64 * 1024 * 1024))
+
+T = TypeVar("T")
+
+# Estimated bytes per activity of a scored request, besides its strings:
+# a slot in each of the batch's three lists and in the profiles list, plus
+# the name and type string headers
+_ACTIVITY_OVERHEAD = 4 * 8 + 2 * 49
+
+
+class ScoredRequest(NamedTuple):
+    # Compact activities of the request (logic.activity.ActivityBatch)
+    activities: Any
+    # Cached profile of each activity (logic.outcome_cache.CachedProfile), shared with the outcome cache
+    profiles: List[Any]
+
+    def size(self) -> int:
+        """
+        Estimate the memory held by this entry
+        """
+        activities = self.activities
+        strings = sum(map(len, activities.names)) + sum(map(len, activities.types))
+        return strings + _ACTIVITY_OVERHEAD * len(activities)
+
+
+def request_key(canonical: bytes) -> bytes:
+    """
+    Hash the canonical encoding of a request: its validated inputs dumped
+    with every field in model order, so key order, whitespace and omitted
+    defaults in the submitted JSON do not matter
+    """
+    return hashlib.blake2b(canonical, digest_size=16).digest()
+
+
+class RequestCache:
+    """
+    Scored requests by key, evicted after REQUEST_CACHE_TTL seconds or least
+    recently used first once they hold more than REQUEST_CACHE_BYTES.
+
+    Only the scoring is cached: each request still records and timestamps
+    its own decisions. Identical requests that arrive while one is in flight
+    wait for it instead of doing the same work again. Only touched from the
+    event loop, so it needs no lock.
+    """
+
+    def __init__(self, max_bytes: int = REQUEST_CACHE_BYTES, ttl: float = REQUEST_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        # key -> (expiry time, size, entry)
+        self._entries: "OrderedDict[bytes, Tuple[float, int, ScoredRequest]]" = OrderedDict()
+        # coalesce() key -> task in flight
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    def get(self, key: bytes) -> Optional[ScoredRequest]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires, size, entry = item
+        if expires < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: bytes, entry: ScoredRequest):
+        """
+        Store a scored request, replacing any entry of the same key, and
+        evict entries until the cache fits in its byte bound again
+        """
+        if key in self._entries:
+            self._remove(key)
+        size = entry.size()
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, size, entry)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: bytes):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    async def get_or_score(self, key: bytes, score: Callable[[], Awaitable[ScoredRequest]]) -> ScoredRequest:
+        """
+        Return the scored request of a key, scoring it only if it is neither
+        cached nor already being scored
+
+        Args:
+            key: request_key() of the request
+            score: Coroutine function scoring the request, e.g. in the worker pool
+        """
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        return await self.coalesce(key, lambda: self._score(key, score))
+
+    async def _score(self, key: bytes, score: Callable[[], Awaitable[ScoredRequest]]) -> ScoredRequest:
+        self.misses += 1
+        entry = await score()
+        self.put(key, entry)
+        return entry
+
+    async def coalesce(self, key: Hashable, run: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run a coroutine function unless a call with the same key is in flight,
+        in which case wait for that call's result instead
+
+        Args:
+            key: Identifies the work, e.g. a request key; keys of different
+                kinds of work must not collide
+            run: Coroutine function doing the work
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run(key, run))
+            # A failure nobody is left waiting for must not be logged as unretrieved
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._in_flight[key] = task
+        else:
+            self.coalesced += 1
+        # A waiter that is cancelled (its client went away) leaves the work
+        # running for the others
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, run: Callable[[], Awaitable[T]]) -> T:
+        try:
+            return await run()
+        finally:
+            del self._in_flight[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "bytes": self.bytes,
+        }
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+
+request_cache = RequestCache()
+
+
+def _collect_metrics():
+    stats = request_cache.stats()
+    return [
+        ("decision_request_cache_hits_total", "counter", "Requests that reused a cached scoring", stats["hits"]),
+        ("decision_request_cache_misses_total", "counter", "Requests that had to be scored", stats["misses"]),
+        ("decision_request_cache_coalesced_total", "counter",
+         "Requests that waited for an identical request in flight", stats["coalesced"]),
+        ("decision_request_cache_evictions_total", "counter", "Scored requests evicted for space", stats["evictions"]),
+        ("decision_request_cache_size", "gauge", "Scored requests in the cache", stats["size"]),
+        ("decision_request_cache_bytes", "gauge", "Estimated bytes held by the cache", stats["bytes"]),
+    ]
+
+
+metrics.register_collector(_collect_metrics)
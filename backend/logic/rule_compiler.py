@@ -0,0 +1,214 @@
+"""
+Compile an ordered list of rules into a decision graph.
+
+Each internal node tests one factor once and branches on its value, so shared
+prefixes such as frequency/risk tolerance are never re-tested. Nodes are
+memoized on the clauses that can still fire, which turns the tree into a DAG.
+Rules with no path to them can never fire and are reported as unreachable.
+
+Run from the backend directory to check the graph against evaluating the
+rules in order, and compare the comparisons per call:
+    python -m logic.rule_compiler
+"""
+from itertools import product
+from typing import Any, Dict, Hashable, Sequence, Tuple, Union
+
+# Stands for every value that no rule mentions
+OTHER = "<other>"
+
+# A clause that can still fire: (rule index, remaining (factor, allowed values) conditions)
+_Clause = Tuple[int, Tuple[Tuple[str, frozenset], ...]]
+
+# A leaf is the index of the deciding rule; an internal node is
+# (factor, {value: child}, child for any other value)
+Node = Union[int, Tuple[str, Dict[Hashable, Any], Any]]
+
+
+class CompiledRules:
+    """
+    Rules compiled into a decision graph over the factors of an activity
+    """
+
+    def __init__(self, root: Node, rule_count: int, node_count: int, reachable: frozenset):
+        self.root = root
+        self.node_count = node_count
+        # Indexes of rules that no input can reach, because earlier rules cover them
+        self.unreachable = [idx for idx in range(rule_count) if idx not in reachable]
+
+    def evaluate(self, data: Dict[str, Any]) -> int:
+        """
+        Return the index of the rule that decides an activity
+
+        Args:
+            data: Dictionary containing the decision factors (raw, not normalized)
+        """
+        node = self.root
+        while node.__class__ is tuple:
+            factor, branches, default = node
+            node = branches.get(data.get(factor, ""), default)
+        return node
+
+    def comparisons(self, data: Dict[str, Any]) -> int:
+        """
+        Return the number of factors tested to decide an activity
+        """
+        tests = 0
+        node = self.root
+        while node.__class__ is tuple:
+            factor, branches, default = node
+            node = branches.get(data.get(factor, ""), default)
+            tests += 1
+        return tests
+
+
+def _domains(rules: Sequence[Any], normalized_values: Dict[str, Tuple[Dict[str, str], str]]) -> Dict[str, Tuple]:
+    """
+    Return the values each factor can take as the rules see them
+    """
+    domains: Dict[str, Dict[str, None]] = {}
+    for rule in rules:
+        for clause in rule.clauses:
+            for factor, allowed in clause.items():
+                domains.setdefault(factor, {}).update(dict.fromkeys(allowed))
+    for factor, values in domains.items():
+        if factor in normalized_values:
+            mapping, default = normalized_values[factor]
+            values.update(dict.fromkeys(mapping.values()))
+            values[default] = None
+        else:
+            values[OTHER] = None
+    return {factor: tuple(values) for factor, values in domains.items()}
+
+
+def _restrict(state: Tuple[_Clause, ...], factor: str, value: str) -> Tuple[_Clause, ...]:
+    """
+    Return the clauses that can still fire once `factor` is known to be `value`
+    """
+    restricted = []
+    for rule, conditions in state:
+        remaining = []
+        for condition in conditions:
+            if condition[0] != factor:
+                remaining.append(condition)
+            elif value not in condition[1]:
+                break
+        else:
+            restricted.append((rule, tuple(remaining)))
+            if not remaining:
+                # This clause always fires, so later ones are never reached
+                break
+    return tuple(restricted)
+
+
+def compile_rules(rules: Sequence[Any], normalized_values: Dict[str, Tuple[Dict[str, str], str]]) -> CompiledRules:
+    """
+    Compile rules into a decision graph that gives the same result as
+    evaluating them in order
+
+    Args:
+        rules: Ordered rules with a `clauses` attribute, each clause mapping a
+            factor to the values it may take. The last rule must always match.
+        normalized_values: Factors whose raw values are mapped before they are
+            compared, as {factor: ({raw value: value}, value of anything else)}
+
+    Returns:
+        CompiledRules: The graph and the rules it can never reach
+    """
+    domains = _domains(rules, normalized_values)
+    initial = tuple(
+        (idx, tuple((factor, frozenset(allowed)) for factor, allowed in clause.items()))
+        for idx, rule in enumerate(rules)
+        for clause in rule.clauses
+    )
+
+    memo: Dict[Tuple[_Clause, ...], Node] = {}
+    reachable = set()
+
+    def build(state: Tuple[_Clause, ...]) -> Node:
+        if state in memo:
+            return memo[state]
+        if not state:
+            raise ValueError("No rule matches some inputs; the last rule must always match")
+
+        rule, conditions = state[0]
+        if not conditions:
+            reachable.add(rule)
+            node: Node = rule
+        else:
+            # Test the factor of the first pending clause that most other clauses also test
+            usage: Dict[str, int] = {}
+            for _, other in state:
+                for factor, _ in other:
+                    usage[factor] = usage.get(factor, 0) + 1
+            factor = max((factor for factor, _ in conditions), key=lambda f: usage[f])
+
+            children = {value: build(_restrict(state, factor, value)) for value in domains[factor]}
+            if factor in normalized_values:
+                mapping, default_value = normalized_values[factor]
+                default = children[default_value]
+                branches = {raw: children[value] for raw, value in mapping.items()}
+            else:
+                default = children[OTHER]
+                branches = {value: child for value, child in children.items() if value != OTHER}
+            branches = {value: child for value, child in branches.items() if child != default}
+            node = (factor, branches, default) if branches else default
+
+        memo[state] = node
+        return node
+
+    root = build(initial)
+    nodes = {id(node) for node in memo.values() if node.__class__ is tuple}
+    return CompiledRules(root, len(rules), len(nodes), frozenset(reachable))
+
+
+def count_in_order_comparisons(rules: Sequence[Any], values: Dict[str, Any]) -> int:
+    """
+    Return the number of conditions evaluating normalized values against the
+    rules in order tests, stopping at the first failing condition of each clause
+    """
+    tests = 0
+    for rule in rules:
+        for clause in rule.clauses:
+            for factor, allowed in clause.items():
+                tests += 1
+                if values.get(factor, "") not in allowed:
+                    break
+            else:
+                return tests
+    return tests
+
+
+def _report() -> Dict[str, Any]:
+    from logic.decision_rules import RULES, evaluate_rules_in_order, get_compiled_rules, normalize
+    from logic.outcome_table import FACTORS, representative_values
+
+    compiled = get_compiled_rules()
+    checked = compiled_tests = in_order_tests = 0
+    domains = []
+    for factor in FACTORS:
+        values = representative_values(factor)
+        # Feed unrecognised values in as a string, as a client would send them
+        domains.append([value if value is not None else "Unrecognised" for value in values])
+    for combination in product(*domains):
+        data = dict(zip(FACTORS, combination))
+        expected = evaluate_rules_in_order(data)
+        rule = RULES[compiled.evaluate(data)]
+        if (rule.rule_id, rule.outcome) != expected:
+            raise AssertionError(f"Compiled rules disagree for {data}: {rule.rule_id} != {expected[0]}")
+        compiled_tests += compiled.comparisons(data)
+        in_order_tests += count_in_order_comparisons(RULES, normalize(data))
+        checked += 1
+
+    return {
+        "rules": len(RULES),
+        "nodes": compiled.node_count,
+        "unreachable_rules": [RULES[idx].rule_id for idx in compiled.unreachable],
+        "combinations_checked": checked,
+        "mean_comparisons_in_order": round(in_order_tests / checked, 2),
+        "mean_comparisons_compiled": round(compiled_tests / checked, 2),
+    }
+
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(_report(), indent=2))
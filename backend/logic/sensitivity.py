@@ -0,0 +1,93 @@
+from typing import Any, Dict, List
+
+import numpy as np
+
+from logic.batch_scoring import score_profiles_with_rules
+from logic.decision_rules import RULE_IDS
+from logic.outcome_table import FACTORS, FACTOR_VALUES, OUTCOMES, RADICES, STRIDES, encode_profile
+
+# Most answers changed at once
+MAX_CHANGES = 2
+
+
+def _build_changes():
+    """
+    List every change of one or two answers, for any activity, as parallel
+    arrays of (factor, code) for the first and the second answer changed.
+
+    A single change has a second answer that changes nothing: factor index
+    len(FACTORS), whose stride is 0, and code -1, which never equals the
+    activity's code. Changes to the value an activity already has are
+    filtered out per activity.
+    """
+    answers = [(idx, code) for idx, factor in enumerate(FACTORS) for code in range(len(FACTOR_VALUES[factor]))]
+    none = (len(FACTORS), -1)
+    changes = [(answer, none) for answer in answers]
+    changes.extend(
+        (first, second) for pos, first in enumerate(answers) for second in answers[pos + 1:] if first[0] != second[0]
+    )
+    first, second = zip(*changes)
+    first_factors, first_codes = (np.array(column, dtype=np.int64) for column in zip(*first))
+    second_factors, second_codes = (np.array(column, dtype=np.int64) for column in zip(*second))
+    return first_factors, first_codes, second_factors, second_codes, len(answers)
+
+
+_FIRST_FACTORS, _FIRST_CODES, _SECOND_FACTORS, _SECOND_CODES, _SINGLE_CHANGES = _build_changes()
+
+_STRIDES = np.array(list(STRIDES) + [0], dtype=np.int64)
+_FIRST_STRIDES = _STRIDES[_FIRST_FACTORS]
+_SECOND_STRIDES = _STRIDES[_SECOND_FACTORS]
+# Table index offset of setting each changed answer, from a code of 0
+_OFFSETS = _FIRST_CODES * _FIRST_STRIDES + _SECOND_CODES * _SECOND_STRIDES
+
+
+def analyse(data: Dict[str, Any], max_changes: int = MAX_CHANGES) -> Dict[str, Any]:
+    """
+    Find which changes of one or two answers would change the outcome of an activity
+
+    Every change is looked up in the outcome table in one batched pass: the
+    table index of a neighbour differs from the activity's by a fixed offset
+    per changed answer, so the whole neighbourhood is a few array operations.
+
+    Args:
+        data: Dictionary containing the decision factors
+        max_changes: Most answers changed at once, 1 or MAX_CHANGES
+
+    Returns:
+        Dict: The outcome and rule of the activity, the number of changes
+            evaluated, and the changes that flip the outcome grouped by the
+            outcome they lead to (single changes first)
+    """
+    profile = encode_profile(data)
+    # Current code of each factor, with a 0 for the no-op second answer of single changes
+    codes = np.array([profile // stride % radix for stride, radix in zip(STRIDES, RADICES)] + [0], dtype=np.int64)
+
+    count = _SINGLE_CHANGES if max_changes == 1 else len(_OFFSETS)
+    first_codes, second_codes = codes[_FIRST_FACTORS[:count]], codes[_SECOND_FACTORS[:count]]
+    changed = (_FIRST_CODES[:count] != first_codes) & (_SECOND_CODES[:count] != second_codes)
+    neighbours = (
+        profile + _OFFSETS[:count] - first_codes * _FIRST_STRIDES[:count] - second_codes * _SECOND_STRIDES[:count]
+    )
+
+    positions = np.flatnonzero(changed)
+    outcome_codes, rule_codes = score_profiles_with_rules(np.append(neighbours[positions], profile))
+    outcome_code = outcome_codes[-1]
+    flipped = np.flatnonzero(outcome_codes[:-1] != outcome_code)
+
+    flips: Dict[str, List[Dict[str, Any]]] = {}
+    at = positions[flipped]
+    for first_factor, first_code, second_factor, second_code, flip_outcome, rule in zip(
+        _FIRST_FACTORS[at].tolist(), _FIRST_CODES[at].tolist(), _SECOND_FACTORS[at].tolist(),
+        _SECOND_CODES[at].tolist(), outcome_codes[flipped].tolist(), rule_codes[flipped].tolist(),
+    ):
+        changes = {FACTORS[first_factor]: FACTOR_VALUES[FACTORS[first_factor]][first_code]}
+        if second_code >= 0:
+            changes[FACTORS[second_factor]] = FACTOR_VALUES[FACTORS[second_factor]][second_code]
+        flips.setdefault(OUTCOMES[flip_outcome], []).append({"changes": changes, "rule": RULE_IDS[rule]})
+
+    return {
+        "outcome": OUTCOMES[outcome_code],
+        "rule": RULE_IDS[rule_codes[-1]],
+        "evaluated": len(positions),
+        "flips": flips,
+    }
@@ -0,0 +1,40 @@
+import os
+import sqlite3
+import threading
+from typing import Sequence
+
+# Directory of the SQLite files that must outlive the server: the decision
+# history and the portfolio state. Mount a volume here in containers.
+DATA_DIR = os.environ.get("DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+
+
+class SQLiteStore:
+    """
+    A SQLite database file shared by every server and worker process.
+
+    Each call opens its own connection, as calls come from worker threads and
+    forked processes; the schema is created by the first connection of a process.
+    """
+
+    # CREATE ... IF NOT EXISTS statements run before first use
+    schema: Sequence[str] = ()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        # Appends only wait for the write-ahead log, not for a sync of the database
+        connection.execute("PRAGMA synchronous=NORMAL")
+        if not self._initialized:
+            with self._lock:
+                connection.execute("PRAGMA journal_mode=WAL")
+                for statement in self.schema:
+                    connection.execute(statement)
+                connection.commit()
+                self._initialized = True
+        return connection
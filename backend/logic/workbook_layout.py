@@ -0,0 +1,161 @@
+from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+# Layout of the decision workbooks: the column schema, sheet names, named
+# styles and column widths every workbook writer shares. Only the style and
+# width helpers need openpyxl, and they import it when called, so the schema
+# can be used (e.g. by the history store) without loading it.
+
+# Column order of the decision sheets
+HEADERS = [
+    "activity_name", "activity_type", "business_case", "core", "legal_requirement",
+    "risks", "risk_tolerance", "frequency", "specialised_skill",
+    "similarity_with_current_scopes", "skill_capacity", "duration",
+    "affordability", "strategic_fit", "outcome", "timestamp"
+]
+
+# Friendly column names
+HEADERS_DICT = {
+    "activity_name": "Activity Name",
+    "activity_type": "Activity Type",
+    "business_case": "Business case",
+    "core": "Core ",
+    "legal_requirement": "Legal requirement",
+    "risks": "Risks",
+    "risk_tolerance": "Risk tolerance ",
+    "frequency": "Frequency",
+    "specialised_skill": "Specialised Skill",
+    "similarity_with_current_scopes": "Similarity with current scopes",
+    "skill_capacity": "Skill capacity",
+    "duration": "Duration ",
+    "affordability": "Affordability & Transferable Skill",
+    "strategic_fit": "Strategic fit and Business case",
+    "outcome": "Outcome",
+    "timestamp": "Timestamp"
+}
+
+# Header row of the decision sheets, in HEADERS order
+HEADER_TITLES = [HEADERS_DICT[header] for header in HEADERS]
+
+FIELD_DESCRIPTIONS = {
+    "Business case": "Does this activity have a business case?",
+    "Core ": "Core activities are essential to your organization's primary mission and competitive advantage",
+    "Legal requirement": "Activities required by law, regulation, or contract that cannot be eliminated",
+    "Risks": "Consider reputational, operational, financial, or compliance risks associated with this activity",
+    "Risk tolerance ": "Inside or outside your organization's risk tolerance boundaries",
+    "Frequency": "How often the activity is performed (High/Low)",
+    "Specialised Skill": "Whether the activity requires specialized expertise or capabilities",
+    "Similarity with current scopes": "How similar this activity is to your organization's existing operations and capabilities",
+    "Skill capacity": "Whether your organization already has the necessary skills and resources to perform this activity",
+    "Duration ": "The expected timeframe for this activity (Short = temporary or project-based, Long = ongoing or permanent)",
+    "Affordability & Transferable Skill": "Whether your organization can afford to develop or maintain this capability internally",
+    "Strategic fit and Business case": "How well this activity aligns with your organization's long-term strategic objectives",
+    "Outcome": "The recommended sourcing strategy based on all factors",
+    "Timestamp": "Date and time when the decision was made"
+}
+
+# Widths of the "Field Descriptions" columns
+FIELD_DESCRIPTION_WIDTHS = {"A": 30, "B": 100}
+
+# Fill colour of the outcome cell for each outcome
+OUTCOME_COLORS = {
+    "Eliminate": "FFCCCC",
+    "Current Outsource": "CCE5FF",
+    "New Outsource": "FFFFCC",
+    "Insource or create in-house capacity": "CCFFCC",
+    "Requires Further Analysis": "E6E6E6",
+}
+
+OUTCOME_COLUMN = HEADERS.index("outcome")
+
+MAIN_SHEET = "Sourcing Decisions"
+NOTES_SHEET = "Field Descriptions"
+HISTORY_SHEET = "Decision History"
+
+HEADER_STYLE = "Decision Header"
+FIELD_HEADER_STYLE = "Field Header"
+
+HEADER_COLOR = "4F81BD"
+
+
+def outcome_style_name(outcome: str) -> str:
+    return f"Outcome {outcome}"
+
+
+@lru_cache(maxsize=None)
+def _style_registry() -> Tuple[Tuple[str, Dict[str, Any]], ...]:
+    """
+    Build the fonts, fills and alignments of the named styles once per process.
+
+    A NamedStyle is bound to the workbook it is added to, so each workbook
+    gets NamedStyle objects of its own, but they all share these parts.
+    """
+    from openpyxl.styles import Alignment, Font, PatternFill
+
+    def fill(color: str) -> PatternFill:
+        return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = fill(HEADER_COLOR)
+    styles = [
+        (HEADER_STYLE, {
+            "font": header_font,
+            "fill": header_fill,
+            "alignment": Alignment(horizontal="center", vertical="center"),
+        }),
+        (FIELD_HEADER_STYLE, {"font": header_font, "fill": header_fill}),
+    ]
+    styles.extend((outcome_style_name(outcome), {"fill": fill(color)}) for outcome, color in OUTCOME_COLORS.items())
+    return tuple(styles)
+
+
+def register_styles(wb):
+    """
+    Add the shared named styles used by the decision sheets to a workbook
+    """
+    from openpyxl.styles import NamedStyle
+
+    for name, parts in _style_registry():
+        wb.add_named_style(NamedStyle(name=name, **parts))
+
+
+class ColumnWidths:
+    """
+    Track the longest value of each column while rows are produced,
+    so column widths never need a second pass over the cells
+    """
+
+    def __init__(self, headers: Sequence[str] = HEADER_TITLES):
+        self.max_lengths = [len(header) for header in headers]
+
+    def observe_columns(self, columns: Sequence[Sequence[Any]]):
+        """
+        Widen columns to fit whole columns of values at once. Factor columns
+        hold a few distinct values, so each distinct value is measured once.
+        """
+        self.observe_lengths([
+            max((len(str(value)) for value in set(column) if value), default=0) for column in columns
+        ])
+
+    def observe_lengths(self, lengths: Sequence[int]):
+        """
+        Widen columns to fit values of known lengths, e.g. measured by a database query
+        """
+        self.max_lengths = [max(current, length) for current, length in zip(self.max_lengths, lengths)]
+
+    def apply(self, sheet, minimum: Optional[Dict[int, float]] = None):
+        """
+        Set the column widths of a sheet. Write-only sheets need this before
+        their first row is appended.
+
+        Args:
+            sheet: Sheet to set the widths on
+            minimum: Existing widths by column index that should not shrink
+        """
+        from openpyxl.utils import get_column_letter
+
+        minimum = minimum or {}
+        for col_idx, max_length in enumerate(self.max_lengths, 1):
+            width = max((max_length + 2) * 1.2, minimum.get(col_idx, 0))
+            sheet.column_dimensions[get_column_letter(col_idx)].width = width
+
@@ -1,97 +1,626 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from typing import List, Dict, Any, Optional
-from pydantic import BaseModel
-import io
-from fastapi.responses import StreamingResponse
-import openpyxl
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-import pandas as pd
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Header, Request, Depends, Query
+from fastapi.exceptions import RequestValidationError
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional, AsyncIterator, Literal, Tuple
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from fastapi.responses import Response, StreamingResponse, FileResponse
+import hashlib
 import os
+import json
+import shutil
+import tempfile
+import time
 from datetime import datetime
 
-from logic.decision_rules import determine_outcome
+from logic.activity import ActivityBatch, from_models, profile_of, values_of
+from logic.outcome_table import FACTORS, OUTCOMES, OUTCOME_CODES
+from logic.batch_scoring import score_profiles_with_rules
+from logic.outcome_cache import CachedProfile, outcome_cache
+from logic.request_cache import ScoredRequest, request_cache, request_key
+from logic.history_store import RECORD_HISTORY, MAX_PAGE_SIZE, history_store
+from logic.aggregation import PERIODS, summarise_history, summarise_portfolio
+from logic.sensitivity import MAX_CHANGES, analyse
+from logic.outcome_index import MAX_PAGE_SIZE as OUTCOME_SPACE_PAGE_SIZE, fingerprint, get_index
+from logic.portfolio_store import (
+    DETERMINE_SCOPE, UPDATE_EXCEL_SCOPE, AmbiguousActivityError, PortfolioDelta, portfolio_store,
+)
+from logic import export_jobs
+from logic.executor import check_capacity, run_cpu, USES_PROCESSES
+from logic.metrics import metrics
 
 router = APIRouter()
 
+def _excel():
+    """
+    Import the Excel machinery (openpyxl) on first use, so that starting the
+    app and serving /determine never pay for it
+    """
+    from logic import excel_export
+    return excel_export
+
+def _importer():
+    """
+    Import the file import module on first use; it loads openpyxl too
+    """
+    from logic import portfolio_import
+    return portfolio_import
+
+# Allowed values of the decision factors, the values the rules compare against
+# (FACTOR_VALUES in logic/outcome_table.py). "" means not answered.
+YesNo = Literal["Yes", "No"]
+YesNoOrEmpty = Literal["Yes", "No", ""]
+RiskTolerance = Literal["Outside", "Inside", ""]
+Frequency = Literal["High", "Low"]
+Duration = Literal["Long", "Short"]
+
 class DecisionInput(BaseModel):
-    business_case: str
-    core: str
-    legal_requirement: Optional[str] = ""
-    risks: Optional[str] = ""
-    risk_tolerance: Optional[str] = ""
-    frequency: str
-    specialised_skill: str
-    similarity_with_current_scopes: str
-    skill_capacity: str
-    duration: str
-    affordability: str
-    strategic_fit: Optional[str] = ""
+    business_case: YesNo
+    core: YesNo
+    legal_requirement: YesNoOrEmpty = ""
+    risks: YesNoOrEmpty = ""
+    risk_tolerance: RiskTolerance = ""
+    frequency: Frequency
+    specialised_skill: YesNo
+    similarity_with_current_scopes: YesNo
+    skill_capacity: YesNo
+    duration: Duration
+    affordability: YesNo
+    strategic_fit: YesNoOrEmpty = ""
     activity_name: str = "Unnamed Activity"
     activity_type: str = ""
 
 class DecisionRequest(BaseModel):
     inputs: List[DecisionInput]
 
+def _form_request(request: str = Form(...)) -> DecisionRequest:
+    """
+    Parse a DecisionRequest sent as a JSON form field next to an uploaded file.
+    A multipart body cannot carry a JSON body as well, and FastAPI does not
+    parse models out of form fields by itself.
+    """
+    try:
+        return DecisionRequest.model_validate_json(request)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [dict(error, loc=("body", "request") + tuple(error["loc"])) for error in e.errors(include_url=False)]
+        )
+
 class DecisionOutput(BaseModel):
     activity_name: str
     activity_type: str
-    business_case: str
-    core: str
-    legal_requirement: str
-    risks: str
-    risk_tolerance: str
-    frequency: str
-    specialised_skill: str
-    similarity_with_current_scopes: str
-    skill_capacity: str
-    duration: str
-    affordability: str
-    strategic_fit: str
+    business_case: YesNo
+    core: YesNo
+    legal_requirement: YesNoOrEmpty
+    risks: YesNoOrEmpty
+    risk_tolerance: RiskTolerance
+    frequency: Frequency
+    specialised_skill: YesNo
+    similarity_with_current_scopes: YesNo
+    skill_capacity: YesNo
+    duration: Duration
+    affordability: YesNo
+    strategic_fit: YesNoOrEmpty
     outcome: str
     timestamp: Optional[str] = None
 
 class DecisionResponse(BaseModel):
     results: List[DecisionOutput]
 
+class ColumnarDecisionResponse(BaseModel):
+    # Field names of the columns, in column order
+    fields: List[str]
+    # Outcome of each outcome code
+    outcomes: List[str]
+    # Decision timestamp, the same for every activity of a request
+    timestamp: str
+    # One list of values per field; the outcome column holds outcome codes
+    columns: List[List[Any]]
+
+class IncrementalRequest(BaseModel):
+    portfolio_id: str
+    inputs: List[DecisionInput]
+    # True if inputs only holds new and changed activities, False if it is the whole portfolio
+    partial: bool = False
+    # Names of activities to drop from the portfolio, with partial=True
+    removed: List[str] = []
+
+class IncrementalResponse(BaseModel):
+    portfolio_id: str
+    # Outcomes of the new and changed activities only
+    results: List[DecisionOutput]
+    removed: List[str]
+    unchanged: int
+
+class SensitivityChange(BaseModel):
+    # Factor -> new value of the one or two answers changed
+    changes: Dict[str, str]
+    # Rule that decides the changed activity
+    rule: str
+
+class SensitivityResponse(BaseModel):
+    activity_name: str
+    outcome: str
+    rule: str
+    # Changes looked up, excluding ones that keep an answer as it is
+    evaluated: int
+    # Outcome -> the changes that lead to it, single changes first
+    flips: Dict[str, List[SensitivityChange]]
+
+class ProfileFilter(BaseModel):
+    # Factor values a profile must have, read from the query string; unset factors match any value
+    business_case: Optional[YesNo] = None
+    core: Optional[YesNo] = None
+    legal_requirement: Optional[YesNoOrEmpty] = None
+    risks: Optional[YesNoOrEmpty] = None
+    risk_tolerance: Optional[RiskTolerance] = None
+    frequency: Optional[Frequency] = None
+    specialised_skill: Optional[YesNo] = None
+    similarity_with_current_scopes: Optional[YesNo] = None
+    skill_capacity: Optional[YesNo] = None
+    duration: Optional[Duration] = None
+    affordability: Optional[YesNo] = None
+    strategic_fit: Optional[YesNoOrEmpty] = None
+
+def _serialize_results(activities: ActivityBatch, profiles: List[CachedProfile], timestamp: str) -> List[bytes]:
+    """
+    Serialize scored activities as DecisionOutput JSON objects, splicing the
+    cached fragment of each profile between its name, type and timestamp
+    """
+    timestamp_json = json.dumps(timestamp).encode()
+    return [
+        b'{"activity_name":%s,"activity_type":%s,%s,"timestamp":%s}' % (
+            json.dumps(name, ensure_ascii=False).encode(),
+            json.dumps(activity_type, ensure_ascii=False).encode(),
+            profile.fragment,
+            timestamp_json,
+        )
+        for name, activity_type, profile in zip(activities.names, activities.types, profiles)
+    ]
+
+def _compact(inputs: List[DecisionInput], handler: str) -> ActivityBatch:
+    """
+    Convert validated activities to the compact form scoring, caching and export work on
+    """
+    with metrics.timer(handler, "compact"):
+        return from_models(inputs)
+
+def _score(activities: ActivityBatch, handler: str) -> List[CachedProfile]:
+    """
+    Determine all outcomes, scoring only profiles that are not cached, and
+    count the rules that decided them
+    """
+    with metrics.timer(handler, "score"):
+        profiles = outcome_cache.get_activities(activities)
+    metrics.record_rule_hits(profile.rule for profile in profiles)
+    return profiles
+
+def _record(activities: ActivityBatch, profiles: List[CachedProfile], timestamp: str, handler: str):
+    """
+    Append scored activities to the decision history
+    """
+    if RECORD_HISTORY:
+        with metrics.timer(handler, "record"):
+            history_store.record(activities, [profile.outcome for profile in profiles], timestamp)
+
+_INPUTS = TypeAdapter(List[DecisionInput])
+
+def _request_key(inputs: List[DecisionInput]) -> bytes:
+    """
+    Key of a request in the request cache, from its validated inputs
+    (runs in the worker pool for large requests)
+    """
+    return request_key(_INPUTS.dump_json(inputs))
+
+# Requests with more inputs are keyed in the worker pool: serializing and
+# hashing them takes about 3µs per input, which would block the event loop
+KEY_INLINE_MAX = 200
+
+async def _key(inputs: List[DecisionInput]) -> bytes:
+    """
+    Request cache key of a request, computed in the worker pool unless it is small
+    """
+    if len(inputs) <= KEY_INLINE_MAX:
+        return _request_key(inputs)
+    return await run_cpu(_request_key, inputs)
+
+def _score_request(inputs: List[DecisionInput], handler: str) -> ScoredRequest:
+    """
+    Score a batch of activities for the request cache (runs in the worker pool)
+    """
+    activities = _compact(inputs, handler)
+    return ScoredRequest(activities, _score(activities, handler))
+
+async def _scored(key: bytes, inputs: List[DecisionInput], handler: str) -> ScoredRequest:
+    """
+    Return a request as scored by an earlier or concurrent identical request, or score it
+    """
+    return await request_cache.get_or_score(key, lambda: run_cpu(_score_request, inputs, handler))
+
+def _serialize_columns(activities: ActivityBatch, profiles: List[CachedProfile], timestamp: str) -> bytes:
+    """
+    Serialize scored activities as a ColumnarDecisionResponse: each field name
+    once with a column of values, and outcomes as codes into a legend
+    """
+    factor_columns = zip(*map(values_of, activities.keys)) if len(activities) else [()] * len(FACTORS)
+    columns = [activities.names, activities.types]
+    columns.extend(list(column) for column in factor_columns)
+    columns.append([OUTCOME_CODES[profile.outcome] for profile in profiles])
+    return json.dumps({
+        "fields": ["activity_name", "activity_type", *FACTORS, "outcome"],
+        "outcomes": OUTCOMES,
+        "timestamp": timestamp,
+        "columns": columns,
+    }, ensure_ascii=False, separators=(",", ":")).encode()
+
+def _determine(scored: ScoredRequest, timestamp: str, response_format: Optional[str]) -> Optional[bytes]:
+    """
+    Record a scored request and serialize the response body in the given
+    format, or nothing if the format is None (runs in the worker pool)
+    """
+    activities, profiles = scored
+    _record(activities, profiles, timestamp, "determine_outcomes")
+    if response_format is None:
+        return None
+    return _serialize_response(scored, timestamp, response_format)
+
+def _serialize_response(scored: ScoredRequest, timestamp: str, response_format: str) -> bytes:
+    """
+    Serialize the /determine response body of a scored request
+    """
+    activities, profiles = scored
+    with metrics.timer("determine_outcomes", "serialize"):
+        if response_format == "columnar":
+            return _serialize_columns(activities, profiles, timestamp)
+        return b'{"results":[' + b",".join(_serialize_results(activities, profiles, timestamp)) + b"]}"
+
+async def _determine_request(key: bytes, inputs: List[DecisionInput], response_format: Optional[str]) -> Optional[bytes]:
+    """
+    Decide a request now, reusing the scoring of an earlier identical request
+    """
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    scored = await _scored(key, inputs, "determine_outcomes")
+    return await run_cpu(_determine, scored, timestamp, response_format)
+
+# Changes whenever the rules or factor domains do, and with them the outcomes
+_RULES_FINGERPRINT = fingerprint().encode()
+
+def _etag(key: bytes, response_format: str) -> str:
+    """
+    Weak entity tag of a /determine response: responses to the same inputs
+    hold the same decisions and only differ in their timestamp
+    """
+    digest = hashlib.blake2b(key + _RULES_FINGERPRINT + response_format.encode(), digest_size=16).hexdigest()
+    return f'W/"{digest}"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Weak comparison of an If-None-Match header with an entity tag
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag[2:] in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
 @router.post("/determine", response_model=DecisionResponse)
-async def determine_outcomes(request: DecisionRequest):
+async def determine_outcomes(request: DecisionRequest,
+                             response_format: Literal["rows", "columnar"] = Query("rows", alias="format"),
+                             if_none_match: Optional[str] = Header(None)):
+    """
+    Determine the outcomes for the provided inputs based on decision rules.
+    The body is serialized straight to JSON bytes, so FastAPI does not
+    validate and encode the results again; response_model documents its shape.
+    With ?format=columnar the body is a ColumnarDecisionResponse instead.
+    
+    The response carries a weak ETag of the inputs and rules. Resending it in
+    If-None-Match gets a 304 without a body, as the decisions are the same;
+    they are still recorded as decided now.
+    """
+    metrics.observe_since_request("determine_outcomes", "validate")
+    key = await _key(request.inputs)
+    headers = {"ETag": _etag(key, response_format)}
+    not_modified = _etag_matches(if_none_match, headers["ETag"])
+    body_format = None if not_modified else response_format
+    # Every request is recorded with its own timestamp; only identical
+    # requests in flight at the same time share one decision
+    body = await request_cache.coalesce(
+        ("determine", key, body_format), lambda: _determine_request(key, request.inputs, body_format)
+    )
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _diff_portfolio(portfolio_id: str, scope: str, activities: ActivityBatch, handler: str,
+                    partial: bool = False, removed: List[str] = ()) -> PortfolioDelta:
+    """
+    Find the activities that changed since the portfolio was last scored
+    """
+    with metrics.timer(handler, "diff"):
+        return portfolio_store.diff(portfolio_id, scope, activities, partial, removed)
+
+def _determine_incremental(request: IncrementalRequest, timestamp: str) -> bytes:
+    """
+    Score only the activities that changed since the portfolio was last
+    scored, and serialize the IncrementalResponse body (runs in the worker pool)
+    """
+    handler = "determine_incremental"
+    activities = _compact(request.inputs, handler)
+    delta = _diff_portfolio(
+        request.portfolio_id, DETERMINE_SCOPE, activities, handler, request.partial, request.removed
+    )
+    changed = activities.select(delta.changed)
+    profiles = _score(changed, handler)
+    _record(changed, profiles, timestamp, handler)
+    portfolio_store.save(request.portfolio_id, DETERMINE_SCOPE, delta, [profile.outcome for profile in profiles], timestamp)
+    
+    with metrics.timer(handler, "serialize"):
+        return b'{"portfolio_id":%s,"results":[%s],"removed":%s,"unchanged":%d}' % (
+            json.dumps(request.portfolio_id, ensure_ascii=False).encode(),
+            b",".join(_serialize_results(changed, profiles, timestamp)),
+            json.dumps([name for name, _ in delta.removed], ensure_ascii=False).encode(),
+            delta.unchanged,
+        )
+
+@router.post("/determine/incremental", response_model=IncrementalResponse)
+async def determine_incremental(request: IncrementalRequest):
+    """
+    Determine the outcomes of a resubmitted portfolio, returning only what
+    changed since it was last submitted under the same portfolio_id.
+    Send either the whole portfolio, or with partial=true only the new and
+    changed activities plus the names of removed ones. Activities are matched
+    by name (repeated names in order) and re-scored when any field differs.
+    A partial submission cannot hold activities whose name is repeated in the
+    portfolio, as it does not tell which of them changed (422).
+    """
+    metrics.observe_since_request("determine_incremental", "validate")
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        body = await run_cpu(_determine_incremental, request, timestamp)
+    except AmbiguousActivityError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return Response(content=body, media_type="application/json")
+
+def _forget_portfolio(portfolio_id: str) -> int:
+    """
+    Drop the stored state of a portfolio (runs in the worker pool)
+    """
+    return portfolio_store.forget(portfolio_id)
+
+@router.delete("/portfolios/{portfolio_id}")
+async def forget_portfolio(portfolio_id: str):
+    """
+    Drop the stored state of a portfolio, so its next submission is scored in full
+    """
+    removed = await run_cpu(_forget_portfolio, portfolio_id)
+    return {"portfolio_id": portfolio_id, "removed": removed}
+
+def _summarise(inputs: List[DecisionInput]) -> Dict[str, Any]:
+    """
+    Score a portfolio and summarise its outcomes (runs in the worker pool)
+    """
+    activities = _compact(inputs, "determine_summary")
+    # Only outcome codes are needed, so the table is read directly rather
+    # than through the outcome cache and its serialized fragments
+    with metrics.timer("determine_summary", "score"):
+        outcome_codes, rule_codes = score_profiles_with_rules([profile_of(key) for key in activities.keys])
+    metrics.record_rule_hits(rule_codes.tolist())
+    with metrics.timer("determine_summary", "aggregate"):
+        return summarise_portfolio(activities.types, outcome_codes.tolist())
+
+@router.post("/determine/summary")
+async def determine_summary(request: DecisionRequest):
+    """
+    Score a portfolio and return only the count and percentage of each
+    outcome, overall and by activity type. Nothing is recorded in the history.
+    """
+    metrics.observe_since_request("determine_summary", "validate")
+    return await run_cpu(_summarise, request.inputs)
+
+@router.post("/sensitivity", response_model=SensitivityResponse)
+async def sensitivity(activity: DecisionInput, max_changes: int = Query(MAX_CHANGES, ge=1, le=MAX_CHANGES)):
+    """
+    Show which changes of one or two answers would change the outcome of an activity.
+    All changes are looked up in the outcome table at once, so this answers
+    in well under a millisecond instead of resubmitting to /determine.
+    """
+    with metrics.timer("sensitivity", "score"):
+        result = analyse(activity.model_dump(), max_changes)
+    return dict(result, activity_name=activity.activity_name)
+
+@router.get("/outcome-space")
+async def outcome_space():
+    """
+    Summarise the whole decision space: how many answer combinations lead to
+    each outcome and are decided by each rule, and which rules decide none
+    """
+    return get_index().summary()
+
+@router.get("/outcome-space/profiles")
+async def outcome_space_profiles(outcome: Optional[str] = None, rule: Optional[str] = None,
+                                 factors: ProfileFilter = Depends(), offset: int = Query(0, ge=0),
+                                 limit: int = Query(100, ge=1, le=OUTCOME_SPACE_PAGE_SIZE)):
+    """
+    List the answer combinations leading to an outcome or decided by a rule,
+    optionally only those with the given factor values (e.g. ?outcome=New Outsource&core=Yes).
+    Answered from the precomputed outcome index, without evaluating any rule.
+    """
+    try:
+        total, profiles = get_index().query(outcome, rule, offset, limit, **factors.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    next_offset = offset + len(profiles) if offset + len(profiles) < total else None
+    return {"total": total, "profiles": profiles, "next_offset": next_offset}
+
+# Number of streamed activities scored together
+STREAM_CHUNK_SIZE = 1000
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """
+    Streaming response that leaves the request body to the body iterator.
+    StreamingResponse normally listens for a client disconnect while it
+    streams, which would swallow the request body we are still reading.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+async def _iter_ndjson_lines(request: Request) -> AsyncIterator[bytes]:
+    """
+    Yield the lines of the request body as they arrive
+    """
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+def _score_chunk(chunk: List[DecisionInput], timestamp: str) -> bytes:
+    """
+    Score a chunk of streamed activities and serialize the results as NDJSON
+    """
+    activities = _compact(chunk, "determine_outcomes_stream")
+    profiles = _score(activities, "determine_outcomes_stream")
+    _record(activities, profiles, timestamp, "determine_outcomes_stream")
+    with metrics.timer("determine_outcomes_stream", "serialize"):
+        return b"\n".join(_serialize_results(activities, profiles, timestamp)) + b"\n"
+
+async def _stream_outcomes(request: Request) -> AsyncIterator[bytes]:
     """
-    Determine the outcomes for the provided inputs based on decision rules
+    Validate, score and serialize streamed activities chunk by chunk. The
+    response has started by the time a chunk is scored, so a busy pool (503)
+    or timeout (504) ends the stream with an error line instead.
     """
-    results = []
+    try:
+        async for lines in _stream_chunks(request):
+            yield lines
+    except HTTPException as e:
+        yield b'{"status_code": %d, "detail": %s}\n' % (e.status_code, json.dumps(e.detail).encode())
+
+async def _stream_chunks(request: Request) -> AsyncIterator[bytes]:
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    chunk = []
+    line_number = 0
+    validating = 0.0
     
-    for input_data in request.inputs:
-        # Convert input to dict
-        input_dict = input_data.dict()
+    async for line in _iter_ndjson_lines(request):
+        line_number += 1
+        if not line.strip():
+            continue
         
-        # Determine the outcome
-        outcome = determine_outcome(input_dict)
-        
-        # Create output with all input fields plus outcome
-        output = DecisionOutput(
-            activity_name=input_dict.get("activity_name", ""),
-            activity_type=input_dict.get("activity_type", ""),
-            business_case=input_dict.get("business_case", ""),
-            core=input_dict.get("core", ""),
-            legal_requirement=input_dict.get("legal_requirement", ""),
-            risks=input_dict.get("risks", ""),
-            risk_tolerance=input_dict.get("risk_tolerance", ""),
-            frequency=input_dict.get("frequency", ""),
-            specialised_skill=input_dict.get("specialised_skill", ""),
-            similarity_with_current_scopes=input_dict.get("similarity_with_current_scopes", ""),
-            skill_capacity=input_dict.get("skill_capacity", ""),
-            duration=input_dict.get("duration", ""),
-            affordability=input_dict.get("affordability", ""),
-            strategic_fit=input_dict.get("strategic_fit", ""),
-            outcome=outcome,
-            timestamp=timestamp
-        )
+        started = time.perf_counter()
+        try:
+            activity = DecisionInput.model_validate_json(line)
+        except ValidationError as e:
+            validating += time.perf_counter() - started
+            # Flush earlier activities first so results stay in input order
+            if chunk:
+                yield await run_cpu(_score_chunk, chunk, timestamp)
+                chunk = []
+            yield b'{"line": %d, "detail": %s}\n' % (line_number, e.json(include_url=False).encode())
+            continue
+        validating += time.perf_counter() - started
+        chunk.append(activity)
         
-        results.append(output)
+        if len(chunk) >= STREAM_CHUNK_SIZE:
+            yield await run_cpu(_score_chunk, chunk, timestamp)
+            chunk = []
+    
+    if chunk:
+        yield await run_cpu(_score_chunk, chunk, timestamp)
+    metrics.observe("determine_outcomes_stream", "validate", validating)
+
+@router.post("/determine-stream")
+async def determine_outcomes_stream(request: Request):
+    """
+    Determine the outcomes for newline-delimited JSON activities.
+    Each body line is one DecisionInput object; each response line is either
+    a DecisionOutput or, for a line that fails validation, its line number and
+    validation errors. Results are sent back as soon as each chunk is scored.
+
+    A busy server answers 503 before reading the body. If the worker pool
+    fills up or times out later, the stream ends with a line holding the
+    status_code (503 or 504) and detail; activities after it are not scored.
+    """
+    check_capacity()
+    return NDJSONStreamingResponse(_stream_outcomes(request))
+
+def _build_rows(activities: ActivityBatch, outcomes: List[str], timestamp: str, handler: str):
+    """
+    Lay out scored activities as sheet rows
+    """
+    with metrics.timer(handler, "build_rows"):
+        return _excel().build_rows(activities, outcomes, timestamp)
+
+def _score_rows(inputs: List[DecisionInput], timestamp: str, handler: str):
+    """
+    Score a batch of activities and lay them out as sheet rows
+    """
+    activities = _compact(inputs, handler)
+    outcomes = [profile.outcome for profile in _score(activities, handler)]
+    return _build_rows(activities, outcomes, timestamp, handler)
+
+def _scored_rows(scored: ScoredRequest, timestamp: str, handler: str):
+    """
+    Lay out a scored request as sheet rows
+    """
+    return _build_rows(scored.activities, [profile.outcome for profile in scored.profiles], timestamp, handler)
+
+def _build_export(scored: ScoredRequest, timestamp: str) -> str:
+    """
+    Write the export workbook of a scored request (runs in the worker pool)
+    """
+    rows, widths = _scored_rows(scored, timestamp, "export_to_excel")
+    return _excel().write_export_workbook(rows, widths)
+
+def _build_update(source, inputs: List[DecisionInput], timestamp: str, portfolio_id: Optional[str] = None) -> str:
+    """
+    Score activities and merge them into an uploaded workbook (runs in the worker pool).
+    With a portfolio id only the activities that changed since it was last
+    submitted are scored and appended to the history; the main sheet still
+    lists all of them.
+    """
+    if portfolio_id is None:
+        rows, widths = _score_rows(inputs, timestamp, "update_excel")
+        return _excel().write_updated_workbook(source, rows, widths)
+    
+    activities = _compact(inputs, "update_excel")
+    delta = _diff_portfolio(portfolio_id, UPDATE_EXCEL_SCOPE, activities, "update_excel")
+    changed = activities.select(delta.changed)
+    outcomes = [profile.outcome for profile in _score(changed, "update_excel")]
+    changed_rows, widths = _build_rows(changed, outcomes, timestamp, "update_excel")
+    
+    # The main sheet lists the whole portfolio: unchanged activities keep the
+    # outcome and time they were last scored with, from the portfolio store
+    rows = [None] * len(activities)
+    for idx, row in zip(delta.changed, changed_rows):
+        rows[idx] = row
+    kept_indexes = list(delta.kept)
+    kept_outcomes = [delta.kept[idx][0] for idx in kept_indexes]
+    kept_rows, kept_widths = _build_rows(activities.select(kept_indexes), kept_outcomes, timestamp, "update_excel")
+    for idx, row in zip(kept_indexes, kept_rows):
+        rows[idx] = row[:-1] + (delta.kept[idx][1],)
+    widths.observe_lengths(kept_widths.max_lengths)
     
-    return DecisionResponse(results=results)
+    output = _excel().write_updated_workbook(source, rows, widths, history_rows=changed_rows)
+    # Only recorded once the workbook is written, so a failed update is retried in full
+    portfolio_store.save(portfolio_id, UPDATE_EXCEL_SCOPE, delta, outcomes, timestamp)
+    return output
+
+def _spool_upload(upload: UploadFile, suffix: str = ".xlsx") -> str:
+    """
+    Copy an upload to a temporary file that a worker process can open.
+    Blocking, so call it through run_in_threadpool.
+    """
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, "wb") as destination:
+        shutil.copyfileobj(upload.file, destination)
+    return path
 
 @router.post("/export-excel")
 async def export_to_excel(request: DecisionRequest):
@@ -99,292 +628,229 @@ async def export_to_excel(request: DecisionRequest):
     Generate Excel file with inputs and outcomes using openpyxl
     Preserves history when an existing file is uploaded
     """
-    # Process inputs to determine outcomes
-    results = []
+    metrics.observe_since_request("export_to_excel", "validate")
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Reuse the scoring of an identical /determine or export request
+    scored = await _scored(await _key(request.inputs), request.inputs, "export_to_excel")
     
-    for input_data in request.inputs:
-        input_dict = input_data.dict()
-        outcome = determine_outcome(input_dict)
-        
-        # Add outcome to the input data
-        input_dict["outcome"] = outcome
-        input_dict["timestamp"] = timestamp
-        results.append(input_dict)
-    
-    # Create a workbook using openpyxl
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Sourcing Decisions"
-    
-    # Define column headers with friendly names
-    headers_dict = {
-        "activity_name": "Activity Name", 
-        "activity_type": "Activity Type",
-        "business_case": "Business case",
-        "core": "Core ", 
-        "legal_requirement": "Legal requirement", 
-        "risks": "Risks", 
-        "risk_tolerance": "Risk tolerance ", 
-        "frequency": "Frequency", 
-        "specialised_skill": "Specialised Skill", 
-        "similarity_with_current_scopes": "Similarity with current scopes", 
-        "skill_capacity": "Skill capacity", 
-        "duration": "Duration ", 
-        "affordability": "Affordability & Transferable Skill", 
-        "strategic_fit": "Strategic fit and Business case", 
-        "outcome": "Outcome",
-        "timestamp": "Timestamp"
-    }
-    
-    # Define column order
-    headers = [
-        "activity_name", "activity_type", "business_case", "core", "legal_requirement", 
-        "risks", "risk_tolerance", "frequency", "specialised_skill", 
-        "similarity_with_current_scopes", "skill_capacity", "duration", 
-        "affordability", "strategic_fit", "outcome", "timestamp"
-    ]
-    
-    # Add headers with styling
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
-    
-    for col_idx, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_idx, value=headers_dict[header])
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-    
-    # Add data
-    for row_idx, result in enumerate(results, 2):
-        for col_idx, header in enumerate(headers, 1):
-            cell = ws.cell(row=row_idx, column=col_idx, value=result.get(header, ""))
-            
-            # Color the outcome cell based on the value
-            if header == "outcome":
-                if result[header] == "Eliminate":
-                    cell.fill = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
-                elif result[header] == "Current Outsource":
-                    cell.fill = PatternFill(start_color="CCE5FF", end_color="CCE5FF", fill_type="solid")
-                elif result[header] == "New Outsource":
-                    cell.fill = PatternFill(start_color="FFFFCC", end_color="FFFFCC", fill_type="solid")
-                elif result[header] == "Insource or create in-house capacity":
-                    cell.fill = PatternFill(start_color="CCFFCC", end_color="CCFFCC", fill_type="solid")
-                elif result[header] == "Requires Further Analysis":
-                    cell.fill = PatternFill(start_color="E6E6E6", end_color="E6E6E6", fill_type="solid")
-    
-    # Auto-adjust column width
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            if cell.value:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-        adjusted_width = (max_length + 2) * 1.2
-        ws.column_dimensions[column].width = adjusted_width
-    
-    # Add explanatory notes as a separate sheet
-    notes_sheet = wb.create_sheet(title="Field Descriptions")
-    
-    # Add field descriptions
-    field_descriptions = {
-        "Business case": "Does this activity have a business case?",
-        "Core ": "Core activities are essential to your organization's primary mission and competitive advantage",
-        "Legal requirement": "Activities required by law, regulation, or contract that cannot be eliminated",
-        "Risks": "Consider reputational, operational, financial, or compliance risks associated with this activity",
-        "Risk tolerance ": "Inside or outside your organization's risk tolerance boundaries",
-        "Frequency": "How often the activity is performed (High/Low)",
-        "Specialised Skill": "Whether the activity requires specialized expertise or capabilities",
-        "Similarity with current scopes": "How similar this activity is to your organization's existing operations and capabilities",
-        "Skill capacity": "Whether your organization already has the necessary skills and resources to perform this activity",
-        "Duration ": "The expected timeframe for this activity (Short = temporary or project-based, Long = ongoing or permanent)",
-        "Affordability & Transferable Skill": "Whether your organization can afford to develop or maintain this capability internally",
-        "Strategic fit and Business case": "How well this activity aligns with your organization's long-term strategic objectives",
-        "Outcome": "The recommended sourcing strategy based on all factors",
-        "Timestamp": "Date and time when the decision was made"
-    }
-    
-    # Add header
-    notes_sheet["A1"] = "Field"
-    notes_sheet["B1"] = "Description"
-    notes_sheet["A1"].font = header_font
-    notes_sheet["B1"].font = header_font
-    notes_sheet["A1"].fill = header_fill
-    notes_sheet["B1"].fill = header_fill
+    # Write the workbook in write-only mode to a temporary file
+    output = await run_cpu(_build_export, scored, timestamp, discard=os.remove)
     
-    # Add descriptions
-    row = 2
-    for field, description in field_descriptions.items():
-        notes_sheet[f"A{row}"] = field
-        notes_sheet[f"B{row}"] = description
-        row += 1
-    
-    # Adjust column width
-    notes_sheet.column_dimensions["A"].width = 30
-    notes_sheet.column_dimensions["B"].width = 100
-    
-    # Add a history sheet to record all decisions
-    history_sheet = wb.create_sheet(title="Decision History")
-    
-    # Add headers to history sheet
-    for col_idx, header in enumerate(headers, 1):
-        cell = history_sheet.cell(row=1, column=col_idx, value=headers_dict[header])
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-    
-    # Add current results to history
-    history_row = 2
-    for result in results:
-        for col_idx, header in enumerate(headers, 1):
-            history_sheet.cell(row=history_row, column=col_idx, value=result.get(header, ""))
-        history_row += 1
-    
-    # Auto-adjust column width for history sheet
-    for col in history_sheet.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            if cell.value:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-        adjusted_width = (max_length + 2) * 1.2
-        history_sheet.column_dimensions[column].width = adjusted_width
-    
-    # Save to a BytesIO object
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    # Return the Excel file as a response
+    # Stream the Excel file back in chunks
     return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        _excel().iter_file_chunks(output),
+        media_type=_excel().XLSX_MEDIA_TYPE,
         headers={"Content-Disposition": "attachment; filename=sourcing_decisions.xlsx"}
     )
 
 @router.post("/update-excel")
-async def update_excel(request: DecisionRequest, existing_file: UploadFile = File(...)):
+async def update_excel(request: DecisionRequest = Depends(_form_request), existing_file: UploadFile = File(...),
+                       portfolio_id: Optional[str] = Form(None)):
     """
-    Update an existing Excel file with new decisions without overwriting history
+    Update an existing Excel file with new decisions without overwriting history.
+    Send a multipart form with the DecisionRequest as JSON in the "request" field.
+    With a "portfolio_id" field, only activities that changed since the last
+    update of that portfolio are appended.
+
+    Other sheets of the workbook keep their values, formulas, formatting,
+    column widths and merged cells; charts, images, conditional formatting
+    and data validation on them are dropped.
     """
+    metrics.observe_since_request("update_excel", "validate")
+    source = await run_in_threadpool(_spool_upload, existing_file) if USES_PROCESSES else existing_file.file
     try:
-        # Read the existing Excel file
-        contents = await existing_file.read()
-        existing_wb = openpyxl.load_workbook(io.BytesIO(contents))
-        
-        # Process inputs to determine outcomes
-        results = []
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        for input_data in request.inputs:
-            input_dict = input_data.dict()
-            outcome = determine_outcome(input_dict)
-            
-            # Add outcome and timestamp to the input data
-            input_dict["outcome"] = outcome
-            input_dict["timestamp"] = timestamp
-            results.append(input_dict)
-        
-        # Get the history sheet or create if it doesn't exist
-        if "Decision History" in existing_wb.sheetnames:
-            history_sheet = existing_wb["Decision History"]
-        else:
-            history_sheet = existing_wb.create_sheet(title="Decision History")
-            
-            # Define headers
-            headers = [
-                "activity_name", "activity_type", "business_case", "core", "legal_requirement", 
-                "risks", "risk_tolerance", "frequency", "specialised_skill", 
-                "similarity_with_current_scopes", "skill_capacity", "duration", 
-                "affordability", "strategic_fit", "outcome", "timestamp"
-            ]
-            
-            headers_dict = {
-                "activity_name": "Activity Name", 
-                "activity_type": "Activity Type",
-                "business_case": "Business case",
-                "core": "Core ", 
-                "legal_requirement": "Legal requirement", 
-                "risks": "Risks", 
-                "risk_tolerance": "Risk tolerance ", 
-                "frequency": "Frequency", 
-                "specialised_skill": "Specialised Skill", 
-                "similarity_with_current_scopes": "Similarity with current scopes", 
-                "skill_capacity": "Skill capacity", 
-                "duration": "Duration ", 
-                "affordability": "Affordability & Transferable Skill", 
-                "strategic_fit": "Strategic fit and Business case", 
-                "outcome": "Outcome",
-                "timestamp": "Timestamp"
-            }
-            
-            # Add headers to history sheet
-            header_font = Font(bold=True, color="FFFFFF")
-            header_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
-            
-            for col_idx, header in enumerate(headers, 1):
-                cell = history_sheet.cell(row=1, column=col_idx, value=headers_dict[header])
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Find the last row in the history sheet
-        last_row = history_sheet.max_row
-        if last_row < 1:  # In case there's an empty sheet
-            last_row = 1
-        
-        # Add new results to history
-        headers = [
-            "activity_name", "activity_type", "business_case", "core", "legal_requirement", 
-            "risks", "risk_tolerance", "frequency", "specialised_skill", 
-            "similarity_with_current_scopes", "skill_capacity", "duration", 
-            "affordability", "strategic_fit", "outcome", "timestamp"
-        ]
-        
-        for idx, result in enumerate(results):
-            for col_idx, header in enumerate(headers, 1):
-                history_sheet.cell(row=last_row + 1 + idx, column=col_idx, value=result.get(header, ""))
-        
-        # Update the main sheet with the new results
-        main_sheet = existing_wb["Sourcing Decisions"]
-        
-        # Clear the current data (except headers)
-        for row in range(2, main_sheet.max_row + 1):
-            for col in range(1, main_sheet.max_column + 1):
-                main_sheet.cell(row=row, column=col).value = None
-                main_sheet.cell(row=row, column=col).fill = PatternFill(fill_type=None)
-        
-        # Add the new data
-        for row_idx, result in enumerate(results, 2):
-            for col_idx, header in enumerate(headers, 1):
-                cell = main_sheet.cell(row=row_idx, column=col_idx, value=result.get(header, ""))
-                
-                # Color the outcome cell based on the value
-                if header == "outcome":
-                    if result[header] == "Eliminate":
-                        cell.fill = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
-                    elif result[header] == "Current Outsource":
-                        cell.fill = PatternFill(start_color="CCE5FF", end_color="CCE5FF", fill_type="solid")
-                    elif result[header] == "New Outsource":
-                        cell.fill = PatternFill(start_color="FFFFCC", end_color="FFFFCC", fill_type="solid")
-                    elif result[header] == "Insource or create in-house capacity":
-                        cell.fill = PatternFill(start_color="CCFFCC", end_color="CCFFCC", fill_type="solid")
-                    elif result[header] == "Requires Further Analysis":
-                        cell.fill = PatternFill(start_color="E6E6E6", end_color="E6E6E6", fill_type="solid")
-        
-        # Save the updated workbook
-        output = io.BytesIO()
-        existing_wb.save(output)
-        output.seek(0)
+        # Stream the existing history through into a new write-only workbook
+        output = await run_cpu(_build_update, source, request.inputs, timestamp, portfolio_id, discard=os.remove)
         
         # Return the updated Excel file as a response
         return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            _excel().iter_file_chunks(output),
+            media_type=_excel().XLSX_MEDIA_TYPE,
             headers={"Content-Disposition": f"attachment; filename={existing_file.filename}"}
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error updating Excel file: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error updating Excel file: {str(e)}")
+    finally:
+        if isinstance(source, str):
+            os.remove(source)
+
+
+def _build_history_export(filters: Dict[str, Optional[str]]) -> str:
+    """
+    Write the decision history to a workbook (runs in the worker pool).
+    "Sourcing Decisions" holds the latest decision of each activity and
+    "Decision History" every decision.
+    """
+    excel = _excel()
+    widths = excel.ColumnWidths()
+    widths.observe_lengths(history_store.max_lengths(**filters))
+    return excel.write_export_workbook(
+        history_store.iter_rows(latest=True, **filters), widths,
+        history_rows=history_store.iter_rows(**filters),
+    )
+
+def _query_history(after: Optional[int], limit: int, filters: Dict[str, Optional[str]]) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Read one page of the decision history (runs in the worker pool)
+    """
+    return history_store.query(after=after, limit=limit, **filters)
+
+@router.get("/history")
+async def get_history(activity_name: Optional[str] = None, activity_type: Optional[str] = None,
+                      outcome: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                      after: Optional[int] = None, limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE)):
+    """
+    Page through recorded decisions, oldest first.
+    Filter on activity name, activity type, outcome and a timestamp range
+    ("YYYY-MM-DD HH:MM:SS"; since is inclusive, until exclusive), and pass
+    next_after of a page as after to get the next one.
+    """
+    filters = {"activity_name": activity_name, "activity_type": activity_type,
+               "outcome": outcome, "since": since, "until": until}
+    results, next_after = await run_cpu(_query_history, after, limit, filters)
+    return {"results": results, "next_after": next_after}
+
+def _summarise_history(period: str, filters: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    """
+    Summarise recorded decisions (runs in the worker pool)
+    """
+    with metrics.timer("history_summary", "aggregate"):
+        return summarise_history(history_store.outcome_counts(PERIODS[period], **filters))
+
+@router.get("/history/summary")
+async def get_history_summary(activity_name: Optional[str] = None, activity_type: Optional[str] = None,
+                              outcome: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                              period: Literal["hour", "day", "month"] = "day"):
+    """
+    Count and percentage of each outcome among recorded decisions, overall,
+    by activity type and as a trend per hour, day or month. Takes the same
+    filters as /history.
+    """
+    filters = {"activity_name": activity_name, "activity_type": activity_type,
+               "outcome": outcome, "since": since, "until": until}
+    return await run_cpu(_summarise_history, period, filters)
+
+@router.get("/history/export")
+async def export_history(activity_name: Optional[str] = None, activity_type: Optional[str] = None,
+                         outcome: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None):
+    """
+    Export recorded decisions to an Excel file, without uploading a workbook
+    """
+    filters = {"activity_name": activity_name, "activity_type": activity_type,
+               "outcome": outcome, "since": since, "until": until}
+    output = await run_cpu(_build_history_export, filters, discard=os.remove)
+    
+    return StreamingResponse(
+        _excel().iter_file_chunks(output),
+        media_type=_excel().XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": "attachment; filename=decision_history.xlsx"}
+    )
+
+def _import_file(path: str, kind: str, timestamp: str) -> str:
+    """
+    Score an uploaded portfolio file (runs in the worker pool)
+    """
+    return _importer().score_file(path, kind, timestamp)
+
+@router.post("/import")
+async def import_portfolio(file: UploadFile = File(...)):
+    """
+    Score a whole portfolio uploaded as a CSV or XLSX file.
+    Columns are matched by the headers export_to_excel writes ("Business case",
+    "Core ", ...) or by field name; the file is scored in chunks without
+    building a request object per activity. A CSV comes back as a CSV with
+    Outcome and Timestamp columns, an XLSX as the export_to_excel workbook.
+    """
+    importer = _importer()
+    try:
+        kind = importer.file_kind(file.filename)
+    except importer.PortfolioImportError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    
+    # Copying the upload is blocking file I/O
+    path = await run_in_threadpool(_spool_upload, file, f".{kind}")
+    try:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        output = await run_cpu(_import_file, path, kind, timestamp, discard=os.remove)
+    except importer.PortfolioImportError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    finally:
+        os.remove(path)
+    
+    stem = os.path.splitext(os.path.basename(file.filename))[0]
+    media_type = importer.CSV_MEDIA_TYPE if kind == importer.CSV else _excel().XLSX_MEDIA_TYPE
+    return StreamingResponse(
+        _excel().iter_file_chunks(output),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={stem}_scored.{kind}"}
+    )
+
+
+def _job_response(status: Dict[str, Any]) -> Dict[str, Any]:
+    response = dict(status, status_url=f"/api/decision/jobs/{status['job_id']}")
+    if status["status"] == export_jobs.DONE:
+        response["download_url"] = f"/api/decision/jobs/{status['job_id']}/download"
+    return response
+
+@router.post("/export-excel/jobs", status_code=202)
+async def submit_export_job(request: DecisionRequest):
+    """
+    Queue an Excel export and return its job id straight away.
+    The workbook is built in a worker process; poll the job for progress and
+    download the file once it is done.
+    """
+    metrics.observe_since_request("submit_export_job", "validate")
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    scored = await _scored(await _key(request.inputs), request.inputs, "submit_export_job")
+    rows, widths = await run_cpu(_scored_rows, scored, timestamp, "submit_export_job")
+    
+    status = await run_in_threadpool(export_jobs.submit, rows, widths, "sourcing_decisions.xlsx")
+    return _job_response(status)
+
+@router.post("/update-excel/jobs", status_code=202)
+async def submit_update_job(request: DecisionRequest = Depends(_form_request), existing_file: UploadFile = File(...)):
+    """
+    Queue an update of an existing Excel file and return its job id straight away
+    """
+    metrics.observe_since_request("submit_update_job", "validate")
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows, widths = await run_cpu(_score_rows, request.inputs, timestamp, "submit_update_job")
+    
+    # Copying the upload into the spool directory is blocking file I/O
+    status = await run_in_threadpool(export_jobs.submit, rows, widths, existing_file.filename, upload=existing_file.file)
+    return _job_response(status)
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Return the status and progress of an export job
+    """
+    export_jobs.purge_expired()
+    status = export_jobs.get_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return _job_response(status)
+
+@router.get("/jobs/{job_id}/download")
+async def download_job(job_id: str):
+    """
+    Download the workbook of a finished export job
+    """
+    status = export_jobs.get_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    if status["status"] == export_jobs.FAILED:
+        raise HTTPException(status_code=500, detail=f"Export job failed: {status.get('error')}")
+    if status["status"] != export_jobs.DONE:
+        raise HTTPException(status_code=409, detail=f"Export job is {status['status']}")
+    
+    return FileResponse(
+        export_jobs.result_path(job_id),
+        media_type=_excel().XLSX_MEDIA_TYPE,
+        filename=status["filename"]
+    )